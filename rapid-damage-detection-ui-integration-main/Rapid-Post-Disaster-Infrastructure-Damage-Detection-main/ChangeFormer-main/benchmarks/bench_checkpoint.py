@@ -0,0 +1,65 @@
+"""
+Checkpoint benchmark: how long training is blocked per checkpoint of a
+full CDTrainer state (model, AdamW moments, scheduler), written
+synchronously vs. by the background CheckpointWriter. Between saves the
+benchmark trains for --step_seconds so the writer has time to finish.
+
+Usage (from ChangeFormer-main/):
+    python benchmarks/bench_checkpoint.py --net_G ChangeFormerV6 --saves 5
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch  # noqa: E402
+
+from misc.checkpoint_tool import CheckpointWriter  # noqa: E402
+from models.networks import define_G  # noqa: E402
+
+
+def make_state(args):
+    net = define_G(argparse.Namespace(net_G=args.net_G, embed_dim=64, gpu_ids=[]))
+    optimizer = torch.optim.AdamW(net.parameters(), lr=6e-5)
+    # one step so the optimizer holds its moment buffers
+    for p in net.parameters():
+        p.grad = torch.zeros_like(p)
+    optimizer.step()
+    return {'model_G_state_dict': net.state_dict(), 'optimizer_G_state_dict': optimizer.state_dict()}
+
+
+def run(state, enabled, saves, step_seconds, workdir):
+    writer = CheckpointWriter(enabled=enabled)
+    path = os.path.join(workdir, 'last_ckpt.pt')
+    t0 = time.perf_counter()
+    for _ in range(saves):
+        writer.wait()
+        writer.submit(path, state)
+        time.sleep(step_seconds)  # stands in for the next epoch's training
+    writer.close()
+    return writer.blocked / saves, time.perf_counter() - t0, os.path.getsize(path) / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--net_G', default='ChangeFormerV6')
+    parser.add_argument('--saves', type=int, default=5)
+    parser.add_argument('--step_seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    state = make_state(args)
+    print('%s, %d saves, %.1fs of training between saves' % (args.net_G, args.saves, args.step_seconds))
+    print('%-8s %12s %10s %10s' % ('writer', 'blocked ms', 'wall s', 'file MB'))
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, enabled in (('sync', False), ('async', True)):
+            blocked, wall, size = run(state, enabled, args.saves, args.step_seconds, workdir)
+            print('%-8s %12.1f %10.2f %10.1f' % (name, blocked * 1000, wall, size))
+
+
+if __name__ == '__main__':
+    main()
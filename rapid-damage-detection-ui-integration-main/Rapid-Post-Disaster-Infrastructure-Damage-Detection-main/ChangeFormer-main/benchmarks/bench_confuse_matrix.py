@@ -0,0 +1,102 @@
+"""
+Confusion matrix benchmark: get_confuse_matrix on stacks of N label maps
+against the previous per-image implementation. Before timing it checks that the batched results equal the
+reference: stacks and ragged lists, 255 (ignored) labels, float ground
+truth, per-image matrices, and every chunking.
+
+Usage (from ChangeFormer-main/):
+    python benchmarks/bench_confuse_matrix.py --sizes 64 1024 --img_size 256
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from misc.metric_tool import CHUNK_PIXELS, cm2score, get_confuse_matrix, get_mIoU  # noqa: E402
+
+
+def reference_confuse_matrix(num_classes, label_gts, label_preds):
+    """The per-image implementation get_confuse_matrix replaced"""
+    def __fast_hist(label_gt, label_pred):
+        mask = (label_gt >= 0) & (label_gt < num_classes)
+        hist = np.bincount(num_classes * label_gt[mask].astype(int) + label_pred[mask],
+                           minlength=num_classes**2).reshape(num_classes, num_classes)
+        return hist
+    confusion_matrix = np.zeros((num_classes, num_classes))
+    for lt, lp in zip(label_gts, label_preds):
+        confusion_matrix += __fast_hist(lt.flatten(), lp.flatten())
+    return confusion_matrix
+
+
+def make_stack(n, img_size, n_class, rng):
+    gts = rng.integers(0, n_class, (n, 1, img_size, img_size), dtype=np.uint8)
+    gts[rng.random(gts.shape) < 0.01] = 255
+    preds = rng.integers(0, n_class, (n, img_size, img_size))
+    return gts, preds
+
+
+def check(n_class, rng):
+    gts, preds = make_stack(37, 24, n_class, rng)
+    expected = reference_confuse_matrix(n_class, gts, preds)
+    for chunk_size in (None, 1, 5, 64):
+        cm, per_image = get_confuse_matrix(n_class, gts, preds, per_image=True, chunk_size=chunk_size)
+        assert cm.dtype == np.float64 and np.array_equal(cm, expected), chunk_size
+        for i in (0, 17, 36):
+            assert np.array_equal(per_image[i], reference_confuse_matrix(n_class, gts[i:i + 1], preds[i:i + 1]))
+    assert np.array_equal(get_confuse_matrix(n_class, list(gts), list(preds)), expected)
+    assert np.array_equal(get_confuse_matrix(n_class, gts.astype(np.float32), preds), expected)
+    assert get_mIoU(n_class, gts, preds) == cm2score(expected)['miou']
+    # images of different sizes
+    ragged_gts = [gts[0, 0], gts[1, 0, :10], gts[2, 0, :, :7]]
+    ragged_preds = [preds[0], preds[1, :10], preds[2, :, :7]]
+    assert np.array_equal(get_confuse_matrix(n_class, ragged_gts, ragged_preds),
+                          reference_confuse_matrix(n_class, ragged_gts, ragged_preds))
+    assert np.array_equal(get_confuse_matrix(n_class, gts[:0], preds[:0]), np.zeros((n_class, n_class)))
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1024])
+    parser.add_argument('--img_size', type=int, default=256)
+    parser.add_argument('--n_class', type=int, default=2)
+    parser.add_argument('--chunk_size', type=int, default=None,
+                        help='images per pass (default: about metric_tool.CHUNK_PIXELS pixels)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n_class in sorted({2, 3, args.n_class}):
+        check(n_class, rng)
+    print('batched results equal the per-image reference')
+
+    chunks = '%d images' % args.chunk_size if args.chunk_size else '~%d pixels' % CHUNK_PIXELS
+    print('%d classes, %dpx images, chunks of %s' % (args.n_class, args.img_size, chunks))
+    print('%8s %-14s %10s %10s %9s' % ('images', 'method', 'seconds', 'Mpx/s', 'speedup'))
+    for n in args.sizes:
+        gts, preds = make_stack(n, args.img_size, args.n_class, rng)
+        pixels = gts.size / 1e6
+        base = best_of(args.repeat, lambda: reference_confuse_matrix(args.n_class, gts, preds))
+        print('%8d %-14s %10.3f %10.1f %9s' % (n, 'per-image', base, pixels / base, '1.0x'))
+        t = best_of(args.repeat, lambda: get_confuse_matrix(args.n_class, gts, preds, chunk_size=args.chunk_size))
+        print('%8d %-14s %10.3f %10.1f %8.1fx' % (n, 'batched', t, pixels / t, base / t))
+        t = best_of(args.repeat, lambda: get_confuse_matrix(args.n_class, gts, preds, per_image=True,
+                                                            chunk_size=args.chunk_size))
+        print('%8d %-14s %10.3f %10.1f %8.1fx' % (n, 'per_image', t, pixels / t, base / t))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Dataset benchmark: samples/sec of CDDataset (decodes PNGs every epoch)
+vs CDShardDataset (memory-mapped shard cache), for the training
+(augmented) and validation transforms. It writes a synthetic dataset in
+the repo's A/B/label/list layout, builds its shard cache, checks that
+both datasets return identical validation samples, then times a pass
+of a DataLoader over each.
+
+Usage (from ChangeFormer-main/):
+    python benchmarks/bench_dataset.py --n 512 --img_size 256 --num_workers 0 2
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+from PIL import Image  # noqa: E402
+from torch.utils.data import DataLoader  # noqa: E402
+
+from datasets.CD_dataset import (ANNOT_FOLDER_NAME, IMG_FOLDER_NAME, IMG_POST_FOLDER_NAME,  # noqa: E402
+                                 LIST_FOLDER_NAME, CDDataset, CDShardDataset, build_shard_cache)
+from datasets.data_utils import to_tensor_and_norm  # noqa: E402
+
+DATASETS = {'CDDataset': CDDataset, 'CDShardDataset': CDShardDataset}
+
+
+def make_dataset(root_dir, n, img_size, rng):
+    for folder in (IMG_FOLDER_NAME, IMG_POST_FOLDER_NAME, ANNOT_FOLDER_NAME, LIST_FOLDER_NAME):
+        os.makedirs(os.path.join(root_dir, folder), exist_ok=True)
+    names = ['bench_%05d.png' % i for i in range(n)]
+    for name in names:
+        # smooth noise compresses like aerial imagery better than white noise
+        small = rng.integers(0, 256, (img_size // 8, img_size // 8, 3), dtype=np.uint8)
+        for folder in (IMG_FOLDER_NAME, IMG_POST_FOLDER_NAME):
+            Image.fromarray(small).resize((img_size, img_size), Image.BICUBIC).save(
+                os.path.join(root_dir, folder, name))
+        label = np.zeros((img_size, img_size), np.uint8)
+        y, x = rng.integers(0, img_size // 2, 2)
+        label[y:y + img_size // 4, x:x + img_size // 4] = 255
+        Image.fromarray(label).save(os.path.join(root_dir, ANNOT_FOLDER_NAME, name))
+    with open(os.path.join(root_dir, LIST_FOLDER_NAME, 'train.txt'), 'w') as f:
+        f.write('\n'.join(names) + '\n')
+
+
+def check(root_dir, img_size):
+    kwargs = dict(img_size=img_size, split='train', is_train=False, label_transform='norm')
+    reference, cached = CDDataset(root_dir, **kwargs), CDShardDataset(root_dir, **kwargs)
+    assert len(reference) == len(cached)
+    for i in range(min(len(reference), 8)):
+        a, b = reference[i], cached[i]
+        assert a['name'] == b['name']
+        for key in ('A', 'B', 'L'):
+            assert a[key].dtype == b[key].dtype and torch.equal(a[key], b[key]), (i, key)
+        # the no-augmentation fast path matches the PIL path it skips
+        sample = cached.shards[i]
+        imgs, labels = to_tensor_and_norm([Image.fromarray(np.array(sample[k])) for k in ('A', 'B')],
+                                          [Image.fromarray(np.array(sample['L']))])
+        for x, y in zip(imgs + labels, (b['A'], b['B'], b['L'])):
+            assert x.dtype == y.dtype and torch.equal(x, y), i
+
+
+def samples_per_second(dataset, batch_size, num_workers):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    t0 = time.perf_counter()
+    for _ in loader:
+        pass
+    return len(dataset) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--n', type=int, default=512)
+    parser.add_argument('--img_size', type=int, default=256)
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--num_workers', type=int, nargs='+', default=[0])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root_dir:
+        make_dataset(root_dir, args.n, args.img_size, np.random.default_rng(args.seed))
+        t0 = time.perf_counter()
+        build_shard_cache(root_dir, 'train', label_transform='norm')
+        print('%d samples of %dpx; shard cache built in %.1fs' % (args.n, args.img_size, time.perf_counter() - t0))
+        check(root_dir, args.img_size)
+        print('validation samples identical')
+
+        print('%-16s %-6s %8s %10s' % ('dataset', 'split', 'workers', 'samples/s'))
+        for is_train in (True, False):
+            for num_workers in args.num_workers:
+                for name, cls in DATASETS.items():
+                    dataset = cls(root_dir, img_size=args.img_size, split='train', is_train=is_train,
+                                  label_transform='norm')
+                    rate = samples_per_second(dataset, args.batch_size, num_workers)
+                    print('%-16s %-6s %8d %10.1f' % (name, 'train' if is_train else 'val', num_workers, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Metric benchmark: time per batch of the confusion-matrix meters used in
+training and evaluation, on random predictions and labels (with some
+ignored 255 pixels). Before timing, it checks that every meter's scores
+match ConfuseMatrixMeter's, the per-sample numpy reference.
+
+Usage (from ChangeFormer-main/):
+    python benchmarks/bench_metric.py --batch_size 8 --img_size 256 --batches 50
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+
+from misc.metric_tool import ConfuseMatrixMeter, TensorConfuseMatrixMeter  # noqa: E402
+
+
+def make_batches(n, batch_size, img_size, n_class, device):
+    g = torch.Generator().manual_seed(0)
+    batches = []
+    for _ in range(n):
+        gt = torch.randint(0, n_class, (batch_size, 1, img_size, img_size), generator=g, dtype=torch.uint8)
+        gt[torch.rand(gt.shape, generator=g) < 0.01] = 255
+        pr = torch.randint(0, n_class, (batch_size, img_size, img_size), generator=g)
+        batches.append((pr.to(device), gt.to(device)))
+    return batches
+
+
+def numpy_meter(n_class):
+    meter = ConfuseMatrixMeter(n_class=n_class)
+    return meter, lambda pr, gt: meter.update_cm(pr=pr.cpu().numpy(), gt=gt.cpu().numpy())
+
+
+def tensor_meter(n_class):
+    meter = TensorConfuseMatrixMeter(n_class=n_class)
+    return meter, lambda pr, gt: meter.update_cm(pr=pr, gt=gt)
+
+
+METERS = {'numpy': numpy_meter, 'tensor': tensor_meter}
+
+
+def run(make_meter, batches, n_class, device):
+    meter, update = make_meter(n_class)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    t0 = time.perf_counter()
+    for pr, gt in batches:
+        update(pr, gt)
+    scores = meter.get_scores()  # the one host sync per epoch
+    return (time.perf_counter() - t0) / len(batches), scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--img_size', type=int, default=256)
+    parser.add_argument('--batches', type=int, default=50)
+    parser.add_argument('--n_class', type=int, default=2)
+    parser.add_argument('--meters', nargs='+', default=list(METERS), choices=list(METERS))
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    batches = make_batches(args.batches, args.batch_size, args.img_size, args.n_class, device)
+    _, reference = run(numpy_meter, batches[:2], args.n_class, device)
+    for name in args.meters:
+        _, scores = run(METERS[name], batches[:2], args.n_class, device)
+        for k, v in reference.items():
+            assert np.isclose(scores[k], v, rtol=0, atol=1e-12), (name, k, scores[k], v)
+
+    print('batch %d x %dpx, %d classes, %s; scores match' % (args.batch_size, args.img_size, args.n_class, device))
+    print('%-10s %10s %12s' % ('meter', 'ms/batch', 'Mpixels/s'))
+    for name in args.meters:
+        elapsed, _ = run(METERS[name], batches, args.n_class, device)
+        print('%-10s %10.2f %12.1f' % (name, elapsed * 1000, args.batch_size * args.img_size ** 2 / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
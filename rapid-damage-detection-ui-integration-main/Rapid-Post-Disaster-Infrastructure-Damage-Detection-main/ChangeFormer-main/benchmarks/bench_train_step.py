@@ -0,0 +1,143 @@
+"""
+Training step benchmark: time per CDTrainer optimizer step and peak
+memory, on synthetic image pairs, for each training option given.
+Each configuration runs in a fresh process so its peak memory (RSS on
+CPU, allocated memory on GPU) can be measured.
+
+Usage (from ChangeFormer-main/):
+    python benchmarks/bench_train_step.py --net_G ChangeFormerV6 --img_size 256 --batch_size 4 \
+        --configs fp32 amp
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch  # noqa: E402
+from torch.utils.data import DataLoader, Dataset  # noqa: E402
+
+# name -> trainer options that differ from the defaults below
+CONFIGS = {
+    'fp32': {},
+    'amp': {'use_amp': 'True'},
+    # same samples per optimizer step as --batch_size, one at a time
+    'accum': {'gradient_accumulation_steps': None},
+    'ema': {'use_ema': 'True'},
+}
+
+
+class SyntheticCD(Dataset):
+    """Random image pairs with a blob of change, shaped like CDDataset samples"""
+
+    def __init__(self, n, img_size):
+        self.n = n
+        self.img_size = img_size
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        g = torch.Generator().manual_seed(index)
+        s = self.img_size
+        label = torch.zeros(1, s, s, dtype=torch.uint8)
+        y, x = torch.randint(0, s // 2, (2,), generator=g).tolist()
+        label[:, y:y + s // 4, x:x + s // 4] = 1
+        return {'name': str(index), 'A': torch.rand(3, s, s, generator=g) * 2 - 1,
+                'B': torch.rand(3, s, s, generator=g) * 2 - 1, 'L': label}
+
+
+def make_args(options, workdir):
+    args = argparse.Namespace(
+        gpu_ids=[0] if torch.cuda.is_available() else [], project_name='bench',
+        checkpoint_dir=os.path.join(workdir, 'checkpoints'), vis_dir=os.path.join(workdir, 'vis'),
+        n_class=2, embed_dim=64, pretrain=None, net_G='ChangeFormerV6', loss='ce',
+        multi_scale_train='True', multi_scale_infer='False', multi_pred_weights=[0.5, 0.5, 0.5, 0.8, 1.0],
+        optimizer='adamw', lr=6e-5, max_epochs=200, lr_policy='linear', shuffle_AB=False,
+        batch_size=4, img_size=256, use_amp='False', amp_dtype='auto',
+        gradient_accumulation_steps=1, auto_batch_size='False', effective_batch_size=0, memory_budget_mb=0,
+        val_frequency=1, save_frequency=1, early_stopping_patience=0, use_ema='False', ema_decay=0.999,
+        async_checkpoint='True',
+    )
+    for key, value in options.items():
+        setattr(args, key, value)
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    os.makedirs(args.vis_dir, exist_ok=True)
+    return args
+
+
+def measure(options, steps, warmup, results):
+    from models.trainer import CDTrainer
+
+    torch.manual_seed(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        args = make_args(options, workdir)
+        data = SyntheticCD((steps + warmup) * args.batch_size * args.gradient_accumulation_steps, args.img_size)
+        loaders = {x: DataLoader(data, batch_size=args.batch_size) for x in ('train', 'val')}
+        trainer = CDTrainer(args=args, dataloaders=loaders)
+        trainer.net_G.train()
+        batches = list(loaders['train'])
+
+        accum = trainer.accum_steps
+        for batch in batches[:warmup * accum]:
+            trainer._train_step(batch, update=True)
+        cuda = trainer.device.type == 'cuda'
+        if cuda:
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        t0 = time.perf_counter()
+        for i, batch in enumerate(batches[warmup * accum:]):
+            trainer._train_step(batch, update=(i + 1) % accum == 0, loss_scale=1.0 / accum)
+        if cuda:
+            torch.cuda.synchronize()
+        elapsed = (time.perf_counter() - t0) / steps
+        if cuda:
+            peak = torch.cuda.max_memory_allocated() / 2 ** 20
+        else:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+        results.put((elapsed, peak, trainer.G_loss.item()))
+
+
+def run(*args):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=args + (results,))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise SystemExit('benchmark process failed')
+    return results.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument('--net_G', default='ChangeFormerV6')
+    parser.add_argument('--loss', default='ce')
+    parser.add_argument('--multi_scale_train', default='True')
+    parser.add_argument('--img_size', type=int, default=256)
+    parser.add_argument('--batch_size', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    args = parser.parse_args()
+
+    common = {'net_G': args.net_G, 'loss': args.loss, 'multi_scale_train': args.multi_scale_train,
+              'img_size': args.img_size, 'batch_size': args.batch_size}
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    print('%s, batch %d x %dpx, %s loss, %s' % (args.net_G, args.batch_size, args.img_size, args.loss, device))
+    print('%-12s %10s %10s %10s' % ('config', 'ms/step', 'peak MB', 'loss'))
+    for name in args.configs:
+        options = dict(common, **CONFIGS[name])
+        if options.get('gradient_accumulation_steps', 1) is None:
+            options.update(batch_size=1, gradient_accumulation_steps=args.batch_size)
+        elapsed, peak, loss = run(options, args.steps, args.warmup)
+        print('%-12s %10.1f %10.1f %10.4f' % (name, elapsed * 1000, peak, loss))
+
+
+if __name__ == '__main__':
+    main()
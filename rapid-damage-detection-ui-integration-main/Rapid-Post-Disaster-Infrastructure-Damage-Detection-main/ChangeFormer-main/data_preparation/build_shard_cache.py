@@ -0,0 +1,33 @@
+"""
+Decode a dataset's splits once into the uint8 shard cache read by
+--dataset CDShardDataset (by default <root_dir>/shards/<split>/).
+Rebuild it whenever the images or the split lists change.
+
+Usage (from ChangeFormer-main/):
+    python data_preparation/build_shard_cache.py --data_name LEVIR --splits train val test
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import data_config  # noqa: E402
+from datasets.CD_dataset import build_shard_cache  # noqa: E402
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--data_name', default='LEVIR', type=str)
+    parser.add_argument('--splits', nargs='+', default=['train', 'val', 'test'])
+    parser.add_argument('--shard_size', default=1024, type=int, help='samples per shard file')
+    args = parser.parse_args()
+
+    dataConfig = data_config.DataConfig().get_data_config(args.data_name)
+    for split in args.splits:
+        t0 = time.perf_counter()
+        shard_dir = build_shard_cache(dataConfig.root_dir, split, label_transform=dataConfig.label_transform,
+                                      shard_size=args.shard_size)
+        print('%s: %s (%.1fs)' % (split, shard_dir, time.perf_counter() - t0))
@@ -9,6 +9,7 @@ import numpy as np
 from torch.utils import data
 
 from datasets.data_utils import CDDataAugmentation
+from datasets.shard_cache import ShardReader, get_shard_dir, write_shards
 
 
 """
@@ -28,7 +29,7 @@ IGNORE = 255
 label_suffix='.png' # jpg for gan dataset, others : png
 
 def load_img_name_list(dataset_path):
-    img_name_list = np.loadtxt(dataset_path, dtype=np.str)
+    img_name_list = np.loadtxt(dataset_path, dtype=str)
     if img_name_list.ndim == 2:
         return img_name_list[:, 0]
     return img_name_list
@@ -51,6 +52,29 @@ def get_label_path(root_dir, img_name):
     return os.path.join(root_dir, ANNOT_FOLDER_NAME, img_name.replace('.jpg', label_suffix))
 
 
+def load_cd_sample(root_dir, img_name, label_transform=None):
+    """Decode the t1, t2 images and the label map of one sample to uint8 arrays"""
+    img = np.asarray(Image.open(get_img_path(root_dir, img_name)).convert('RGB'))
+    img_B = np.asarray(Image.open(get_img_post_path(root_dir, img_name)).convert('RGB'))
+    label = np.array(Image.open(get_label_path(root_dir, img_name)), dtype=np.uint8)
+    # if you are getting error because of dim mismatch ad [:,:,0] at the end
+
+    #  二分类中，前景标注为255
+    if label_transform == 'norm':
+        label = label // 255
+    return img, img_B, label
+
+
+def build_shard_cache(root_dir, split, label_transform=None, shard_dir=None, shard_size=1024):
+    """Decode every sample of a split once into the shard cache read by CDShardDataset"""
+    shard_dir = shard_dir or get_shard_dir(root_dir, split)
+    names = load_img_name_list(os.path.join(root_dir, LIST_FOLDER_NAME, split + '.txt'))
+    samples = (dict(zip(('A', 'B', 'L'), load_cd_sample(root_dir, name, label_transform))) for name in names)
+    write_shards(shard_dir, names, samples, shard_size=shard_size,
+                 meta={'split': split, 'label_transform': label_transform})
+    return shard_dir
+
+
 class ImageDataset(data.Dataset):
     """VOCdataloder"""
     def __init__(self, root_dir, split='train', img_size=256, is_train=True,to_tensor=True):
@@ -104,21 +128,37 @@ class CDDataset(ImageDataset):
 
     def __getitem__(self, index):
         name = self.img_name_list[index]
-        A_path = get_img_path(self.root_dir, self.img_name_list[index % self.A_size])
-        B_path = get_img_post_path(self.root_dir, self.img_name_list[index % self.A_size])
-        img = np.asarray(Image.open(A_path).convert('RGB'))
-        img_B = np.asarray(Image.open(B_path).convert('RGB'))
-        L_path = get_label_path(self.root_dir, self.img_name_list[index % self.A_size])
+        img, img_B, label = load_cd_sample(self.root_dir, self.img_name_list[index % self.A_size],
+                                           self.label_transform)
 
-        label = np.array(Image.open(L_path), dtype=np.uint8)
-        # if you are getting error because of dim mismatch ad [:,:,0] at the end
-
-        #  二分类中，前景标注为255
-        if self.label_transform == 'norm':
-            label = label // 255
-        
         [img, img_B], [label] = self.augm.transform([img, img_B], [label], to_tensor=self.to_tensor)
         # print(label.max())
         
         return {'name': name, 'A': img, 'B': img_B, 'L': label}
 
+
+class CDShardDataset(CDDataset):
+    """
+    CDDataset that reads pre-decoded samples from the split's shard cache
+    (build_shard_cache) instead of decoding three images per sample.
+    """
+
+    def __init__(self, root_dir, img_size, split='train', is_train=True, label_transform=None,
+                 to_tensor=True, shard_dir=None):
+        super(CDShardDataset, self).__init__(root_dir, img_size=img_size, split=split, is_train=is_train,
+                                             label_transform=label_transform, to_tensor=to_tensor)
+        self.shards = ShardReader(shard_dir or get_shard_dir(root_dir, split))
+        if list(self.shards.names) != list(self.img_name_list) or \
+                self.shards.meta.get('label_transform') != label_transform:
+            raise ValueError('shard cache %s is stale for split %s; rebuild it with '
+                             'data_preparation/build_shard_cache.py' % (self.shards.shard_dir, split))
+
+    def __getitem__(self, index):
+        name = self.img_name_list[index]
+        sample = self.shards[index % self.A_size]
+
+        [img, img_B], [label] = self.augm.transform([sample['A'], sample['B']], [sample['L']],
+                                                    to_tensor=self.to_tensor)
+
+        return {'name': name, 'A': img, 'B': img_B, 'L': label}
+
@@ -51,6 +51,10 @@ class CDDataAugmentation:
         :param labels: [ndarray,]
         :return: [ndarray,],[ndarray,]
         """
+        if to_tensor and self._is_identity(imgs, labels):
+            # nothing to resize or augment: skip the round trip through PIL
+            return array_to_tensor_and_norm(imgs, labels)
+
         # resize image and covert to tensor
         imgs = [TF.to_pil_image(img) for img in imgs]
         if self.img_size is None:
@@ -143,6 +147,29 @@ class CDDataAugmentation:
         return imgs, labels
 
 
+    def _is_identity(self, imgs, labels):
+        """True if transform() would only convert these uint8 arrays to tensors"""
+        if self.img_size_dynamic or self.with_random_hflip or self.with_random_vflip or \
+                self.with_random_rot or self.with_random_crop or self.with_scale_random_crop or \
+                self.with_random_blur or self.random_color_tf:
+            return False
+        return all(isinstance(img, np.ndarray) and img.dtype == np.uint8 and
+                   img.shape[:2] == (self.img_size, self.img_size) for img in imgs + labels) and \
+            all(img.ndim == 3 and img.shape[2] == 3 for img in imgs)
+
+
+def array_to_tensor_and_norm(imgs, labels):
+    """to_tensor_and_norm for HxWx3 uint8 image and HxW label arrays, without PIL"""
+    # torch.tensor copies, so read-only (memory-mapped) arrays are fine
+    imgs = [torch.tensor(img).permute(2, 0, 1).contiguous().to(torch.get_default_dtype()).div(255)
+            for img in imgs]
+    labels = [torch.tensor(img).unsqueeze(dim=0) for img in labels]
+
+    imgs = [TF.normalize(img, mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+            for img in imgs]
+    return imgs, labels
+
+
 def pil_crop(image, box, cropsize, default_value):
     assert isinstance(image, Image.Image)
     img = np.array(image)
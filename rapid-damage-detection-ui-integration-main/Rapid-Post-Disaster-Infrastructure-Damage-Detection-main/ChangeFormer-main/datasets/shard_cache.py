@@ -0,0 +1,111 @@
+"""
+Pre-decoded sample cache: each field (A, B, L) of a split is stored as
+contiguous uint8 .npy shards of shard_size samples, plus an index.json
+with the sample names, so a dataset can map the shards and read samples
+without decoding any image.
+
+shard_dir
+├─index.json
+├─A_00000.npy
+├─B_00000.npy
+├─L_00000.npy
+└─...
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+SHARD_FOLDER_NAME = 'shards'
+INDEX_FILE_NAME = 'index.json'
+
+
+def get_shard_dir(root_dir, split):
+    return os.path.join(root_dir, SHARD_FOLDER_NAME, split)
+
+
+def get_shard_path(shard_dir, field, shard_id):
+    return os.path.join(shard_dir, '%s_%05d.npy' % (field, shard_id))
+
+
+def write_shards(shard_dir, names, samples, shard_size=1024, meta=None):
+    """
+    Write samples (an iterable of {field: uint8 ndarray}, one per name) to shard_dir.
+    Every sample must have the same fields and shapes. The shards are built in
+    shard_dir + '.tmp' and renamed into place once the index is written, so an
+    interrupted run never leaves a cache that looks complete.
+    """
+    tmp_dir = shard_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    n = len(names)
+    shapes = None
+    arrays = {}
+    for i, sample in enumerate(samples):
+        shard_id, offset = divmod(i, shard_size)
+        if shapes is None:
+            shapes = {field: list(np.shape(value)) for field, value in sample.items()}
+        for field, value in sample.items():
+            if list(np.shape(value)) != shapes[field]:
+                raise ValueError('%s of %s has shape %s, expected %s (all samples of a split must match)'
+                                 % (field, names[i], np.shape(value), shapes[field]))
+        if offset == 0:
+            for array in arrays.values():
+                array.flush()
+            count = min(shard_size, n - i)
+            arrays = {field: np.lib.format.open_memmap(get_shard_path(tmp_dir, field, shard_id), mode='w+',
+                                                       dtype=np.uint8, shape=tuple([count] + shape))
+                      for field, shape in shapes.items()}
+        for field, value in sample.items():
+            arrays[field][offset] = value
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    index = {'names': list(names), 'shard_size': shard_size, 'shapes': shapes or {}, 'meta': meta or {}}
+    with open(os.path.join(tmp_dir, INDEX_FILE_NAME), 'w') as f:
+        json.dump(index, f)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    os.replace(tmp_dir, shard_dir)
+
+
+class ShardReader:
+    """
+    Read-only view of a shard_dir written by write_shards. reader[i] returns
+    {field: ndarray} views into the memory-mapped shards (no copy). Shards are
+    mapped on first use, in each DataLoader worker, and never pickled.
+    """
+
+    def __init__(self, shard_dir):
+        index_path = os.path.join(shard_dir, INDEX_FILE_NAME)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError('no shard cache at %s (build it with data_preparation/build_shard_cache.py)'
+                                    % shard_dir)
+        with open(index_path) as f:
+            index = json.load(f)
+        self.shard_dir = shard_dir
+        self.names = index['names']
+        self.shard_size = index['shard_size']
+        self.fields = list(index['shapes'])
+        self.meta = index['meta']
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        shard_id, offset = divmod(index, self.shard_size)
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            shard = {field: np.load(get_shard_path(self.shard_dir, field, shard_id), mmap_mode='r')
+                     for field in self.fields}
+            self._shards[shard_id] = shard
+        return {field: array[offset] for field, array in shard.items()}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
@@ -22,7 +22,9 @@ def main():
 
     # data
     parser.add_argument('--num_workers', default=8, type=int)
-    parser.add_argument('--dataset', default='CDDataset', type=str)
+    parser.add_argument('--dataset', default='CDDataset', type=str,
+                        help='CDDataset | CDShardDataset (reads the shard cache built by '
+                             'data_preparation/build_shard_cache.py)')
     parser.add_argument('--data_name', default='LEVIR', type=str)
 
     parser.add_argument('--batch_size', default=1, type=int)
@@ -51,7 +53,7 @@ def main():
 
     dataloader = utils.get_loader(args.data_name, img_size=args.img_size,
                                   batch_size=args.batch_size, is_train=False,
-                                  split=args.split)
+                                  split=args.split, dataset=args.dataset)
     model = CDEvaluator(args=args, dataloader=dataloader)
 
     model.eval_models(checkpoint_name=args.checkpoint_name)
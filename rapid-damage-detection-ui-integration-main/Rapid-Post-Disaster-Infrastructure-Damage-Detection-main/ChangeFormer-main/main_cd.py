@@ -20,7 +20,7 @@ def test(args):
     from models.evaluator import CDEvaluator
     dataloader = utils.get_loader(args.data_name, img_size=args.img_size,
                                   batch_size=args.batch_size, is_train=False,
-                                  split='test')
+                                  split='test', dataset=args.dataset)
     model = CDEvaluator(args=args, dataloader=dataloader)
 
     model.eval_models()
@@ -38,7 +38,9 @@ if __name__ == '__main__':
 
     # data
     parser.add_argument('--num_workers', default=2, type=int)
-    parser.add_argument('--dataset', default='CDDataset', type=str)
+    parser.add_argument('--dataset', default='CDDataset', type=str,
+                        help='CDDataset | CDShardDataset (reads the shard cache built by '
+                             'data_preparation/build_shard_cache.py)')
     parser.add_argument('--data_name', default='LEVIR', type=str)
 
     parser.add_argument('--batch_size', default=8, type=int)
@@ -71,14 +73,25 @@ if __name__ == '__main__':
     parser.add_argument('--lr_decay_iters', default=100, type=int)
     
     # Training enhancements
-    parser.add_argument('--use_amp', default=False, type=bool,
-                        help='Use Automatic Mixed Precision (AMP) for faster training')
+    parser.add_argument('--use_amp', default=False, type=str,
+                        help='Use Automatic Mixed Precision (AMP) for faster training: True | False')
+    parser.add_argument('--amp_dtype', default='auto', type=str,
+                        help='autocast dtype: bf16 | fp16 | auto (fp16 on GPU, bf16 on CPU)')
     parser.add_argument('--gradient_accumulation_steps', default=1, type=int,
                         help='Number of gradient accumulation steps for larger effective batch size')
+    parser.add_argument('--auto_batch_size', default=False, type=str,
+                        help='Probe the largest micro-batch that fits --memory_budget_mb and derive the '
+                             'accumulation steps from --effective_batch_size: True | False')
+    parser.add_argument('--effective_batch_size', default=0, type=int,
+                        help='Samples per optimizer step with --auto_batch_size '
+                             '(0: batch_size * gradient_accumulation_steps)')
+    parser.add_argument('--memory_budget_mb', default=0, type=float,
+                        help='Memory budget for --auto_batch_size (0: 90%% of the GPU, or 80%% of free RAM on CPU)')
     parser.add_argument('--early_stopping_patience', default=50, type=int,
-                        help='Patience for early stopping (0 to disable)')
-    parser.add_argument('--use_ema', default=False, type=bool,
-                        help='Use Exponential Moving Average (EMA) for model weights')
+                        help='Stop after this many validations without a better score (0 to disable)')
+    parser.add_argument('--use_ema', default=False, type=str,
+                        help='Keep an Exponential Moving Average (EMA) of the weights and use it for '
+                             'validation and best_ckpt.pt: True | False')
     parser.add_argument('--ema_decay', default=0.999, type=float,
                         help='EMA decay rate')
     parser.add_argument('--gradient_clip', default=0.0, type=float,
@@ -86,9 +99,12 @@ if __name__ == '__main__':
     parser.add_argument('--warmup_epochs', default=0, type=int,
                         help='Number of warmup epochs')
     parser.add_argument('--val_frequency', default=1, type=int,
-                        help='Run validation every N epochs')
+                        help='Run validation every N epochs (and after the last)')
     parser.add_argument('--save_frequency', default=5, type=int,
-                        help='Save checkpoint every N epochs')
+                        help='Save last_ckpt.pt every N epochs (and after the last); best_ckpt.pt '
+                             'is saved whenever validation improves')
+    parser.add_argument('--async_checkpoint', default='True', type=str,
+                        help='Write checkpoints on a background thread (atomic rename): True | False')
 
     args = parser.parse_args()
     utils.get_device(args)
@@ -0,0 +1,81 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+
+def to_cpu(obj):
+    """Copy of a (nested) state dict with every tensor detached and copied to CPU memory"""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {k: to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(v) for v in obj)
+    return obj
+
+
+def save_npy(array, f):
+    """np.save with torch.save's (obj, file) argument order"""
+    np.save(f, array)
+
+
+def atomic_save(obj, path, save=torch.save):
+    """save(obj, file) to a temporary file next to path, then rename it into place"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class CheckpointWriter:
+    """
+    Writes checkpoints and curves on a background thread. submit() copies
+    the state to CPU memory and returns; the worker writes each file with
+    atomic_save, so a crash mid-write never leaves a truncated checkpoint.
+    wait() blocks until everything submitted so far is on disk and
+    re-raises a failed write. With enabled=False writes happen in submit().
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._pool = ThreadPoolExecutor(1, thread_name_prefix='checkpoint') if enabled else None
+        self._pending = []
+        # seconds the caller spent snapshotting and waiting
+        self.blocked = 0.0
+
+    def submit(self, paths, obj, save=torch.save):
+        """Write obj to one path or a list of paths (one snapshot for all)"""
+        t0 = time.perf_counter()
+        paths = [paths] if isinstance(paths, str) else list(paths)
+        if self.enabled:
+            self._pending.append(self._pool.submit(self._write, paths, to_cpu(obj), save))
+        else:
+            self._write(paths, obj, save)
+        self.blocked += time.perf_counter() - t0
+
+    @staticmethod
+    def _write(paths, obj, save):
+        for path in paths:
+            atomic_save(obj, path, save)
+
+    def wait(self):
+        t0 = time.perf_counter()
+        pending, self._pending = self._pending, []
+        try:
+            for future in pending:
+                future.result()
+        finally:
+            self.blocked += time.perf_counter() - t0
+
+    def close(self):
+        self.wait()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
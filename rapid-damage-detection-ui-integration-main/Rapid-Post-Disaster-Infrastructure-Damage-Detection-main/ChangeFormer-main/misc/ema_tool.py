@@ -0,0 +1,69 @@
+import contextlib
+
+import torch
+
+
+class ModelEMA:
+    """
+    Exponential moving average of a model's parameters and float buffers
+    (BatchNorm statistics). The average lives next to the weights on their
+    device and is updated in place by one foreach lerp per step. swapped()
+    exchanges it with the live weights for evaluation or saving by
+    swapping tensor storage, so nothing is copied or rebuilt.
+    Create it after the model is on its device.
+    """
+
+    def __init__(self, model, decay=0.999, warmup=True):
+        self.decay = decay
+        # ramp the decay up over the first updates: (1 + n) / (10 + n)
+        self.warmup = warmup
+        self.updates = 0
+        self.applied = False
+        named = list(model.named_parameters()) + \
+            [(name, b) for name, b in model.named_buffers() if b.is_floating_point()]
+        self.names = [name for name, _ in named]
+        self.live = [t for _, t in named]
+        self.shadow = [t.detach().clone() for t in self.live]
+
+    @torch.no_grad()
+    def reset(self):
+        """Restart the average from the current weights (e.g. after loading them)"""
+        self.updates = 0
+        torch._foreach_copy_(self.shadow, self.live)
+
+    def get_decay(self):
+        if self.warmup:
+            return min(self.decay, (1 + self.updates) / (10 + self.updates))
+        return self.decay
+
+    @torch.no_grad()
+    def update(self):
+        """Move the average towards the current weights (call after each optimizer step)"""
+        assert not self.applied, 'update() inside swapped()'
+        self.updates += 1
+        torch._foreach_lerp_(self.shadow, self.live, 1.0 - self.get_decay())
+
+    def _swap(self):
+        for i, t in enumerate(self.live):
+            t.data, self.shadow[i] = self.shadow[i], t.data
+
+    @contextlib.contextmanager
+    def swapped(self):
+        """Inside the block the model holds the averaged weights"""
+        self._swap()
+        self.applied = True
+        try:
+            yield
+        finally:
+            self._swap()
+            self.applied = False
+
+    def state_dict(self):
+        return {'decay': self.decay, 'updates': self.updates,
+                'shadow': dict(zip(self.names, self.shadow))}
+
+    @torch.no_grad()
+    def load_state_dict(self, state):
+        self.updates = state['updates']
+        for name, t in zip(self.names, self.shadow):
+            t.copy_(state['shadow'][name])
@@ -1,4 +1,6 @@
+
 import numpy as np
+import torch
 
 
 ###################       metrics      ###################
@@ -63,6 +65,26 @@ class ConfuseMatrixMeter(AverageMeter):
         return scores_dict
 
 
+class TensorConfuseMatrixMeter(ConfuseMatrixMeter):
+    """
+    ConfuseMatrixMeter for torch tensors. The confusion matrix is
+    accumulated on the tensors' device, so update_cm never waits for the
+    device or copies to the host; only current_score() and get_scores()
+    do, and they return the same values as ConfuseMatrixMeter.
+    """
+    def update_cm(self, pr, gt, weight=1):
+        val = get_confuse_matrix_tensor(num_classes=self.n_class, label_gts=gt, label_preds=pr)
+        self.update(val, weight)
+
+    def current_score(self):
+        """mF1 of the last batch"""
+        return cm2F1(self.val.cpu().numpy())
+
+    def get_scores(self):
+        scores_dict = cm2score(self.sum.cpu().numpy().astype(np.float64))
+        return scores_dict
+
+
 
 def harmonic_mean(xs):
     harmonic_mean = len(xs) / sum((x+1e-6)**-1 for x in xs)
@@ -138,26 +160,84 @@ def cm2score(confusion_matrix):
     return score_dict
 
 
-def get_confuse_matrix(num_classes, label_gts, label_preds):
-    """计算一组预测的混淆矩阵"""
-    def __fast_hist(label_gt, label_pred):
-        """
-        Collect values for Confusion Matrix
-        For reference, please see: https://en.wikipedia.org/wiki/Confusion_matrix
-        :param label_gt: <np.array> ground-truth
-        :param label_pred: <np.array> prediction
-        :return: <np.ndarray> values for confusion matrix
-        """
-        mask = (label_gt >= 0) & (label_gt < num_classes)
-        hist = np.bincount(num_classes * label_gt[mask].astype(int) + label_pred[mask],
-                           minlength=num_classes**2).reshape(num_classes, num_classes)
-        return hist
-    confusion_matrix = np.zeros((num_classes, num_classes))
-    for lt, lp in zip(label_gts, label_preds):
-        confusion_matrix += __fast_hist(lt.flatten(), lp.flatten())
+def get_confuse_matrix(num_classes, label_gts, label_preds, per_image=False, chunk_size=None):
+    """
+    计算一组预测的混淆矩阵 (rows: ground truth, columns: prediction)
+    For reference, please see: https://en.wikipedia.org/wiki/Confusion_matrix
+    :param label_gts: <np.array> (N, ...) ground-truth stack, or a sequence of per-image arrays
+    :param label_preds: <np.array> (N, ...) prediction stack, or a sequence of per-image arrays
+    :param per_image: also return the (N, num_classes, num_classes) per-image matrices
+    :param chunk_size: images counted per pass (None: about CHUNK_PIXELS pixels)
+    :return: <np.ndarray> confusion matrix, and the per-image matrices if per_image
+    Pixels whose ground truth (e.g. 255) or prediction is outside [0, num_classes) are ignored.
+    """
+    chunks = _image_chunks(label_gts, label_preds, chunk_size)
+    hists = [_count_chunk(num_classes, *chunk) for chunk in chunks]
+    if not hists:
+        hists = [np.zeros((0, num_classes, num_classes), dtype=np.int64)]
+    hists = np.concatenate(hists).astype(np.float64)
+    confusion_matrix = hists.sum(axis=0)
+    if per_image:
+        return confusion_matrix, hists
     return confusion_matrix
 
 
+# pixels counted per pass by default: small enough for the index array to
+# stay in cache, large enough that many small tiles share one bincount
+CHUNK_PIXELS = 2 ** 16
+
+
+def _image_chunks(label_gts, label_preds, chunk_size):
+    """(gt, pred) pairs of (n, pixels) views over at most chunk_size images each"""
+    if not (isinstance(label_gts, np.ndarray) and isinstance(label_preds, np.ndarray)):
+        label_gts, label_preds = [np.asarray(x) for x in label_gts], [np.asarray(x) for x in label_preds]
+        if len({x.size for x in label_gts + label_preds}) > 1:
+            # images of different sizes: one chunk each
+            return [(lt.reshape(1, -1), lp.reshape(1, -1)) for lt, lp in zip(label_gts, label_preds)]
+        label_gts, label_preds = np.stack(label_gts), np.stack(label_preds)
+    n = min(len(label_gts), len(label_preds))
+    if n == 0:
+        return []
+    label_gts, label_preds = label_gts[:n].reshape(n, -1), label_preds[:n].reshape(n, -1)
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_PIXELS // label_gts.shape[1])
+    return [(label_gts[i:i + chunk_size], label_preds[i:i + chunk_size]) for i in range(0, n, chunk_size)]
+
+
+def _count_chunk(num_classes, label_gt, label_pred):
+    """(n, num_classes, num_classes) int64 matrices of n flattened images, in one bincount"""
+    n_bins = num_classes ** 2 + 1  # the last bin collects ignored pixels
+    index = num_classes * label_gt.astype(np.int64) + label_pred.astype(np.int64, copy=False)
+    # an out-of-range prediction would otherwise land in a neighbouring image's bins
+    index[(label_gt < 0) | (label_gt >= num_classes) | (label_pred < 0) | (label_pred >= num_classes)] = n_bins - 1
+    # offset each image into its own block of bins
+    index += (np.arange(len(index)) * n_bins)[:, None]
+    hist = np.bincount(index.ravel(), minlength=len(index) * n_bins)
+    return hist.reshape(-1, n_bins)[:, :-1].reshape(-1, num_classes, num_classes)
+
+
+def get_confuse_matrix_tensor(num_classes, label_gts, label_preds, force_torch=False):
+    """
+    Confusion matrix (int64, on the inputs' device) of a batch of label
+    tensors in one pass. Pixels whose ground truth (e.g. 255) or prediction
+    is outside [0, num_classes) are ignored, as in get_confuse_matrix.
+    :param force_torch: count with torch on CPU too (the path GPU tensors take)
+    """
+    if label_gts.device.type == 'cpu' and not force_torch:
+        # nothing to sync with on CPU, and numpy's bincount is the faster kernel there
+        chunks = _image_chunks(label_gts.detach().numpy(), label_preds.detach().numpy(), None)
+        return torch.from_numpy(sum(_count_chunk(num_classes, *chunk).sum(axis=0) for chunk in chunks))
+    # ignored pixels go to an extra bin instead of being masked out: boolean indexing
+    # would need the host to size its output, as torch.bincount does with the max index
+    gt = label_gts.detach().reshape(-1).long()
+    pr = label_preds.detach().reshape(-1).long()
+    valid = (gt >= 0) & (gt < num_classes) & (pr >= 0) & (pr < num_classes)
+    index = torch.where(valid, num_classes * gt + pr, num_classes ** 2)
+    hist = torch.zeros(num_classes ** 2 + 1, dtype=torch.int64, device=gt.device)
+    hist.scatter_add_(0, index, torch.ones_like(index))
+    return hist[:-1].reshape(num_classes, num_classes)
+
+
 def get_mIoU(num_classes, label_gts, label_preds):
     confusion_matrix = get_confuse_matrix(num_classes, label_gts, label_preds)
     score_dict = cm2score(confusion_matrix)
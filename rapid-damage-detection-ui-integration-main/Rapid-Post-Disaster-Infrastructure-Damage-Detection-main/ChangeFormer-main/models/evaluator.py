@@ -3,7 +3,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from models.networks import *
-from misc.metric_tool import ConfuseMatrixMeter
+from misc.metric_tool import TensorConfuseMatrixMeter
 from misc.logger_tool import Logger
 from utils import de_norm
 import utils
@@ -29,7 +29,7 @@ class CDEvaluator():
         print(self.device)
 
         # define some other vars to record the training states
-        self.running_metric = ConfuseMatrixMeter(n_class=self.n_class)
+        self.running_metric = TensorConfuseMatrixMeter(n_class=self.n_class)
 
         # define logger file
         logger_path = os.path.join(args.checkpoint_dir, 'log_test.txt')
@@ -97,18 +97,18 @@ class CDEvaluator():
         G_pred = self.G_pred.detach()
         G_pred = torch.argmax(G_pred, dim=1)
 
-        current_score = self.running_metric.update_cm(pr=G_pred.cpu().numpy(), gt=target.cpu().numpy())
-        return current_score
+        # stays on device; the score is only read back when it is logged
+        self.running_metric.update_cm(pr=G_pred, gt=target)
 
     def _collect_running_batch_states(self):
 
-        running_acc = self._update_metric()
+        self._update_metric()
 
         m = len(self.dataloader)
 
         if np.mod(self.batch_id, 100) == 1:
             message = 'Is_training: %s. [%d,%d],  running_mf1: %.5f\n' %\
-                      (self.is_training, self.batch_id, m, running_acc)
+                      (self.is_training, self.batch_id, m, self.running_metric.current_score())
             self.logger.write(message)
 
         if np.mod(self.batch_id, 100) == 1:
@@ -1,14 +1,21 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import contextlib
+import copy
+import resource
+import time
 
 import utils
 from models.networks import *
 
 import torch
 import torch.optim as optim
+from torch.utils.data import DataLoader
 import numpy as np
-from misc.metric_tool import ConfuseMatrixMeter
+from misc.metric_tool import TensorConfuseMatrixMeter
+from misc.ema_tool import ModelEMA
+from misc.checkpoint_tool import CheckpointWriter, save_npy
 from models.losses import cross_entropy
 import models.losses as losses
 from models.losses import get_alpha, softmax_helper, FocalLoss, mIoULoss, mmIoULoss
@@ -19,6 +26,46 @@ from utils import de_norm
 
 from tqdm import tqdm
 
+
+def get_amp_dtype(name, device):
+    """autocast dtype: bf16 | fp16 | auto (fp16 on GPU, bf16 on CPU)"""
+    if name == 'auto':
+        return torch.float16 if device.type == 'cuda' else torch.bfloat16
+    if name in ('bf16', 'bfloat16'):
+        return torch.bfloat16
+    if name in ('fp16', 'float16'):
+        return torch.float16
+    raise NotImplementedError('amp dtype [%s] is not implemented' % name)
+
+
+def default_memory_budget_mb(device):
+    """90% of the GPU's memory, or on CPU this process plus 80% of the free RAM"""
+    if device.type == 'cuda':
+        return 0.9 * torch.cuda.get_device_properties(device).total_memory / 2 ** 20
+    with open('/proc/self/statm') as f:
+        rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    free = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    return (rss + 0.8 * free) / 2 ** 20
+
+
+def is_out_of_memory(error):
+    """CUDA's OutOfMemoryError, or the RuntimeError/MemoryError the CPU and MPS allocators raise"""
+    if isinstance(error, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+    message = str(error)
+    return isinstance(error, RuntimeError) and ('out of memory' in message or "can't allocate memory" in message)
+
+
+def resize_loader(loader, batch_size):
+    """A DataLoader like loader (sampler, workers, collate_fn, ...) with another batch size"""
+    return DataLoader(loader.dataset, batch_size=batch_size, sampler=loader.sampler,
+                      num_workers=loader.num_workers, collate_fn=loader.collate_fn,
+                      pin_memory=loader.pin_memory, drop_last=loader.drop_last, timeout=loader.timeout,
+                      worker_init_fn=loader.worker_init_fn, multiprocessing_context=loader.multiprocessing_context,
+                      generator=loader.generator, prefetch_factor=loader.prefetch_factor,
+                      persistent_workers=loader.persistent_workers)
+
+
 class CDTrainer():
 
     def __init__(self, args, dataloaders):
@@ -54,7 +101,19 @@ class CDTrainer():
         # define lr schedulers
         self.exp_lr_scheduler_G = get_scheduler(self.optimizer_G, args)
 
-        self.running_metric = ConfuseMatrixMeter(n_class=2)
+        # mixed precision: the network runs under autocast, losses in fp32.
+        # fp16 needs loss scaling against gradient underflow, bf16 does not
+        self.use_amp = str(args.use_amp) == 'True'
+        self.amp_dtype = get_amp_dtype(args.amp_dtype, self.device)
+        self.scaler = torch.amp.GradScaler(self.device.type,
+                                           enabled=self.use_amp and self.amp_dtype == torch.float16)
+        if self.use_amp:
+            print('mixed precision training: %s autocast on %s' % (self.amp_dtype, self.device.type))
+
+        # EMA of the weights, used for validation and best_ckpt.pt
+        self.ema = ModelEMA(self.net_G, decay=args.ema_decay) if str(args.use_ema) == 'True' else None
+
+        self.running_metric = TensorConfuseMatrixMeter(n_class=2)
 
         # define logger file
         logger_path = os.path.join(args.checkpoint_dir, 'log.txt')
@@ -63,6 +122,8 @@ class CDTrainer():
         # define timer
         self.timer = Timer()
         self.batch_size = args.batch_size
+        # micro-batches per optimizer step; gradients are averaged over them
+        self.accum_steps = max(1, args.gradient_accumulation_steps)
 
         #  training log
         self.epoch_acc = 0
@@ -70,6 +131,15 @@ class CDTrainer():
         self.best_epoch_id = 0
         self.epoch_to_start = 0
         self.max_num_epochs = args.max_epochs
+        # validate / write last_ckpt.pt every N epochs (and always at the end)
+        self.val_frequency = max(1, args.val_frequency)
+        self.save_frequency = max(1, args.save_frequency)
+        # stop after this many validations without a better val score (0: never)
+        self.early_stopping_patience = args.early_stopping_patience
+        # validations run since the best one
+        self.stale_validations = 0
+        # checkpoints and curves are written on a background thread
+        self.checkpoint_writer = CheckpointWriter(enabled=str(args.async_checkpoint) == 'True')
 
         self.global_step = 0
         self.steps_per_epoch = len(dataloaders['train'])
@@ -105,11 +175,11 @@ class CDTrainer():
             alpha   = np.asarray(get_alpha(dataloaders['train'])) # calculare class occurences
             alpha   = alpha/np.sum(alpha)
             # weights = torch.tensor([1.0, 1.0]).cuda()
-            weights = 1-torch.from_numpy(alpha).cuda()
+            weights = 1-torch.from_numpy(alpha).to(self.device)
             print(f"Weights = {weights}")
-            self._pxl_loss = mIoULoss(weight=weights, size_average=True, n_classes=args.n_class).cuda()
+            self._pxl_loss = mIoULoss(weight=weights, size_average=True, n_classes=args.n_class).to(self.device)
         elif args.loss == "mmiou":
-            self._pxl_loss = mmIoULoss(n_classes=args.n_class).cuda()
+            self._pxl_loss = mmIoULoss(n_classes=args.n_class).to(self.device)
         else:
             raise NotImplemented(args.loss)
 
@@ -126,6 +196,79 @@ class CDTrainer():
         if os.path.exists(self.vis_dir) is False:
             os.mkdir(self.vis_dir)
 
+        if str(args.auto_batch_size) == 'True':
+            self._auto_batch_size(args.effective_batch_size or self.batch_size * self.accum_steps,
+                                  args.memory_budget_mb or default_memory_budget_mb(self.device))
+
+    def _probe_memory(self, batch_size):
+        """
+        Peak memory (MB) of a forward/backward pass on a synthetic micro-batch,
+        plus the optimizer state; None if it ran out of memory. On GPU this is
+        allocated memory, on CPU the process's peak RSS.
+        """
+        size = self.args.img_size
+        batch = {'A': torch.randn(batch_size, 3, size, size), 'B': torch.randn(batch_size, 3, size, size),
+                 'L': torch.zeros(batch_size, 1, size, size, dtype=torch.uint8)}
+        cuda = self.device.type == 'cuda'
+        if cuda:
+            torch.cuda.empty_cache()
+            torch.cuda.reset_peak_memory_stats(self.device)
+        try:
+            self._forward_pass(batch)
+            self._backward_G()
+        except (RuntimeError, MemoryError) as e:
+            if not is_out_of_memory(e):
+                raise
+            return None
+        finally:
+            self.optimizer_G.zero_grad(set_to_none=True)
+            self.G_pred = self.G_final_pred = self.G_loss = self.batch = None
+        if cuda:
+            peak = torch.cuda.max_memory_allocated(self.device)
+        else:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KB on Linux
+        # Adam(W) keeps two moments per parameter, SGD one momentum buffer
+        states = 2 if isinstance(self.optimizer_G, (optim.Adam, optim.AdamW)) else 1
+        peak += states * sum(p.numel() * p.element_size() for p in self.net_G.parameters())
+        return peak / 2 ** 20
+
+    def _auto_batch_size(self, effective_batch_size, budget_mb):
+        """
+        Pick the largest power-of-two micro-batch whose training step fits
+        budget_mb, and enough accumulation steps to reach effective_batch_size.
+        Sizes are probed in increasing order and a size is not tried when
+        linear growth from the previous two already exceeds the budget.
+        """
+        state = copy.deepcopy(self.net_G.state_dict())  # BatchNorm statistics change in train mode
+        self.net_G.train()
+        peaks = {}
+        batch_size = 1
+        while batch_size <= effective_batch_size:
+            if len(peaks) >= 2:
+                (b0, m0), (b1, m1) = list(peaks.items())[-2:]
+                if m1 + (m1 - m0) / (b1 - b0) * (batch_size - b1) > budget_mb:
+                    break
+            peak = self._probe_memory(batch_size)
+            if peak is None or peak > budget_mb:
+                break
+            peaks[batch_size] = peak
+            batch_size *= 2
+        self.net_G.load_state_dict(state)
+        if not peaks:
+            raise RuntimeError('a micro-batch of 1 does not fit in %.0f MB' % budget_mb)
+
+        micro_batch = max(peaks)
+        self.batch_size = micro_batch
+        self.accum_steps = -(-effective_batch_size // micro_batch)
+        for split, loader in list(self.dataloaders.items()):
+            self.dataloaders[split] = resize_loader(loader, micro_batch)
+        self.steps_per_epoch = len(self.dataloaders['train'])
+        self.total_steps = (self.max_num_epochs - self.epoch_to_start)*self.steps_per_epoch
+        self.logger.write('Auto batch size: micro-batch %d x %d accumulation steps = %d '
+                          '(peak %.0f MB, budget %.0f MB)\n' %
+                          (micro_batch, self.accum_steps, micro_batch * self.accum_steps,
+                           peaks[micro_batch], budget_mb))
+
 
     def _load_checkpoint(self, ckpt_name='last_ckpt.pt'):
         print("\n")
@@ -140,6 +283,13 @@ class CDTrainer():
             self.optimizer_G.load_state_dict(checkpoint['optimizer_G_state_dict'])
             self.exp_lr_scheduler_G.load_state_dict(
                 checkpoint['exp_lr_scheduler_G_state_dict'])
+            if 'scaler_state_dict' in checkpoint:
+                self.scaler.load_state_dict(checkpoint['scaler_state_dict'])
+            if self.ema is not None:
+                if 'ema_state_dict' in checkpoint:
+                    self.ema.load_state_dict(checkpoint['ema_state_dict'])
+                else:
+                    self.ema.reset()
 
             self.net_G.to(self.device)
 
@@ -147,6 +297,13 @@ class CDTrainer():
             self.epoch_to_start = checkpoint['epoch_id'] + 1
             self.best_val_acc = checkpoint['best_val_acc']
             self.best_epoch_id = checkpoint['best_epoch_id']
+            # older checkpoints: assume a validation every val_frequency epochs since the best
+            self.stale_validations = checkpoint.get(
+                'stale_validations', (self.epoch_to_start - 1 - self.best_epoch_id) // self.val_frequency)
+            # the .npy curves may have run ahead of the last checkpoint
+            if 'train_acc' in checkpoint:
+                self.TRAIN_ACC = np.asarray(checkpoint['train_acc'], np.float32)
+                self.VAL_ACC = np.asarray(checkpoint['val_acc'], np.float32)
 
             self.total_steps = (self.max_num_epochs - self.epoch_to_start)*self.steps_per_epoch
 
@@ -158,6 +315,8 @@ class CDTrainer():
             self.net_G.load_state_dict(torch.load(self.args.pretrain), strict=False)
             self.net_G.to(self.device)
             self.net_G.eval()
+            if self.ema is not None:
+                self.ema.reset()
         else:
             print('training from scratch...')
         print("\n")
@@ -175,15 +334,30 @@ class CDTrainer():
         pred_vis = pred * 255
         return pred_vis
 
-    def _save_checkpoint(self, ckpt_name):
-        torch.save({
+    def _eval_weights(self):
+        """Context in which net_G holds the weights to validate and keep as best"""
+        return self.ema.swapped() if self.ema is not None else contextlib.nullcontext()
+
+    def _save_checkpoint(self, ckpt_names):
+        """Snapshot the training state now and write it to ckpt_names (one name or a list)"""
+        if isinstance(ckpt_names, str):
+            ckpt_names = [ckpt_names]
+        checkpoint = {
             'epoch_id': self.epoch_id,
-            'best_val_acc': self.best_val_acc,
+            'best_val_acc': float(self.best_val_acc),
             'best_epoch_id': self.best_epoch_id,
+            'stale_validations': self.stale_validations,
             'model_G_state_dict': self.net_G.state_dict(),
             'optimizer_G_state_dict': self.optimizer_G.state_dict(),
             'exp_lr_scheduler_G_state_dict': self.exp_lr_scheduler_G.state_dict(),
-        }, os.path.join(self.checkpoint_dir, ckpt_name))
+            'scaler_state_dict': self.scaler.state_dict(),
+            'train_acc': self.TRAIN_ACC.tolist(),
+            'val_acc': self.VAL_ACC.tolist(),
+        }
+        # while the EMA is swapped in, model_G_state_dict already holds it
+        if self.ema is not None and not self.ema.applied:
+            checkpoint['ema_state_dict'] = self.ema.state_dict()
+        self.checkpoint_writer.submit([os.path.join(self.checkpoint_dir, name) for name in ckpt_names], checkpoint)
 
     def _update_lr_schedulers(self):
         self.exp_lr_scheduler_G.step()
@@ -197,12 +371,12 @@ class CDTrainer():
 
         G_pred = torch.argmax(G_pred, dim=1)
 
-        current_score = self.running_metric.update_cm(pr=G_pred.cpu().numpy(), gt=target.cpu().numpy())
-        return current_score
+        # stays on device; the score is only read back when it is logged
+        self.running_metric.update_cm(pr=G_pred, gt=target)
 
     def _collect_running_batch_states(self):
 
-        running_acc = self._update_metric()
+        self._update_metric()
 
         m = len(self.dataloaders['train'])
         if self.is_training is False:
@@ -213,7 +387,7 @@ class CDTrainer():
             message = 'Is_training: %s. [%d,%d][%d,%d], imps: %.2f, est: %.2fh, G_loss: %.5f, running_mf1: %.5f\n' %\
                       (self.is_training, self.epoch_id, self.max_num_epochs-1, self.batch_id, m,
                      imps*self.batch_size, est,
-                     self.G_loss.item(), running_acc)
+                     self.G_loss.item(), self.running_metric.current_score())
             self.logger.write(message)
 
 
@@ -242,31 +416,47 @@ class CDTrainer():
         self.logger.write(message+'\n')
         self.logger.write('\n')
 
-    def _update_checkpoints(self):
-
-        # save current model
-        self._save_checkpoint(ckpt_name='last_ckpt.pt')
-        self.logger.write('Lastest model updated. Epoch_acc=%.4f, Historical_best_acc=%.4f (at epoch %d)\n'
-              % (self.epoch_acc, self.best_val_acc, self.best_epoch_id))
-        self.logger.write('\n')
+    def _update_checkpoints(self, validated=True, save_last=True):
 
         # update the best model (based on eval acc)
-        if self.epoch_acc > self.best_val_acc:
+        best = validated and self.epoch_acc > self.best_val_acc
+        if best:
             self.best_val_acc = self.epoch_acc
             self.best_epoch_id = self.epoch_id
-            self._save_checkpoint(ckpt_name='best_ckpt.pt')
+            # without EMA both files hold the same state: snapshot it once
+            if save_last and self.ema is None:
+                self._save_checkpoint(['best_ckpt.pt', 'last_ckpt.pt'])
+            else:
+                with self._eval_weights():
+                    self._save_checkpoint('best_ckpt.pt')
             self.logger.write('*' * 10 + 'Best model updated!\n')
             self.logger.write('\n')
 
+        # save current model
+        if save_last:
+            if not (best and self.ema is None):
+                self._save_checkpoint('last_ckpt.pt')
+            if validated:
+                self.logger.write('Lastest model updated. Epoch_acc=%.4f, Historical_best_acc=%.4f (at epoch %d)\n'
+                      % (self.epoch_acc, self.best_val_acc, self.best_epoch_id))
+            else:
+                # epoch_acc is still the training score: no validation ran this epoch
+                self.logger.write('Lastest model updated (not validated this epoch). '
+                                  'Historical_best_acc=%.4f (at epoch %d)\n' % (self.best_val_acc, self.best_epoch_id))
+            self.logger.write('\n')
+
+    def _should_stop_early(self):
+        return 0 < self.early_stopping_patience <= self.stale_validations
+
     def _update_training_acc_curve(self):
         # update train acc curve
         self.TRAIN_ACC = np.append(self.TRAIN_ACC, [self.epoch_acc])
-        np.save(os.path.join(self.checkpoint_dir, 'train_acc.npy'), self.TRAIN_ACC)
+        self.checkpoint_writer.submit(os.path.join(self.checkpoint_dir, 'train_acc.npy'), self.TRAIN_ACC, save_npy)
 
     def _update_val_acc_curve(self):
         # update val acc curve
         self.VAL_ACC = np.append(self.VAL_ACC, [self.epoch_acc])
-        np.save(os.path.join(self.checkpoint_dir, 'val_acc.npy'), self.VAL_ACC)
+        self.checkpoint_writer.submit(os.path.join(self.checkpoint_dir, 'val_acc.npy'), self.VAL_ACC, save_npy)
 
     def _clear_cache(self):
         self.running_metric.clear()
@@ -276,7 +466,11 @@ class CDTrainer():
         self.batch = batch
         img_in1 = batch['A'].to(self.device)
         img_in2 = batch['B'].to(self.device)
-        self.G_pred = self.net_G(img_in1, img_in2)
+        with torch.autocast(self.device.type, dtype=self.amp_dtype, enabled=self.use_amp):
+            self.G_pred = self.net_G(img_in1, img_in2)
+        if self.use_amp:
+            # losses and metrics in fp32 (softmax/log of half logits loses precision)
+            self.G_pred = [pred.float() for pred in self.G_pred]
 
         if self.multi_scale_infer == "True":
             self.G_final_pred = torch.zeros(self.G_pred[-1].size()).to(self.device)
@@ -290,7 +484,7 @@ class CDTrainer():
             self.G_final_pred = self.G_pred[-1]
 
             
-    def _backward_G(self):
+    def _backward_G(self, loss_scale=1.0):
         gt = self.batch['L'].to(self.device).float()
         if self.multi_scale_train == "True":
             i         = 0
@@ -305,18 +499,41 @@ class CDTrainer():
         else:
             self.G_loss = self._pxl_loss(self.G_pred[-1], gt)
 
-        self.G_loss.backward()
+        # loss_scale averages the gradients over accumulated micro-batches
+        self.scaler.scale(self.G_loss * loss_scale).backward()
+
+    def _train_step(self, batch, update=True, loss_scale=1.0):
+        """Forward and backward one micro-batch; update G if it ends an accumulation group"""
+        self._forward_pass(batch)
+        self._backward_G(loss_scale)
+        if update:
+            # skipped by the scaler if fp16 gradients overflowed
+            self.scaler.step(self.optimizer_G)
+            self.scaler.update()
+            if self.ema is not None:
+                self.ema.update()
+            self.optimizer_G.zero_grad(set_to_none=True)
 
 
     def train_models(self):
 
         self._load_checkpoint()
+        self.optimizer_G.zero_grad(set_to_none=True)
+        if self.epoch_to_start > 0 and self._should_stop_early():
+            self.logger.write('Early stopped before (no improvement since epoch %d), nothing to resume\n'
+                              % self.best_epoch_id)
+            return
+        times = {'train': 0.0, 'val': 0.0, 'checkpoint': 0.0}
+        blocked = self.checkpoint_writer.blocked
 
         # loop over the dataset multiple times
         for self.epoch_id in range(self.epoch_to_start, self.max_num_epochs):
+            last_epoch = self.epoch_id == self.max_num_epochs - 1
+            validate = (self.epoch_id + 1) % self.val_frequency == 0 or last_epoch
 
             ################## train #################
             ##########################################
+            t0 = time.perf_counter()
             self._clear_cache()
             self.is_training = True
             self.net_G.train()  # Set model to training mode
@@ -324,35 +541,68 @@ class CDTrainer():
             total = len(self.dataloaders['train'])
             self.logger.write('lr: %0.7f\n \n' % self.optimizer_G.param_groups[0]['lr'])
             for self.batch_id, batch in tqdm(enumerate(self.dataloaders['train'], 0), total=total):
-                self._forward_pass(batch)
-                # update G
-                self.optimizer_G.zero_grad()
-                self._backward_G()
-                self.optimizer_G.step()
+                # the last group of an epoch may be short; average over what it has
+                group_start = self.batch_id - self.batch_id % self.accum_steps
+                group_size = min(self.accum_steps, total - group_start)
+                self._train_step(batch, update=self.batch_id == group_start + group_size - 1,
+                                 loss_scale=1.0 / group_size)
                 self._collect_running_batch_states()
                 self._timer_update()
 
             self._collect_epoch_states()
+            # last epoch's checkpoints were written while this one trained
+            self.checkpoint_writer.wait()
             self._update_training_acc_curve()
             self._update_lr_schedulers()
+            t_train = time.perf_counter() - t0
 
 
             ################## Eval ##################
             ##########################################
-            self.logger.write('Begin evaluation...\n')
-            self._clear_cache()
-            self.is_training = False
-            self.net_G.eval()
-
-            # Iterate over data.
-            for self.batch_id, batch in enumerate(self.dataloaders['val'], 0):
-                with torch.no_grad():
-                    self._forward_pass(batch)
-                self._collect_running_batch_states()
-            self._collect_epoch_states()
+            t0 = time.perf_counter()
+            if validate:
+                self.logger.write('Begin evaluation...\n')
+                self._clear_cache()
+                self.is_training = False
+                self.net_G.eval()
+
+                # Iterate over data.
+                with self._eval_weights():
+                    for self.batch_id, batch in enumerate(self.dataloaders['val'], 0):
+                        with torch.no_grad():
+                            self._forward_pass(batch)
+                        self._collect_running_batch_states()
+                self._collect_epoch_states()
+                self._update_val_acc_curve()
+            t_val = time.perf_counter() - t0
 
             ########### Update_Checkpoints ###########
             ##########################################
-            self._update_val_acc_curve()
-            self._update_checkpoints()
+            t0 = time.perf_counter()
+            if validate:
+                better = self.epoch_acc > self.best_val_acc
+                self.stale_validations = 0 if better else self.stale_validations + 1
+            stop = validate and self._should_stop_early()
+            self._update_checkpoints(validated=validate,
+                                     save_last=stop or last_epoch or (self.epoch_id + 1) % self.save_frequency == 0)
+            t_checkpoint = time.perf_counter() - t0
+            # time training actually spent blocked on checkpoint I/O
+            t_blocked, blocked = self.checkpoint_writer.blocked - blocked, self.checkpoint_writer.blocked
+
+            epoch_time = t_train + t_val + t_checkpoint
+            for name, t in zip(times, (t_train, t_val, t_checkpoint)):
+                times[name] += t
+            self.logger.write('Epoch %d time: %.1fs (train %.1fs, val %.1fs = %.1f%%, checkpoint %.1fs = %.1f%%, '
+                              'blocked on checkpoint I/O %.2fs); run total: val %.1fs, checkpoint %.1fs\n\n' %
+                              (self.epoch_id, epoch_time, t_train, t_val, 100 * t_val / epoch_time,
+                               t_checkpoint, 100 * t_checkpoint / epoch_time, t_blocked,
+                               times['val'], times['checkpoint']))
+
+            if stop:
+                self.logger.write('Early stopping: no improvement in %d validations (best %.4f at epoch %d)\n' %
+                                  (self.stale_validations, self.best_val_acc, self.best_epoch_id))
+                break
+
+        # everything on disk before best_ckpt.pt is loaded for testing
+        self.checkpoint_writer.close()
 
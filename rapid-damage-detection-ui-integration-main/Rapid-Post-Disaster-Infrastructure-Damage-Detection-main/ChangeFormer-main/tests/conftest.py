@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Run from anywhere, importing the repo's packages as the scripts do
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,78 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+import torch
+
+from misc.checkpoint_tool import CheckpointWriter, atomic_save, save_npy, to_cpu
+
+
+def test_atomic_save_round_trips(tmp_path):
+    path = str(tmp_path / 'ckpt.pt')
+    state = {'epoch_id': 3, 'weights': {'w': torch.randn(4, 4)}, 'curve': [0.1, 0.2]}
+    atomic_save(state, path)
+    loaded = torch.load(path)
+    assert loaded['epoch_id'] == 3 and loaded['curve'] == [0.1, 0.2]
+    assert torch.equal(loaded['weights']['w'], state['weights']['w'])
+    assert os.listdir(tmp_path) == ['ckpt.pt']
+
+
+def test_failed_save_keeps_the_previous_file(tmp_path):
+    path = str(tmp_path / 'ckpt.pt')
+    atomic_save({'epoch_id': 1}, path)
+
+    def crash(obj, f):
+        f.write(b'partial')
+        raise OSError('disk full')
+    with pytest.raises(OSError):
+        atomic_save({'epoch_id': 2}, path, crash)
+    assert torch.load(path) == {'epoch_id': 1}
+
+
+def test_to_cpu_copies():
+    w = torch.ones(3)
+    snapshot = to_cpu({'w': w, 'pair': (w, np.ones(2)), 'n': 1})
+    w.add_(1)
+    assert torch.equal(snapshot['w'], torch.ones(3)) and isinstance(snapshot['pair'], tuple)
+    assert snapshot['w'].data_ptr() != w.data_ptr() and snapshot['n'] == 1
+
+
+def test_writer_snapshots_at_submit(tmp_path):
+    writer = CheckpointWriter()
+    gate = threading.Event()
+    # Hold the worker so the training loop runs ahead of the write
+    writer._pool.submit(gate.wait)
+    w = torch.zeros(8)
+    paths = [str(tmp_path / 'best_ckpt.pt'), str(tmp_path / 'last_ckpt.pt')]
+    writer.submit(paths, {'w': w})
+    writer.submit(str(tmp_path / 'curve.npy'), np.arange(3), save_npy)
+    w.add_(1)
+    gate.set()
+    writer.wait()
+    for path in paths:
+        assert torch.equal(torch.load(path)['w'], torch.zeros(8))
+    assert np.array_equal(np.load(tmp_path / 'curve.npy'), np.arange(3))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    writer.close()
+
+
+def test_writer_reraises_failed_writes(tmp_path):
+    writer = CheckpointWriter()
+
+    def crash(obj, f):
+        raise OSError('disk full')
+    writer.submit(str(tmp_path / 'ckpt.pt'), {}, crash)
+    with pytest.raises(OSError, match='disk full'):
+        writer.wait()
+    # Reported once; later writes go through
+    writer.submit(str(tmp_path / 'ckpt.pt'), {'epoch_id': 1})
+    writer.close()
+    assert torch.load(tmp_path / 'ckpt.pt') == {'epoch_id': 1}
+
+
+def test_disabled_writer_writes_in_submit(tmp_path):
+    writer = CheckpointWriter(enabled=False)
+    writer.submit(str(tmp_path / 'ckpt.pt'), {'epoch_id': 1})
+    assert torch.load(tmp_path / 'ckpt.pt') == {'epoch_id': 1}
+    writer.close()
@@ -0,0 +1,75 @@
+import pytest
+import torch
+from torch import nn
+
+from misc.ema_tool import ModelEMA
+
+
+def make_model():
+    torch.manual_seed(0)
+    return nn.Sequential(nn.Conv2d(3, 4, 3), nn.BatchNorm2d(4), nn.ReLU(), nn.Conv2d(4, 2, 1))
+
+
+def train_steps(model, ema, steps):
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    for _ in range(steps):
+        loss = model(torch.randn(2, 3, 8, 8)).square().mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        ema.update()
+
+
+def test_average_follows_the_warmup_decay():
+    model = make_model()
+    ema = ModelEMA(model, decay=0.9)
+    expected = {k: v.clone() for k, v in model.state_dict().items() if v.is_floating_point()}
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    for step in range(1, 20):
+        model(torch.randn(2, 3, 8, 8)).square().mean().backward()
+        optimizer.step()
+        optimizer.zero_grad()
+        ema.update()
+        decay = min(0.9, (1 + step) / (10 + step))
+        for k, v in model.state_dict().items():
+            if k in expected:
+                expected[k] = decay * expected[k] + (1 - decay) * v
+    for name, shadow in zip(ema.names, ema.shadow):
+        assert torch.allclose(shadow, expected[name], atol=1e-6), name
+
+
+def test_swapped_restores_the_live_weights():
+    model = make_model()
+    ema = ModelEMA(model, decay=0.5)
+    train_steps(model, ema, 5)
+    live = {k: v.clone() for k, v in model.state_dict().items()}
+    params = list(model.parameters())
+    shadow = [t.clone() for t in ema.shadow]
+
+    with ema.swapped():
+        assert ema.applied
+        for t, s in zip(ema.live, shadow):
+            assert torch.equal(t, s)
+    assert not ema.applied
+    assert all(torch.equal(v, live[k]) for k, v in model.state_dict().items())
+    # Same Parameter objects, so the optimizer still updates the model
+    assert all(p is q for p, q in zip(model.parameters(), params))
+
+    # Also when evaluation raises
+    with pytest.raises(RuntimeError):
+        with ema.swapped():
+            raise RuntimeError('eval failed')
+    assert all(torch.equal(v, live[k]) for k, v in model.state_dict().items())
+    with pytest.raises(AssertionError):
+        with ema.swapped():
+            ema.update()
+
+
+def test_state_dict_round_trip():
+    model = make_model()
+    ema = ModelEMA(model)
+    train_steps(model, ema, 3)
+    restored = ModelEMA(make_model())
+    restored.load_state_dict(ema.state_dict())
+    assert restored.updates == 3
+    assert all(torch.equal(a, b) for a, b in zip(restored.shadow, ema.shadow))
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+import torch
+
+from misc.metric_tool import (ConfuseMatrixMeter, TensorConfuseMatrixMeter, cm2score, get_confuse_matrix,
+                              get_confuse_matrix_tensor, get_mIoU)
+
+
+def reference_confuse_matrix(num_classes, label_gts, label_preds):
+    """The per-image implementation get_confuse_matrix replaced"""
+    def __fast_hist(label_gt, label_pred):
+        mask = (label_gt >= 0) & (label_gt < num_classes)
+        hist = np.bincount(num_classes * label_gt[mask].astype(int) + label_pred[mask],
+                           minlength=num_classes**2).reshape(num_classes, num_classes)
+        return hist
+    confusion_matrix = np.zeros((num_classes, num_classes))
+    for lt, lp in zip(label_gts, label_preds):
+        confusion_matrix += __fast_hist(lt.flatten(), lp.flatten())
+    return confusion_matrix
+
+
+def make_stack(n, img_size, n_class, seed=0):
+    rng = np.random.default_rng(seed)
+    gts = rng.integers(0, n_class, (n, 1, img_size, img_size), dtype=np.uint8)
+    gts[rng.random(gts.shape) < 0.01] = 255
+    preds = rng.integers(0, n_class, (n, img_size, img_size))
+    return gts, preds
+
+
+@pytest.mark.parametrize('n_class', [2, 3, 7])
+@pytest.mark.parametrize('chunk_size', [None, 1, 5, 64])
+def test_batched_matches_reference(n_class, chunk_size):
+    gts, preds = make_stack(37, 24, n_class)
+    assert (gts == 255).any()
+    expected = reference_confuse_matrix(n_class, gts, preds)
+    cm, per_image = get_confuse_matrix(n_class, gts, preds, per_image=True, chunk_size=chunk_size)
+    assert cm.dtype == np.float64 and np.array_equal(cm, expected)
+    assert per_image.shape == (37, n_class, n_class)
+    for i in range(37):
+        assert np.array_equal(per_image[i], reference_confuse_matrix(n_class, gts[i:i + 1], preds[i:i + 1]))
+
+
+@pytest.mark.parametrize('n_class', [2, 3])
+def test_lists_float_gt_and_empty_stacks(n_class):
+    gts, preds = make_stack(9, 16, n_class, seed=1)
+    expected = reference_confuse_matrix(n_class, gts, preds)
+    assert np.array_equal(get_confuse_matrix(n_class, list(gts), list(preds)), expected)
+    float_gts = gts.astype(np.float32)
+    assert np.array_equal(get_confuse_matrix(n_class, float_gts, preds),
+                          reference_confuse_matrix(n_class, float_gts, preds))
+    assert get_mIoU(n_class, gts, preds) == cm2score(expected)['miou']
+    assert np.array_equal(get_confuse_matrix(n_class, gts[:0], preds[:0]), np.zeros((n_class, n_class)))
+
+
+def test_ragged_images():
+    gts, preds = make_stack(3, 24, 2, seed=2)
+    ragged_gts = [gts[0, 0], gts[1, 0, :10], gts[2, 0, :, :7]]
+    ragged_preds = [preds[0], preds[1, :10], preds[2, :, :7]]
+    cm, per_image = get_confuse_matrix(2, ragged_gts, ragged_preds, per_image=True, chunk_size=1)
+    assert np.array_equal(cm, reference_confuse_matrix(2, ragged_gts, ragged_preds))
+    for i in range(3):
+        assert np.array_equal(per_image[i], reference_confuse_matrix(2, ragged_gts[i:i + 1], ragged_preds[i:i + 1]))
+
+
+@pytest.mark.parametrize('n_class', [2, 3])
+def test_tensor_matches_reference_on_cpu(n_class):
+    gts, preds = make_stack(8, 32, n_class, seed=3)
+    expected = reference_confuse_matrix(n_class, gts, preds)
+    cm = get_confuse_matrix_tensor(n_class, torch.from_numpy(gts), torch.from_numpy(preds))
+    assert cm.dtype == torch.int64 and cm.device.type == 'cpu'
+    assert np.array_equal(cm.numpy(), expected)
+    float_gts = gts.astype(np.float32)
+    cm = get_confuse_matrix_tensor(n_class, torch.from_numpy(float_gts), torch.from_numpy(preds))
+    assert np.array_equal(cm.numpy(), reference_confuse_matrix(n_class, float_gts, preds))
+
+
+@pytest.mark.parametrize('force_torch', [False, True])
+@pytest.mark.parametrize('n_class', [2, 3, 7])
+def test_tensor_paths_match_per_image_reference(n_class, force_torch):
+    gts, preds = make_stack(6, 20, n_class, seed=4)
+    gts = gts.astype(np.int16)
+    expected = sum(reference_confuse_matrix(n_class, gts[i:i + 1], preds[i:i + 1]) for i in range(6))
+    cm = get_confuse_matrix_tensor(n_class, torch.from_numpy(gts), torch.from_numpy(preds), force_torch=force_torch)
+    assert cm.dtype == torch.int64 and np.array_equal(cm.numpy(), expected)
+
+    # Negative ground truth is ignored like 255
+    gts[0, 0, :3] = -1
+    expected = reference_confuse_matrix(n_class, gts, preds)
+    cm = get_confuse_matrix_tensor(n_class, torch.from_numpy(gts), torch.from_numpy(preds), force_torch=force_torch)
+    assert np.array_equal(cm.numpy(), expected)
+
+    # So are out-of-range predictions, which the reference cannot count
+    bad_preds = preds.copy()
+    bad_preds[1, :2] = n_class
+    bad_preds[2, 5] = -3
+    bad_preds[5, -1] = 255
+    masked_gts = np.where((bad_preds[:, None] < 0) | (bad_preds[:, None] >= n_class), 255, gts)
+    expected = reference_confuse_matrix(n_class, masked_gts, preds)
+    cm = get_confuse_matrix_tensor(n_class, torch.from_numpy(gts), torch.from_numpy(bad_preds),
+                                   force_torch=force_torch)
+    assert np.array_equal(cm.numpy(), expected)
+    assert np.array_equal(get_confuse_matrix(n_class, gts, bad_preds), expected)
+
+
+def test_tensor_meter_matches_numpy_meter():
+    numpy_meter, tensor_meter = ConfuseMatrixMeter(2), TensorConfuseMatrixMeter(2)
+    for seed in range(4):
+        gts, preds = make_stack(4, 16, 2, seed=seed)
+        score = numpy_meter.update_cm(pr=preds, gt=gts)
+        tensor_meter.update_cm(pr=torch.from_numpy(preds), gt=torch.from_numpy(gts))
+        assert tensor_meter.current_score() == score
+    assert tensor_meter.get_scores() == numpy_meter.get_scores()
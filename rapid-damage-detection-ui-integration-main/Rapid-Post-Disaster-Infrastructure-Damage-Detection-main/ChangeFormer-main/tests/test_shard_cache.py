@@ -0,0 +1,64 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from datasets.CD_dataset import CDDataset, CDShardDataset, build_shard_cache, load_cd_sample
+from datasets.shard_cache import ShardReader
+
+
+@pytest.fixture
+def root(tmp_path):
+    """A five-sample change detection split of 32px images"""
+    rng = np.random.default_rng(0)
+    names = ['tile_%d.png' % i for i in range(5)]
+    for folder in ('A', 'B', 'label', 'list'):
+        os.makedirs(tmp_path / folder)
+    for name in names:
+        for folder in ('A', 'B'):
+            Image.fromarray(rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)).save(tmp_path / folder / name)
+        Image.fromarray((rng.random((32, 32)) < 0.3).astype(np.uint8) * 255).save(tmp_path / 'label' / name)
+    (tmp_path / 'list' / 'val.txt').write_text('\n'.join(names) + '\n')
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('label_transform', [None, 'norm'])
+def test_shards_hold_the_decoded_samples(root, label_transform):
+    # shard_size 2: three shards, the last one partial
+    shard_dir = build_shard_cache(root, 'val', label_transform, shard_size=2)
+    assert sorted(f for f in os.listdir(shard_dir) if f.startswith('A_')) == \
+        ['A_00000.npy', 'A_00001.npy', 'A_00002.npy']
+    reader = ShardReader(shard_dir)
+    assert len(reader) == 5
+    # Also from a pickled copy, as in a DataLoader worker
+    for shards in (reader, pickle.loads(pickle.dumps(reader))):
+        for i, name in enumerate(shards.names):
+            sample = shards[i]
+            for field, expected in zip(('A', 'B', 'L'), load_cd_sample(root, name, label_transform)):
+                assert sample[field].dtype == np.uint8
+                np.testing.assert_array_equal(sample[field], expected)
+
+
+def test_shard_dataset_matches_cd_dataset(root):
+    build_shard_cache(root, 'val', 'norm')
+    decoded = CDDataset(root, 32, split='val', is_train=False, label_transform='norm')
+    cached = CDShardDataset(root, 32, split='val', is_train=False, label_transform='norm')
+    assert len(cached) == len(decoded)
+    for i in range(len(decoded)):
+        a, b = decoded[i], cached[i]
+        assert a['name'] == b['name']
+        for field in ('A', 'B', 'L'):
+            assert torch.equal(a[field], b[field])
+
+
+def test_stale_cache_is_rejected(root):
+    build_shard_cache(root, 'val', None)
+    with pytest.raises(ValueError, match='stale'):
+        CDShardDataset(root, 32, split='val', is_train=False, label_transform='norm')
+    with open(os.path.join(root, 'list', 'val.txt'), 'a') as f:
+        f.write('tile_0.png\n')
+    with pytest.raises(ValueError, match='stale'):
+        CDShardDataset(root, 32, split='val', is_train=False)
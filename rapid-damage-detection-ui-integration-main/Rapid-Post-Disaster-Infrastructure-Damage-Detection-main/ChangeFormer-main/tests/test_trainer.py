@@ -0,0 +1,176 @@
+import argparse
+import os
+
+import pytest
+import torch
+from torch.utils.data import DataLoader, Dataset, SubsetRandomSampler, default_collate
+
+from models.trainer import CDTrainer
+
+
+class TinyCD(Dataset):
+    def __init__(self, n, img_size=32):
+        self.n, self.img_size = n, img_size
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        g = torch.Generator().manual_seed(index)
+        s = self.img_size
+        label = torch.zeros(1, s, s, dtype=torch.uint8)
+        label[:, :s // 2, :s // 3] = 1
+        return {'name': str(index), 'A': torch.rand(3, s, s, generator=g), 'B': torch.rand(3, s, s, generator=g),
+                'L': label}
+
+
+def make_trainer(workdir, loaders=None, **options):
+    args = argparse.Namespace(
+        gpu_ids=[], project_name='test', checkpoint_dir=os.path.join(workdir, 'checkpoints'),
+        vis_dir=os.path.join(workdir, 'vis'), n_class=2, embed_dim=64, pretrain=None, net_G='SiamUnet_diff',
+        loss='ce', multi_scale_train='False', multi_scale_infer='False', multi_pred_weights=[1.0],
+        optimizer='adamw', lr=1e-3, max_epochs=3, lr_policy='linear', shuffle_AB=False, batch_size=2,
+        img_size=32, use_amp='False', amp_dtype='auto', gradient_accumulation_steps=1, auto_batch_size='False',
+        effective_batch_size=0, memory_budget_mb=0, val_frequency=1, save_frequency=1,
+        early_stopping_patience=0, use_ema='False', ema_decay=0.9, async_checkpoint='True',
+    )
+    for key, value in options.items():
+        setattr(args, key, value)
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    if loaders is None:
+        loaders = {split: DataLoader(TinyCD(4), batch_size=2) for split in ('train', 'val')}
+    torch.manual_seed(0)
+    return CDTrainer(args=args, dataloaders=loaders)
+
+
+def script_scores(trainer, val_scores, train_score=0.9):
+    """Replace the measured epoch scores: train_score when training, val_scores in turn when validating"""
+    val_scores = list(val_scores)
+
+    def collect():
+        trainer.epoch_acc = train_score if trainer.is_training else val_scores.pop(0)
+    trainer._collect_epoch_states = collect
+    return val_scores
+
+
+def read_log(trainer):
+    with open(os.path.join(trainer.checkpoint_dir, 'log.txt')) as f:
+        return f.read()
+
+
+def test_early_stopping_counts_validations_not_epochs(tmp_path):
+    trainer = make_trainer(str(tmp_path), max_epochs=20, val_frequency=3, early_stopping_patience=2)
+    # validations after epochs 2, 5, 8, ...
+    left = script_scores(trainer, [0.5, 0.4, 0.3, 0.2, 0.1])
+    trainer.train_models()
+
+    # Two validations without improvement: stopped after epoch 8, not epoch 5
+    assert trainer.epoch_id == 8 and len(trainer.TRAIN_ACC) == 9 and len(left) == 2
+    assert trainer.best_epoch_id == 2 and trainer.stale_validations == 2
+    log = read_log(trainer)
+    assert 'Early stopping: no improvement in 2 validations' in log
+    # Epochs without validation do not report the training score as Epoch_acc
+    assert 'Epoch_acc=0.9000' not in log
+    assert log.count('Lastest model updated (not validated this epoch)') == 6
+
+    # Resuming a stopped run does nothing
+    resumed = make_trainer(str(tmp_path), max_epochs=20, val_frequency=3, early_stopping_patience=2)
+    script_scores(resumed, [])
+    resumed.train_models()
+    assert resumed.stale_validations == 2
+    assert 'Early stopped before' in read_log(resumed)
+
+
+def test_improvement_resets_the_count(tmp_path):
+    trainer = make_trainer(str(tmp_path), max_epochs=6, early_stopping_patience=2)
+    script_scores(trainer, [0.5, 0.4, 0.6, 0.5, 0.7, 0.6])
+    trainer.train_models()
+    assert trainer.epoch_id == 5 and trainer.best_epoch_id == 4 and trainer.stale_validations == 1
+
+
+def fake_oom(monkeypatch, fits, error="DefaultCPUAllocator: can't allocate memory: you tried to allocate 1 GB"):
+    """Make forward passes on more than fits samples raise error"""
+    forward = CDTrainer._forward_pass
+
+    def forward_pass(self, batch):
+        if len(batch['A']) > fits:
+            raise RuntimeError(error)
+        return forward(self, batch)
+    monkeypatch.setattr(CDTrainer, '_forward_pass', forward_pass)
+
+
+def collate(samples):
+    return default_collate(samples)
+
+
+@pytest.mark.parametrize('error', ["DefaultCPUAllocator: can't allocate memory: you tried to allocate 1 GB",
+                                   'MPS backend out of memory (MPS allocated: 1 GB)'])
+def test_auto_batch_size_backs_off_on_generic_oom(tmp_path, monkeypatch, error):
+    fake_oom(monkeypatch, fits=2, error=error)
+    data = TinyCD(12)
+    train = DataLoader(data, batch_size=1, sampler=SubsetRandomSampler(range(10)), collate_fn=collate,
+                       drop_last=True, num_workers=1, persistent_workers=True, timeout=30)
+    val = DataLoader(data, batch_size=1)
+    trainer = make_trainer(str(tmp_path), {'train': train, 'val': val}, auto_batch_size='True',
+                           effective_batch_size=8, memory_budget_mb=1e9)
+
+    assert (trainer.batch_size, trainer.accum_steps) == (2, 4)
+    loader = trainer.dataloaders['train']
+    assert loader.batch_size == 2 and loader.sampler is train.sampler and loader.collate_fn is collate
+    assert loader.drop_last and loader.num_workers == 1 and loader.persistent_workers and loader.timeout == 30
+    assert trainer.steps_per_epoch == len(loader) == 5
+    assert trainer.dataloaders['val'].batch_size == 2 and not trainer.dataloaders['val'].drop_last
+
+
+def test_auto_batch_size_reraises_other_errors(tmp_path, monkeypatch):
+    fake_oom(monkeypatch, fits=1, error='shape mismatch')
+    with pytest.raises(RuntimeError, match='shape mismatch'):
+        make_trainer(str(tmp_path), auto_batch_size='True', effective_batch_size=4, memory_budget_mb=1e9)
+
+
+def test_eval_weights_swap_in_the_ema_and_back(tmp_path):
+    trainer = make_trainer(str(tmp_path), use_ema='True')
+    trainer.net_G.train()
+    for batch in trainer.dataloaders['train']:
+        trainer._train_step(batch)
+    live = {k: v.clone() for k, v in trainer.net_G.state_dict().items()}
+    shadow = dict(zip(trainer.ema.names, (t.clone() for t in trainer.ema.shadow)))
+
+    with trainer._eval_weights():
+        state = trainer.net_G.state_dict()
+        assert all(torch.equal(state[k], v) for k, v in shadow.items())
+        assert any(not torch.equal(state[k], live[k]) for k in shadow)
+    assert all(torch.equal(v, live[k]) for k, v in trainer.net_G.state_dict().items())
+
+    # best_ckpt.pt holds the EMA weights, last_ckpt.pt the live ones and the average
+    trainer.epoch_acc = 0.5
+    trainer._update_checkpoints()
+    trainer.checkpoint_writer.wait()
+    best = torch.load(os.path.join(trainer.checkpoint_dir, 'best_ckpt.pt'))
+    last = torch.load(os.path.join(trainer.checkpoint_dir, 'last_ckpt.pt'))
+    assert all(torch.equal(best['model_G_state_dict'][k], v) for k, v in shadow.items())
+    assert all(torch.equal(last['model_G_state_dict'][k], v) for k, v in live.items())
+    assert all(torch.equal(last['ema_state_dict']['shadow'][k], v) for k, v in shadow.items())
+    assert all(torch.equal(v, live[k]) for k, v in trainer.net_G.state_dict().items())
+
+
+def test_checkpoint_round_trips(tmp_path):
+    trainer = make_trainer(str(tmp_path), use_ema='True')
+    trainer.net_G.train()
+    for batch in trainer.dataloaders['train']:
+        trainer._train_step(batch)
+    trainer.epoch_id, trainer.best_val_acc, trainer.best_epoch_id, trainer.stale_validations = 1, 0.75, 0, 1
+    trainer._save_checkpoint('last_ckpt.pt')
+    weights = {k: v.clone() for k, v in trainer.net_G.state_dict().items()}
+    shadow = [t.clone() for t in trainer.ema.shadow]
+    trainer.checkpoint_writer.close()
+    assert os.listdir(trainer.checkpoint_dir).count('last_ckpt.pt.tmp') == 0
+
+    resumed = make_trainer(str(tmp_path), use_ema='True')
+    resumed._load_checkpoint()
+    assert (resumed.epoch_to_start, resumed.best_val_acc, resumed.best_epoch_id, resumed.stale_validations) == \
+        (2, 0.75, 0, 1)
+    assert all(torch.equal(v, weights[k]) for k, v in resumed.net_G.state_dict().items())
+    assert all(torch.equal(a, b) for a, b in zip(resumed.ema.shadow, shadow))
+    assert resumed.ema.updates == trainer.ema.updates
+    assert resumed.optimizer_G.state_dict()['state'].keys() == trainer.optimizer_G.state_dict()['state'].keys()
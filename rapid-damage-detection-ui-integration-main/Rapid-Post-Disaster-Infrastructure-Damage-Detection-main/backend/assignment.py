@@ -0,0 +1,90 @@
+"""
+Responder Assignment - pair rescue teams with incidents in one solve
+
+Given the team x incident travel-cost matrix from the routing engine,
+find the pairing with the lowest total cost (rectangular assignment,
+scipy's Jonker-Volgenant variant of the Hungarian algorithm). Teams
+that can take several incidents are repeated once per unit of capacity,
+which makes the problem equivalent to a min-cost flow with team
+capacities. Severity weighting divides each incident's travel cost by
+its severity weight, so critical incidents win over closer minor ones.
+"""
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+# Incident.severity -> priority weight (unknown severities count as 1)
+SEVERITY_WEIGHTS = {
+    "CRITICAL": 4.0,
+    "SEVERE": 3.0,
+    "HIGH": 3.0,
+    "MODERATE": 2.0,
+    "MEDIUM": 2.0,
+    "LOW": 1.0,
+    "MINOR": 1.0,
+    "MINIMAL": 0.5,
+}
+
+
+def severity_weight(severity) -> float:
+    return SEVERITY_WEIGHTS.get(str(severity or "").upper(), 1.0)
+
+
+def assign(costs, capacities=None, weights=None):
+    """
+    costs: teams x incidents travel costs, inf where unreachable
+    capacities: incidents each team can take (default 1)
+    weights: priority weight per incident (default 1)
+    Returns (pairs, solver): pairs is a list of (team, incident) indices;
+    unreachable pairs are never assigned.
+    """
+    costs = np.asarray(costs, dtype=np.float64)
+    n_teams, n_incidents = costs.shape
+    capacities = np.ones(n_teams, dtype=np.int64) if capacities is None else np.asarray(capacities, dtype=np.int64)
+    effective = costs if weights is None else costs / np.asarray(weights, dtype=np.float64)[None, :]
+
+    # One row per unit of team capacity
+    team_of_row = np.repeat(np.arange(n_teams), capacities)
+    matrix = effective[team_of_row]
+    if matrix.size == 0:
+        return [], "none"
+    reachable = np.isfinite(matrix)
+    if not reachable.any():
+        return [], "none"
+
+    if HAS_SCIPY:
+        # Unreachable pairs get a cost larger than any all-reachable
+        # solution, so the solver maximizes reachable pairs first
+        big = (matrix[reachable].max() + 1.0) * (min(matrix.shape) + 1)
+        rows, cols = linear_sum_assignment(np.where(reachable, matrix, big))
+        solver = "hungarian"
+    else:
+        rows, cols = _greedy(matrix)
+        solver = "greedy"
+
+    keep = reachable[rows, cols]
+    return list(zip(team_of_row[rows[keep]].tolist(), cols[keep].tolist())), solver
+
+
+def _greedy(matrix):
+    # Fallback without scipy: take the cheapest remaining pair each time
+    order = np.argsort(matrix, axis=None)
+    used_rows, used_cols = set(), set()
+    rows, cols = [], []
+    limit = min(matrix.shape)
+    for flat in order.tolist():
+        r, c = divmod(flat, matrix.shape[1])
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        rows.append(r)
+        cols.append(c)
+        if len(rows) == limit:
+            break
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
@@ -0,0 +1,57 @@
+"""
+Assignment benchmark: teams x incidents cost matrix from the routing
+engine plus the severity-weighted assignment solve, on a synthetic
+street grid with random team and incident locations.
+
+Usage (from backend/):
+    python benchmarks/bench_assignment.py --rows 100 --cols 100 --teams 200 --incidents 2000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from assignment import SEVERITY_WEIGHTS, assign, severity_weight  # noqa: E402
+from road_graph import grid_graph  # noqa: E402
+from routing import RoutingEngine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--cols", type=int, default=100)
+    parser.add_argument("--teams", type=int, default=200)
+    parser.add_argument("--incidents", type=int, default=2000)
+    parser.add_argument("--capacity", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = RoutingEngine(graph=grid_graph(args.rows, args.cols, seed=args.seed, arterial_every=8))
+    graph = engine.graph
+    rng = random.Random(args.seed)
+    teams = [graph.node_ids[rng.randrange(graph.num_nodes)] for _ in range(args.teams)]
+    incidents = [graph.node_ids[rng.randrange(graph.num_nodes)] for _ in range(args.incidents)]
+    severities = [rng.choice(list(SEVERITY_WEIGHTS)) for _ in incidents]
+    print(f"grid {args.rows}x{args.cols}: {graph.num_nodes} nodes; {args.teams} teams x {args.incidents} incidents")
+
+    engine.cost_matrix(teams[:1], incidents[:1])  # build the csgraph outside the timing
+    t0 = time.perf_counter()
+    costs = engine.cost_matrix(teams, incidents)
+    t_matrix = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pairs, solver = assign(costs, [args.capacity] * args.teams, [severity_weight(s) for s in severities])
+    t_solve = time.perf_counter() - t0
+    engine.close()
+
+    print(f"cost matrix  {1000 * t_matrix:8.1f} ms")
+    print(f"{solver:<12} {1000 * t_solve:8.1f} ms ({len(pairs)} pairs)")
+    print(f"total        {1000 * (t_matrix + t_solve):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
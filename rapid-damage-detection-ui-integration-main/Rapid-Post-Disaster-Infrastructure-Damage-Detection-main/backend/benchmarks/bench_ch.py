@@ -0,0 +1,96 @@
+"""
+Contraction hierarchy benchmark: preprocessing, save/load, query latency
+against CSR A* (routing.astar) on the same graph, and re-customization
+after road closures. Every CH answer is checked against A*.
+
+The grid gets an arterial road every 8th row/column so it has the
+hierarchy of a real street network (a uniform grid is CH's worst case).
+
+Usage (from backend/):
+    python benchmarks/bench_ch.py --rows 100 --cols 100 --queries 200
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from contraction import ContractionHierarchy  # noqa: E402
+from road_graph import grid_graph  # noqa: E402
+from routing import astar  # noqa: E402
+
+
+def compare(graph, ch, pairs):
+    t_ch, t_astar = [], []
+    for s, t in pairs:
+        t0 = time.perf_counter()
+        _, cost = ch.query(s, t)
+        t_ch.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        _, expected = astar(graph, s, t)
+        t_astar.append(time.perf_counter() - t0)
+
+        if cost != expected and abs(cost - expected) > 1e-6 * max(1.0, expected):
+            raise AssertionError(f"cost mismatch {s}->{t}: {cost} vs {expected}")
+    return t_ch, t_astar
+
+
+def summary(times):
+    times = sorted(times)
+    return f"mean {1000 * sum(times) / len(times):7.2f} ms  p50 {1000 * times[len(times) // 2]:7.2f} ms  max {1000 * times[-1]:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--cols", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--blocked", type=int, default=50, help="edges closed before re-customizing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph = grid_graph(args.rows, args.cols, seed=args.seed, arterial_every=8)
+    graph.lists()
+    print(f"grid {args.rows}x{args.cols}: {graph.num_nodes} nodes, {graph.num_arcs} arcs")
+
+    t0 = time.perf_counter()
+    ch = ContractionHierarchy.build(graph)
+    print(f"preprocessing {time.perf_counter() - t0:.1f}s, {ch.num_shortcuts} shortcuts")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph.ch.npz")
+        ch.save(path)
+        t0 = time.perf_counter()
+        ch = ContractionHierarchy.load(path)
+        print(f"saved {os.path.getsize(path) / 1e6:.1f} MB, loaded in {1000 * (time.perf_counter() - t0):.1f} ms")
+
+    rng = random.Random(args.seed)
+    pairs = [(rng.randrange(graph.num_nodes), rng.randrange(graph.num_nodes)) for _ in range(args.queries)]
+    ch.query(*pairs[0])  # build the unpacking tables outside the timing
+    t_ch, t_astar = compare(graph, ch, pairs)
+    print(f"A*                {summary(t_astar)}")
+    print(f"CH                {summary(t_ch)}")
+    print(f"speedup {sum(t_astar) / sum(t_ch):.1f}x, costs identical on {len(pairs)} queries")
+
+    edges = rng.sample(range(graph.num_edges), args.blocked)
+    closed = np.flatnonzero(np.isin(graph.arc_edge, edges))
+    graph.set_arc_weights(closed, np.full(len(closed), math.inf))
+    t0 = time.perf_counter()
+    ch = ch.recontract(graph)
+    print(f"re-customized after closing {args.blocked} edges in {time.perf_counter() - t0:.1f}s")
+    ch.query(*pairs[0])
+    t_ch, t_astar = compare(graph, ch, pairs)
+    print(f"CH after closures {summary(t_ch)}, costs identical to A*")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Damage-map benchmark: sample a large probability raster along every edge
+of a synthetic street grid and apply the penalties to the routing weights.
+
+The default 708 x 708 grid has ~1M edges; the raster is 8000 x 8000.
+
+Usage (from backend/):
+    python benchmarks/bench_damage.py --rows 708 --cols 708 --raster 8000
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from damage_costs import DamageRaster, sample_edges  # noqa: E402
+from road_graph import grid_graph  # noqa: E402
+from routing import RoutingEngine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=708)
+    parser.add_argument("--cols", type=int, default=708)
+    parser.add_argument("--raster", type=int, default=8000, help="raster side in pixels")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph = grid_graph(args.rows, args.cols, seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    # Mostly low probabilities with a tail of heavily damaged pixels
+    probability = rng.random((args.raster, args.raster), dtype=np.float32) ** 8
+    raster = DamageRaster(probability, (graph.lng.min(), graph.lat.min(), graph.lng.max(), graph.lat.max()))
+    print(f"grid {args.rows}x{args.cols}: {graph.num_edges} edges; raster {args.raster}x{args.raster}")
+
+    t0 = time.perf_counter()
+    edges, _, _ = sample_edges(graph, raster)
+    print(f"sample_edges   {time.perf_counter() - t0:6.2f} s ({len(edges)} edges)")
+
+    engine = RoutingEngine(graph=graph)
+    t0 = time.perf_counter()
+    report = engine.apply_damage(raster)
+    print(f"apply_damage   {time.perf_counter() - t0:6.2f} s "
+          f"(sample {report['sample_ms'] / 1000:.2f} s, reweight {report['repair_ms'] / 1000:.2f} s, "
+          f"{report['edges_blocked']} edges closed)")
+
+
+if __name__ == "__main__":
+    main()
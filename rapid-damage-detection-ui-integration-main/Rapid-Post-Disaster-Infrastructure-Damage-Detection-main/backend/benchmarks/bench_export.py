@@ -0,0 +1,90 @@
+"""
+Bulk export benchmark: throughput and peak memory of the incidents and
+zones layers in each format, on fresh databases of increasing size.
+Each export runs in a fresh process so its peak RSS can be measured;
+a flat peak across sizes means memory is bounded by the chunk size.
+
+Usage (from backend/):
+    python benchmarks/bench_export.py --sizes 100000 1000000
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_unused.db"))
+
+import database  # noqa: E402
+import exports  # noqa: E402
+import incidents  # noqa: E402
+
+
+def seed(path, n, rng):
+    engine = database.make_engine(f"sqlite:///{path}")
+    database.Base.metadata.create_all(bind=engine)
+    incidents.ensure_spatial_index(engine)
+    with engine.begin() as conn:
+        for start in range(0, n, incidents.BULK_CHUNK_SIZE):
+            rows = [(i, {"type": "DAMAGE", "severity": rng.choice(["CRITICAL", "HIGH", "MODERATE", "LOW"]),
+                         "confidence": rng.random(), "lat": 34.0 + rng.random() * 0.2,
+                         "lng": -118.4 + rng.random() * 0.2, "description": "benchmark"})
+                    for i in range(start, min(n, start + incidents.BULK_CHUNK_SIZE))]
+            incidents.bulk_insert(conn, rows)
+    engine.dispose()
+
+
+def measure(path, layer, fmt, results):
+    engine = database.make_engine(f"sqlite:///{path}")
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    if layer == "incidents":
+        fields, chunks = exports.INCIDENT_FIELDS, exports.incident_chunks(engine)
+    else:
+        fields, chunks = exports.ZONE_FIELDS, exports.zone_chunks(engine, zone_m=250)
+    size = 0
+    with open(os.devnull, "wb") as out:
+        for data in exports.export(fields, chunks, fmt):
+            size += len(data)
+            out.write(data)
+    elapsed = time.perf_counter() - t0
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base) / 1024  # KB on Linux
+    results.put((elapsed, peak, size))
+
+
+def run(*args):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=args + (results,))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--formats", nargs="+", default=[f for f in exports.WRITERS
+                                                          if f != "parquet" or exports.HAS_PYARROW])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'incidents':>10} {'layer':<10} {'format':<8} {'seconds':>8} {'rows/s':>9} {'peak MB':>8} {'out MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = os.path.join(tmp, f"export-{n}.db")
+            seed(path, n, random.Random(args.seed))
+            for layer in ("incidents", "zones"):
+                for fmt in args.formats:
+                    elapsed, peak, size = run(path, layer, fmt)
+                    print(f"{n:>10} {layer:<10} {fmt:<8} {elapsed:8.2f} {n / elapsed:9.0f} {peak:8.1f} {size / 1e6:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
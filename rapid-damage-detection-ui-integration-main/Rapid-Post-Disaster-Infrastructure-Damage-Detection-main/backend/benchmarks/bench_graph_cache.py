@@ -0,0 +1,93 @@
+"""
+Graph cache benchmark: startup from a GeoJSON road network (parse, build
+CSR arrays and spatial indexes) against memory-mapping the compiled
+graph cache (plus building its KD-trees on the first snap), on a
+synthetic street grid written to a temp directory.
+
+Usage (from backend/):
+    python benchmarks/bench_graph_cache.py --rows 500 --cols 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from graph_cache import load_cached_network, load_graph  # noqa: E402
+from road_graph import grid_graph, load_road_network  # noqa: E402
+from routing import astar  # noqa: E402
+
+
+def write_geojson(graph, path):
+    # One LineString per undirected edge
+    edges, first_arc = np.unique(graph.arc_edge, return_index=True)
+    u, v = graph.arc_src[first_arc], graph.indices[first_arc]
+    features = [
+        {"type": "Feature", "properties": {"id": int(e)},
+         "geometry": {"type": "LineString", "coordinates": [[a_lng, a_lat], [b_lng, b_lat]]}}
+        for e, a_lat, a_lng, b_lat, b_lng in zip(
+            edges.tolist(), graph.lat[u].tolist(), graph.lng[u].tolist(), graph.lat[v].tolist(), graph.lng[v].tolist())
+    ]
+    with open(path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--cols", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        network = os.path.join(tmp, "roads.geojson")
+        write_geojson(grid_graph(args.rows, args.cols, seed=args.seed), network)
+        print(f"grid {args.rows}x{args.cols}: GeoJSON {os.path.getsize(network) / 1e6:.1f} MB")
+
+        t0 = time.perf_counter()
+        parsed = load_road_network(network)
+        parsed.node_index().tree
+        parsed.edge_index().tree
+        t_parse = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        load_cached_network(network)  # cold: parse and write the cache
+        t_write = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        cached = load_cached_network(network)
+        t_map = time.perf_counter() - t0
+        if load_graph(network + ".graph") is None:
+            raise AssertionError("cache was not written")
+        t0 = time.perf_counter()
+        cached.node_index().tree
+        cached.edge_index().tree
+        t_trees = time.perf_counter() - t0
+
+        for name in ("indptr", "indices", "length", "weight", "arc_edge", "edge_road", "lat", "lng"):
+            if not np.array_equal(getattr(parsed, name), getattr(cached, name)):
+                raise AssertionError(f"{name} differs")
+        if parsed.node_ids != cached.node_ids:
+            raise AssertionError("node ids differ")
+        points = (parsed.lat[:1000] + 1e-4, parsed.lng[:1000] - 1e-4)
+        if not np.array_equal(parsed.nearest_nodes(*points)[0], cached.nearest_nodes(*points)[0]):
+            raise AssertionError("snapping differs")
+        if astar(parsed, 0, parsed.num_nodes - 1)[1] != astar(cached, 0, cached.num_nodes - 1)[1]:
+            raise AssertionError("route cost differs")
+
+        print(f"parse + build indexes  {t_parse:8.2f} s")
+        print(f"first start (+ write)  {t_write:8.2f} s, cache {os.path.getsize(network + '.graph') / 1e6:.1f} MB")
+        print(f"cached start (mmap)    {t_map:8.2f} s (incl. source checksum)")
+        print(f"KD-trees on first snap {t_trees:8.2f} s")
+        print(f"speedup {t_parse / t_map:.1f}x, graph and indexes identical")
+
+
+if __name__ == "__main__":
+    main()
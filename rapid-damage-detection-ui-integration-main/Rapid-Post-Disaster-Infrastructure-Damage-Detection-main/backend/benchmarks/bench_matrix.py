@@ -0,0 +1,67 @@
+"""
+Matrix routing benchmark: RoutingEngine.route_matrix (one tree per source,
+split across worker processes) against one A* query per source/target
+pair, as dispatch had to do with /route/compute.
+
+Usage (from backend/):
+    python benchmarks/bench_matrix.py --rows 300 --cols 300 --sources 8 --targets 200
+    ROUTING_WORKERS=1 python benchmarks/bench_matrix.py   # single process
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import routing  # noqa: E402
+from road_graph import grid_graph  # noqa: E402
+from routing import RoutingEngine, astar  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--cols", type=int, default=300)
+    parser.add_argument("--sources", type=int, default=8)
+    parser.add_argument("--targets", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = RoutingEngine(graph=grid_graph(args.rows, args.cols, seed=args.seed))
+    graph = engine.graph
+    graph.lists()
+
+    rng = random.Random(args.seed)
+    sources = [graph.node_ids[rng.randrange(graph.num_nodes)] for _ in range(args.sources)]
+    targets = [graph.node_ids[rng.randrange(graph.num_nodes)] for _ in range(args.targets)]
+    print(f"grid {args.rows}x{args.cols}: {graph.num_nodes} nodes; "
+          f"{args.sources} x {args.targets} matrix, {routing.ROUTING_WORKERS} workers")
+
+    engine.route_matrix(sources[:1], targets[:1])  # build csgraph / pool outside the timing
+    t0 = time.perf_counter()
+    result = engine.route_matrix(sources, targets)
+    t_matrix = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    pairs = 0
+    for i, s in enumerate(sources):
+        for j, t in enumerate(targets):
+            _, cost = astar(graph, graph.index_of(s), graph.index_of(t))
+            expected = result["costs"][i][j]
+            if (expected is None) != (cost == math.inf) or (expected is not None and abs(cost - expected) > 1e-6):
+                raise AssertionError(f"cost mismatch {s}->{t}: {cost} vs {expected}")
+            pairs += 1
+    t_pairs = time.perf_counter() - t0
+    engine.close()
+
+    print(f"pairwise A*     {t_pairs:8.2f} s ({1000 * t_pairs / pairs:.1f} ms per pair)")
+    print(f"route_matrix    {t_matrix:8.2f} s")
+    print(f"speedup {t_pairs / t_matrix:.1f}x, costs identical on {pairs} pairs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+PDF report benchmark: the streamed, page-chunked renderer writing to a
+file (pdf.render_pdf_report) against the previous approach of one table
+for all incidents built into an in-memory buffer. Each run happens in a
+fresh process so its peak RSS can be measured.
+
+Usage (from backend/):
+    python benchmarks/bench_reports.py --sizes 10000 50000 --baseline-max 10000
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from reportlab.lib.pagesizes import letter  # noqa: E402
+from reportlab.platypus import SimpleDocTemplate, Table  # noqa: E402
+
+from pdf import TABLE_HEADER, TABLE_STYLE, _row, render_pdf_report  # noqa: E402
+
+
+def incidents(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield {"id": i + 1, "type": rng.choice(["DAMAGE", "BLOCKED", "FLOOD"]),
+               "severity": rng.choice(["CRITICAL", "HIGH", "MODERATE", "LOW"]),
+               "coordinates": {"lat": 34 + rng.random() / 10, "lng": -118.3 + rng.random() / 10}}
+
+
+def single_table(n):
+    # Previous generate_pdf_report: the whole list in one Table, into a BytesIO
+    data = [TABLE_HEADER] + [_row(inc) for inc in incidents(n)]
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    table = Table(data)
+    table.setStyle(TABLE_STYLE)
+    doc.build([table])
+    return len(buffer.getvalue())
+
+
+def streamed(n):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "report.pdf")
+        render_pdf_report(incidents(n), path)
+        return os.path.getsize(path)
+
+
+def measure(fn, n, results):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    size = fn(n)
+    elapsed = time.perf_counter() - t0
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base) / 1024  # KB on Linux
+    results.put((elapsed, peak, size))
+
+
+def run(fn, n):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(fn, n, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--baseline-max", type=int, default=10000,
+                        help="largest size to run the single-table baseline on (it grows quadratically)")
+    args = parser.parse_args()
+
+    print(f"{'incidents':>10} {'renderer':<14} {'seconds':>8} {'s/10k':>7} {'peak MB':>8} {'PDF MB':>7}")
+    for n in args.sizes:
+        variants = [("streamed", streamed)] + ([("single table", single_table)] if n <= args.baseline_max else [])
+        for name, fn in variants:
+            elapsed, peak, size = run(fn, n)
+            print(f"{n:>10} {name:<14} {elapsed:8.2f} {elapsed * 10000 / n:7.2f} {peak:8.1f} {size / 1e6:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
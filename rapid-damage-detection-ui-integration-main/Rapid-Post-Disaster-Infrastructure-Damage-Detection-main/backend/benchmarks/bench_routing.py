@@ -0,0 +1,82 @@
+"""
+Routing benchmark: CSR A* (routing.astar) against the previous networkx
+path (dijkstra_path + dijkstra_path_length) on a synthetic street grid.
+
+The default 708 x 708 grid has ~1M undirected edges (2M arcs).
+
+Usage (from backend/):
+    python benchmarks/bench_routing.py --rows 708 --cols 708 --queries 20
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import networkx as nx  # noqa: E402
+
+from road_graph import grid_graph  # noqa: E402
+from routing import astar  # noqa: E402
+
+
+def to_networkx(graph):
+    g = nx.Graph()
+    for u in range(graph.num_nodes):
+        for k in range(graph.indptr[u], graph.indptr[u + 1]):
+            v = int(graph.indices[k])
+            if u < v:
+                g.add_edge(u, v, weight=float(graph.weight[k]))
+    return g
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=708)
+    parser.add_argument("--cols", type=int, default=708)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    graph = grid_graph(args.rows, args.cols, seed=args.seed)
+    graph.lists()
+    t_csr = time.perf_counter() - t0
+    print(f"grid {args.rows}x{args.cols}: {graph.num_nodes} nodes, {graph.num_edges} edges, {graph.num_arcs} arcs")
+    print(f"CSR build {t_csr:.2f}s, arrays {graph.nbytes / 1e6:.1f} MB")
+
+    t0 = time.perf_counter()
+    g = to_networkx(graph)
+    print(f"networkx build {time.perf_counter() - t0:.2f}s")
+
+    rng = random.Random(args.seed)
+    pairs = [(rng.randrange(graph.num_nodes), rng.randrange(graph.num_nodes)) for _ in range(args.queries)]
+
+    t_astar, t_nx = [], []
+    for s, t in pairs:
+        t0 = time.perf_counter()
+        path, cost = astar(graph, s, t)
+        t_astar.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        nx_path = nx.dijkstra_path(g, s, t, weight="weight")
+        nx_cost = nx.dijkstra_path_length(g, s, t, weight="weight")
+        t_nx.append(time.perf_counter() - t0)
+
+        if abs(cost - nx_cost) > 1e-6 * max(1.0, nx_cost):
+            raise AssertionError(f"cost mismatch {s}->{t}: {cost} vs {nx_cost}")
+        del nx_path
+
+    def summary(times):
+        times = sorted(times)
+        return f"mean {1000 * sum(times) / len(times):8.1f} ms  p50 {1000 * times[len(times) // 2]:8.1f} ms  max {1000 * times[-1]:8.1f} ms"
+
+    print(f"networkx Dijkstra x2  {summary(t_nx)}")
+    print(f"CSR A* (haversine)    {summary(t_astar)}")
+    print(f"speedup {sum(t_nx) / sum(t_astar):.1f}x, costs identical on {len(pairs)} queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Snapshot benchmark: route queries on reader threads while a writer keeps
+closing and reopening roads. Measures query latency, the cost of
+publishing a new graph snapshot, and checks every answer against A* on
+the snapshot version the response reports.
+
+Usage (from backend/):
+    python benchmarks/bench_snapshots.py --rows 300 --cols 300 --readers 4 --updates 50
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from road_graph import grid_graph  # noqa: E402
+from routing import RoutingEngine, astar  # noqa: E402
+
+
+def summary(times):
+    times = sorted(times)
+    return f"mean {1000 * sum(times) / len(times):8.2f} ms  p50 {1000 * times[len(times) // 2]:8.2f} ms  max {1000 * times[-1]:8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--cols", type=int, default=300)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--updates", type=int, default=50)
+    parser.add_argument("--edges", type=int, default=50, help="edges changed per update")
+    parser.add_argument("--origins", type=int, default=4, help="active origins (trees repaired per update)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = RoutingEngine(graph=grid_graph(args.rows, args.cols, seed=args.seed))
+    graph = engine.graph
+    graph.lists()
+    rng = random.Random(args.seed)
+    origins = [graph.node_ids[rng.randrange(graph.num_nodes)] for _ in range(args.origins)]
+    engine.activate_origins(origins)
+    print(f"grid {args.rows}x{args.cols}: {graph.num_nodes} nodes; {args.readers} readers, "
+          f"{args.updates} updates of {args.edges} edges, {args.origins} active origins")
+
+    snapshots = {engine.snapshot.version: engine.snapshot}
+    answers, latencies = [], []
+    stop = threading.Event()
+
+    def reader(seed):
+        r = random.Random(seed)
+        while not stop.is_set():
+            source = r.choice(origins) if r.random() < 0.5 else graph.node_ids[r.randrange(graph.num_nodes)]
+            target = graph.node_ids[r.randrange(graph.num_nodes)]
+            t0 = time.perf_counter()
+            route = engine.compute_route(source, target)
+            latencies.append(time.perf_counter() - t0)
+            if route is not None:
+                answers.append((source, target, route["weights_version"], route["total_cost"]))
+
+    threads = [threading.Thread(target=reader, args=(args.seed + i,)) for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    publish = []
+    for i in range(args.updates):
+        edges = rng.sample(range(graph.num_edges), args.edges)
+        report = engine.set_edge_status(edges, "BLOCKED" if i % 2 == 0 else "RESTRICTED")
+        publish.append(report["repair_ms"] / 1000)
+        snapshots[engine.snapshot.version] = engine.snapshot
+        time.sleep(0.02)
+    stop.set()
+    for t in threads:
+        t.join()
+    engine.close()
+
+    print(f"route query       {summary(latencies)} ({len(latencies)} queries)")
+    print(f"publish snapshot  {summary(publish)}")
+
+    checked = answers[:: max(1, len(answers) // 200)]
+    for source, target, version, cost in checked:
+        snapshot = snapshots[version]
+        _, expected = astar(snapshot.graph, snapshot.graph.index_of(source), snapshot.graph.index_of(target))
+        if abs(cost - expected) > 1e-6 * max(1.0, expected):
+            raise AssertionError(f"{source}->{target} at version {version}: {cost} vs {expected}")
+    print(f"{len(checked)} answers identical to A* on their reported snapshot version")
+
+
+if __name__ == "__main__":
+    main()
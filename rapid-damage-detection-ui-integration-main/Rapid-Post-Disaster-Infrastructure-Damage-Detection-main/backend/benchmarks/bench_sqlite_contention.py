@@ -0,0 +1,161 @@
+"""
+SQLite contention benchmark: N reader threads run viewport (bbox) queries
+while M writer threads report single incidents, for a fixed duration.
+
+Compares three setups on a fresh database each:
+  default - plain create_engine(), writers commit their own transactions
+  wal     - tuned engine (WAL, busy_timeout, pool), writers commit their
+            own BEGIN IMMEDIATE transactions
+  queue   - tuned engine, writers hand writes to the write-behind queue
+            (up to 64 pending each) and one thread commits them in batches
+
+Write latency is submit-to-commit.
+
+Usage (from backend/):
+    python benchmarks/bench_sqlite_contention.py --readers 8 --writers 4 --seconds 10
+"""
+
+import argparse
+import collections
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_unused.db"))
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import database  # noqa: E402
+import incidents  # noqa: E402
+from write_queue import WriteBehindQueue  # noqa: E402
+
+
+MAX_IN_FLIGHT = 64
+
+
+def _random_incident():
+    return {
+        "type": "DAMAGE",
+        "severity": random.choice(["CRITICAL", "MODERATE", "LOW"]),
+        "lat": 34.0 + random.random() * 0.2,
+        "lng": -118.4 + random.random() * 0.2,
+        "description": "benchmark",
+    }
+
+
+def _percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(mode, readers, writers, seconds, seed_rows):
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_sqlite_"), "bench.db")
+    engine = database.make_engine(f"sqlite:///{path}", tuned=(mode != "default"))
+    database.Base.metadata.create_all(bind=engine)
+    incidents.ensure_spatial_index(engine)
+    with engine.begin() as conn:
+        rows = [(i, _random_incident()) for i in range(seed_rows)]
+        for i in range(0, seed_rows, incidents.BULK_CHUNK_SIZE):
+            incidents.bulk_insert(conn, rows[i:i + incidents.BULK_CHUNK_SIZE])
+
+    Session = sessionmaker(bind=engine)
+    queue = WriteBehindQueue(engine) if mode == "queue" else None
+    stop = threading.Event()
+    stats = {"reads": 0, "writes": 0, "errors": 0, "read_ms": [], "write_ms": []}
+    lock = threading.Lock()
+
+    def reader():
+        db = Session()
+        local_ms = []
+        while not stop.is_set():
+            lat, lng = 34.0 + random.random() * 0.19, -118.4 + random.random() * 0.19
+            t0 = time.perf_counter()
+            try:
+                incidents.query_incidents(db, bbox=(lng, lat, lng + 0.01, lat + 0.01))
+                db.rollback()
+                local_ms.append((time.perf_counter() - t0) * 1000)
+            except Exception as e:
+                db.rollback()
+                with lock:
+                    stats["errors"] += 1
+                    stats["last_error"] = str(e)
+        db.close()
+        with lock:
+            stats["reads"] += len(local_ms)
+            stats["read_ms"].extend(local_ms)
+
+    def writer():
+        local_ms = []
+        in_flight = collections.deque()
+        write_engine = engine.execution_options(sqlite_begin="IMMEDIATE")
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                if queue is not None:
+                    # Write-behind: keep up to MAX_IN_FLIGHT writes pending
+                    future = queue.submit(incidents.insert_incident, _random_incident())
+                    future.add_done_callback(
+                        lambda f, t0=t0: local_ms.append((time.perf_counter() - t0) * 1000)
+                    )
+                    in_flight.append(future)
+                    if len(in_flight) >= MAX_IN_FLIGHT:
+                        in_flight.popleft().result()
+                else:
+                    with write_engine.begin() as conn:
+                        incidents.insert_incident(conn, _random_incident())
+                    local_ms.append((time.perf_counter() - t0) * 1000)
+            except Exception as e:
+                with lock:
+                    stats["errors"] += 1
+                    stats["last_error"] = str(e)
+        for future in in_flight:
+            future.exception()
+        with lock:
+            stats["writes"] += len(local_ms)
+            stats["write_ms"].extend(local_ms)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    if queue is not None:
+        queue.stop()
+    engine.dispose()
+
+    print(f"{mode:8s} reads/s {stats['reads'] / seconds:9.0f}  "
+          f"read p50/p99 {_percentile(stats['read_ms'], .5):6.2f}/{_percentile(stats['read_ms'], .99):7.2f} ms  "
+          f"writes/s {stats['writes'] / seconds:8.0f}  "
+          f"write p50/p99 {_percentile(stats['write_ms'], .5):6.2f}/{_percentile(stats['write_ms'], .99):7.2f} ms  "
+          f"errors {stats['errors']}"
+          + (f"  (avg batch {queue.writes / max(queue.batches, 1):.1f})" if queue else ""))
+    if "last_error" in stats:
+        print(f"         last error: {stats['last_error'][:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed-rows", type=int, default=100000)
+    parser.add_argument("--modes", default="default,wal,queue")
+    args = parser.parse_args()
+
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds}s, {args.seed_rows} seeded incidents")
+    for mode in args.modes.split(","):
+        run(mode, args.readers, args.writers, args.seconds, args.seed_rows)
+
+
+if __name__ == "__main__":
+    main()
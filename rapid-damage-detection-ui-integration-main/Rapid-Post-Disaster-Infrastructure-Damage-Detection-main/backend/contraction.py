@@ -0,0 +1,378 @@
+"""
+Contraction Hierarchies - preprocessed road graph for fast point-to-point queries
+
+Preprocessing contracts the nodes one by one in order of importance. When
+a node is removed, shortcut arcs are added between its neighbours where
+the path through it is the only shortest one (checked with a bounded
+"witness" search). Each node's arcs to higher-ranked nodes are kept:
+
+    up[x]:   arcs x -> v with rank[v] > rank[x]
+    down[x]: arcs u -> x with rank[u] > rank[x] (stored at x, head u)
+
+A query then runs two small Dijkstra searches that only go upward, one
+forward from the source over up[] and one backward from the target over
+down[], and meets at the highest node of the shortest path. Shortcuts
+remember the node they bypass ("mid"), so paths unpack to road nodes.
+
+The node order is the expensive part; when weights change (road
+closures) the hierarchy is re-contracted in the stored order, which is
+exact for the new weights and skips the ordering. Every node is
+contracted again, not just the ones near the changed arcs: a witness
+search can cross any arc, so a single change may alter shortcuts
+anywhere. The router therefore coalesces road updates, re-contracting
+once for all those that arrived while the previous run was busy.
+
+Build offline and save next to the network (from backend/):
+    python contraction.py roads.osm              # writes roads.osm.ch.npz
+"""
+
+import argparse
+import hashlib
+import heapq
+import math
+import time
+
+import numpy as np
+
+# Witness searches give up after settling this many nodes; a missed
+# witness only costs an unnecessary shortcut, never a wrong answer
+WITNESS_SETTLE_LIMIT = 60
+
+
+def graph_checksum(graph, weights=None) -> str:
+    """Checksum of the graph topology, plus the given arc weights if any"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(graph.indptr).tobytes())
+    h.update(np.ascontiguousarray(graph.indices).tobytes())
+    if weights is not None:
+        h.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+class _Contractor:
+    """Remaining graph during contraction, as dicts head -> (weight, mid)"""
+
+    def __init__(self, graph, weights):
+        n = graph.num_nodes
+        self.out_adj = [dict() for _ in range(n)]
+        self.in_adj = [dict() for _ in range(n)]
+        for u, v, w in zip(graph.arc_src.tolist(), graph.indices.tolist(), weights.tolist()):
+            if u == v or w == math.inf:
+                continue  # self loops never help; blocked arcs are absent
+            if w < self.out_adj[u].get(v, (math.inf,))[0]:
+                self.out_adj[u][v] = (w, -1)
+                self.in_adj[v][u] = (w, -1)
+        self.up = []    # (x, v, w, mid)
+        self.down = []  # (x, u, w, mid)
+
+    def _witness(self, source, exclude, targets, limit):
+        out_adj = self.out_adj
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        remaining = set(targets)
+        settled = 0
+        while heap and remaining:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if d > limit:
+                break
+            remaining.discard(u)
+            settled += 1
+            if settled > WITNESS_SETTLE_LIMIT:
+                break
+            for v, (w, _) in out_adj[u].items():
+                if v == exclude:
+                    continue
+                nd = d + w
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist
+
+    def shortcuts(self, x):
+        """Shortcuts (u, v, weight) needed if x were contracted now"""
+        outs = self.out_adj[x]
+        result = []
+        for u, (wu, _) in self.in_adj[x].items():
+            targets = {v: wu + wv for v, (wv, _) in outs.items() if v != u}
+            if not targets:
+                continue
+            dist = self._witness(u, x, targets, max(targets.values()))
+            result.extend((u, v, w) for v, w in targets.items() if dist.get(v, math.inf) > w)
+        return result
+
+    def contract(self, x):
+        out_adj, in_adj = self.out_adj, self.in_adj
+        shortcuts = self.shortcuts(x)
+        # Every remaining neighbour ranks above x
+        self.up.extend((x, v, w, m) for v, (w, m) in out_adj[x].items())
+        self.down.extend((x, u, w, m) for u, (w, m) in in_adj[x].items())
+        for v in out_adj[x]:
+            del in_adj[v][x]
+        for u in in_adj[x]:
+            del out_adj[u][x]
+        neighbours = set(out_adj[x]) | set(in_adj[x])
+        out_adj[x] = {}
+        in_adj[x] = {}
+        for u, v, w in shortcuts:
+            if w < out_adj[u].get(v, (math.inf,))[0]:
+                out_adj[u][v] = (w, x)
+                in_adj[v][u] = (w, x)
+        return neighbours
+
+
+def _csr(n, arcs):
+    """(indptr, head, weight, mid) with arcs grouped by their first field"""
+    if arcs:
+        tail, head, weight, mid = (np.array(col) for col in zip(*arcs))
+    else:
+        tail = head = mid = np.zeros(0, dtype=np.int64)
+        weight = np.zeros(0, dtype=np.float64)
+    order = np.argsort(tail, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tail, minlength=n), out=indptr[1:])
+    return (indptr, head[order].astype(np.int32), weight[order].astype(np.float64),
+            mid[order].astype(np.int32))
+
+
+class ContractionHierarchy:
+    def __init__(self, order, up, down, topology: str, weights: str):
+        """
+        order: node indices in contraction order (rank = position)
+        up, down: (indptr, head, weight, mid) CSR arrays
+        topology, weights: checksums of the graph it was built from
+        """
+        self.order = np.asarray(order, dtype=np.int32)
+        self.rank = np.empty(len(self.order), dtype=np.int32)
+        self.rank[self.order] = np.arange(len(self.order), dtype=np.int32)
+        self.up = up
+        self.down = down
+        self.topology = topology
+        self.weights = weights
+        self._lists = None
+        self._unpack_cache = None
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.order)
+
+    @property
+    def num_shortcuts(self) -> int:
+        return int((self.up[3] >= 0).sum() + (self.down[3] >= 0).sum())
+
+    # --- Preprocessing ---
+
+    @classmethod
+    def build(cls, graph, weights=None):
+        """
+        Order and contract every node (lazy-update edge-difference order).
+        weights: arc weights to use instead of graph.weight
+        """
+        weights = graph.weight if weights is None else weights
+        c = _Contractor(graph, weights)
+        n = graph.num_nodes
+        deleted = [0] * n
+
+        def priority(x):
+            edge_difference = len(c.shortcuts(x)) - len(c.in_adj[x]) - len(c.out_adj[x])
+            return edge_difference + deleted[x]
+
+        heap = [(priority(x), x) for x in range(n)]
+        heapq.heapify(heap)
+        order = []
+        while heap:
+            _, x = heapq.heappop(heap)
+            p = priority(x)
+            if heap and p > heap[0][0]:
+                heapq.heappush(heap, (p, x))
+                continue
+            for y in c.contract(x):
+                deleted[y] += 1
+            order.append(x)
+        return cls._finish(graph, weights, order, c)
+
+    def recontract(self, graph, weights=None):
+        """
+        Same node order, new weights (e.g. after road closures). This is a
+        full contraction pass minus the ordering, whatever the number of
+        changed arcs, so callers should batch updates rather than call it
+        per change.
+        """
+        if graph_checksum(graph) != self.topology:
+            raise ValueError("graph topology changed; rebuild the hierarchy")
+        weights = graph.weight if weights is None else weights
+        c = _Contractor(graph, weights)
+        for x in self.order.tolist():
+            c.contract(x)
+        return self._finish(graph, weights, self.order, c)
+
+    @classmethod
+    def _finish(cls, graph, weights, order, c):
+        n = graph.num_nodes
+        return cls(order, _csr(n, c.up), _csr(n, c.down),
+                   graph_checksum(graph), graph_checksum(graph, weights))
+
+    # --- Serialization ---
+
+    def save(self, path):
+        np.savez(
+            path,
+            order=self.order,
+            up_indptr=self.up[0], up_head=self.up[1], up_weight=self.up[2], up_mid=self.up[3],
+            down_indptr=self.down[0], down_head=self.down[1], down_weight=self.down[2], down_mid=self.down[3],
+            topology=np.array(self.topology), weights=np.array(self.weights),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data["order"],
+                (data["up_indptr"], data["up_head"], data["up_weight"], data["up_mid"]),
+                (data["down_indptr"], data["down_head"], data["down_weight"], data["down_mid"]),
+                str(data["topology"]), str(data["weights"]),
+            )
+
+    # --- Queries ---
+
+    def lists(self):
+        """Search arrays as Python lists (much faster to index per element)"""
+        if self._lists is None:
+            up_indptr, up_head, up_weight, _ = self.up
+            down_indptr, down_head, down_weight, _ = self.down
+            self._lists = tuple(a.tolist() for a in (
+                up_indptr, up_head, up_weight, down_indptr, down_head, down_weight))
+        return self._lists
+
+    def query(self, source: int, target: int):
+        """Returns (node index path, cost), or (None, inf) if unreachable"""
+        if source == target:
+            return [source], 0.0
+        up_ptr, up_head, up_w, dn_ptr, dn_head, dn_w = self.lists()
+        push, pop = heapq.heappush, heapq.heappop
+        inf = math.inf
+
+        dist_f, dist_b = {source: 0.0}, {target: 0.0}
+        arc_f, arc_b = {source: -1}, {target: -1}
+        heap_f, heap_b = [(0.0, source)], [(0.0, target)]
+        best, meet = inf, -1
+
+        while True:
+            top_f = heap_f[0][0] if heap_f else inf
+            top_b = heap_b[0][0] if heap_b else inf
+            if min(top_f, top_b) >= best:
+                break
+            forward = top_f <= top_b
+            if forward:
+                d, v = pop(heap_f)
+                dist, other, arc, heap = dist_f, dist_b, arc_f, heap_f
+                ptr, head, w, s_ptr, s_head, s_w = up_ptr, up_head, up_w, dn_ptr, dn_head, dn_w
+            else:
+                d, v = pop(heap_b)
+                dist, other, arc, heap = dist_b, dist_f, arc_b, heap_b
+                ptr, head, w, s_ptr, s_head, s_w = dn_ptr, dn_head, dn_w, up_ptr, up_head, up_w
+            if d > dist[v]:
+                continue
+            if v in other and d + other[v] < best:
+                best, meet = d + other[v], v
+            # Stall-on-demand: a higher node already reaches v more cheaply,
+            # so v is not on a shortest up-path and needs no expanding
+            if any(dist.get(s_head[k], inf) + s_w[k] < d for k in range(s_ptr[v], s_ptr[v + 1])):
+                continue
+            for k in range(ptr[v], ptr[v + 1]):
+                x = head[k]
+                nd = d + w[k]
+                if nd < dist.get(x, inf):
+                    dist[x] = nd
+                    arc[x] = k
+                    push(heap, (nd, x))
+
+        if meet < 0:
+            return None, inf
+        return self._unpack(source, meet, arc_f, arc_b), best
+
+    def _unpack(self, source, meet, arc_f, arc_b):
+        up_tail, up_head, up_first, up_second, down_tail, down_head, down_first, down_second = self._unpack_lists()
+
+        # Arcs as ints: up arc k is k, down arc k is ~k. Upward arcs
+        # source -> meet, then downward arcs meet -> target
+        arcs = []
+        v = meet
+        while arc_f[v] >= 0:
+            arcs.append(arc_f[v])
+            v = up_tail[arc_f[v]]
+        arcs.reverse()
+        v = meet
+        while arc_b[v] >= 0:
+            arcs.append(~arc_b[v])
+            v = down_tail[arc_b[v]]
+
+        path = [source]
+        stack = arcs[::-1]
+        while stack:
+            a = stack.pop()
+            if a >= 0:
+                first, second, end = up_first[a], up_second[a], up_head[a]
+            else:
+                first, second, end = down_first[~a], down_second[~a], down_tail[~a]
+            if first < 0:
+                path.append(end)
+            else:
+                # Shortcut a -> b via m: down arc a -> m, then up arc m -> b
+                stack.append(second)
+                stack.append(~first)
+        return path
+
+    def _unpack_lists(self):
+        """
+        Tails, heads and the two arcs each shortcut replaces (down arc into
+        its mid node, up arc out of it; -1 for road arcs), as Python lists
+        """
+        if self._unpack_cache is None:
+            n = self.num_nodes
+            up_tail = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.up[0]))
+            down_tail = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.down[0]))
+
+            def finder(tail, head):
+                keys = tail * n + head
+                order = np.argsort(keys, kind="stable")
+                return lambda t, h: order[np.searchsorted(keys[order], t.astype(np.int64) * n + h)]
+
+            find_up = finder(up_tail, self.up[1])
+            find_down = finder(down_tail, self.down[1])
+            # Shortcut a -> b via m = down arc a -> m + up arc m -> b, both at row m
+            children = []
+            for mid, a, b in ((self.up[3], up_tail, self.up[1]), (self.down[3], self.down[1], down_tail)):
+                first = np.full(len(mid), -1, dtype=np.int64)
+                second = np.full(len(mid), -1, dtype=np.int64)
+                sc = mid >= 0
+                first[sc] = find_down(mid[sc], a[sc])
+                second[sc] = find_up(mid[sc], b[sc])
+                children.append((first, second))
+            self._unpack_cache = tuple(x.tolist() for x in (
+                up_tail, self.up[1], children[0][0], children[0][1],
+                down_tail, self.down[1], children[1][0], children[1][1]))
+        return self._unpack_cache
+
+
+def main():
+    from road_graph import load_road_network
+
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy for a road network")
+    parser.add_argument("network", help="GeoJSON or .osm road network")
+    parser.add_argument("-o", "--output", help="output file (default: <network>.ch.npz)")
+    args = parser.parse_args()
+
+    graph = load_road_network(args.network)
+    print(f"{graph.num_nodes} nodes, {graph.num_arcs} arcs")
+    t0 = time.perf_counter()
+    ch = ContractionHierarchy.build(graph)
+    print(f"contracted in {time.perf_counter() - t0:.1f}s, {ch.num_shortcuts} shortcuts")
+    output = args.output or args.network + ".ch.npz"
+    ch.save(output)
+    print(f"saved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Damage-Aware Edge Costs - turn a georeferenced damage map into routing penalties
+
+A damage (or change) probability raster covering a lat/lng bounding box
+is sampled along every road edge at roughly one point per pixel. Each
+edge gets the mean and peak probability of its samples, which map to a
+cost factor: 1 + DAMAGE_PENALTY * mean, or impassable once the peak
+reaches DAMAGE_BLOCK_THRESHOLD.
+
+Sampling is fully vectorized: the sample points of a chunk of edges are
+laid out in one flat array and reduced per edge with bincount/reduceat.
+"""
+
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+# Extra cost at probability 1 (a fully damaged edge costs 1 + 4 = 5x)
+DAMAGE_PENALTY = 4.0
+# Edges with any sample at or above this probability are closed
+DAMAGE_BLOCK_THRESHOLD = 0.9
+# Samples per edge are capped so a very long edge can't blow up a chunk
+MAX_SAMPLES_PER_EDGE = 1024
+# Sample points held in memory at once
+SAMPLE_CHUNK = 1 << 22
+
+
+class DamageRaster:
+    def __init__(self, probability, bounds):
+        """
+        probability: 2D array in [0, 1], row 0 at the north edge
+        bounds: (min_lng, min_lat, max_lng, max_lat) covered by the raster
+        """
+        self.probability = np.asarray(probability, dtype=np.float32)
+        if self.probability.ndim != 2:
+            raise ValueError("damage map must be a single-band 2D raster")
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in bounds)
+        if not (min_lng < max_lng and min_lat < max_lat):
+            raise ValueError("bounds must be min_lng,min_lat,max_lng,max_lat")
+        self.bounds = (min_lng, min_lat, max_lng, max_lat)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, bounds, filename: str = ""):
+        """
+        Load a .npy probability array, or an image whose gray level
+        0-255 is the probability (e.g. a saved ChangeFormer mask).
+        NaN (no data) reads as undamaged and values are clipped to [0, 1].
+        """
+        if filename.endswith(".npy"):
+            probability = np.load(io.BytesIO(data), allow_pickle=False)
+        else:
+            probability = np.asarray(Image.open(io.BytesIO(data)).convert("L"), dtype=np.float32) / 255.0
+        if probability.dtype.kind not in "biuf":
+            raise ValueError("damage map must hold numeric probabilities")
+        # np.clip passes NaN through, and a NaN sample would make its edge's cost NaN
+        probability = np.nan_to_num(probability.astype(np.float32), nan=0.0, posinf=1.0, neginf=0.0)
+        return cls(np.clip(probability, 0.0, 1.0), bounds)
+
+    def to_pixels(self, lat, lng):
+        """Fractional (row, col) of coordinates"""
+        min_lng, min_lat, max_lng, max_lat = self.bounds
+        rows, cols = self.probability.shape
+        return ((max_lat - lat) / (max_lat - min_lat) * rows,
+                (lng - min_lng) / (max_lng - min_lng) * cols)
+
+
+def sample_edges(graph, raster: DamageRaster, spacing_px: float = 1.0):
+    """
+    Sample the raster along every edge of the graph (straight u-v segment).
+    Returns (edge ids, mean probability, peak probability) for the edges
+    with at least one sample inside the raster.
+    """
+    edges, first_arc = np.unique(graph.arc_edge, return_index=True)
+    u, v = graph.arc_src[first_arc], graph.indices[first_arc]
+    row_u, col_u = raster.to_pixels(graph.lat[u], graph.lng[u])
+    row_v, col_v = raster.to_pixels(graph.lat[v], graph.lng[v])
+
+    # Skip edges whose bounding box misses the raster entirely
+    height, width = raster.probability.shape
+    inside = ((np.maximum(row_u, row_v) >= 0) & (np.minimum(row_u, row_v) < height) &
+              (np.maximum(col_u, col_v) >= 0) & (np.minimum(col_u, col_v) < width))
+    edges, row_u, col_u, row_v, col_v = (a[inside] for a in (edges, row_u, col_u, row_v, col_v))
+
+    d_row, d_col = row_v - row_u, col_v - col_u
+    counts = np.clip(np.ceil(np.hypot(d_row, d_col) / spacing_px).astype(np.int64) + 1, 2, MAX_SAMPLES_PER_EDGE)
+
+    means = np.empty(len(edges))
+    peaks = np.empty(len(edges))
+    valid_count = np.empty(len(edges), dtype=np.int64)
+    flat = raster.probability.ravel()
+    ends = np.cumsum(counts)
+    start = 0
+    while start < len(edges):
+        # Largest run of edges whose samples fit in one chunk
+        done = ends[start - 1] if start else 0
+        stop = int(np.searchsorted(ends, done + SAMPLE_CHUNK, side="right"))
+        stop = min(max(stop, start + 1), len(edges))
+        n = counts[start:stop]
+        offsets = np.concatenate(([0], np.cumsum(n)[:-1]))
+        edge = np.repeat(np.arange(stop - start), n)
+        t = (np.arange(int(n.sum())) - offsets[edge]) / (n[edge] - 1)
+
+        rows = np.floor(row_u[start:stop][edge] + t * d_row[start:stop][edge]).astype(np.int64)
+        cols = np.floor(col_u[start:stop][edge] + t * d_col[start:stop][edge]).astype(np.int64)
+        valid = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        values = np.where(valid, flat[np.where(valid, rows * width + cols, 0)], 0.0)
+
+        hits = np.bincount(edge, weights=valid, minlength=stop - start)
+        valid_count[start:stop] = hits
+        means[start:stop] = np.bincount(edge, weights=values, minlength=stop - start) / np.maximum(hits, 1)
+        peaks[start:stop] = np.maximum.reduceat(np.where(valid, values, -np.inf), offsets)
+        start = stop
+
+    covered = valid_count > 0
+    return edges[covered], means[covered], peaks[covered]
+
+
+def damage_factors(means, peaks, penalty: float = DAMAGE_PENALTY,
+                   block_threshold: float = DAMAGE_BLOCK_THRESHOLD):
+    """Cost multiplier per edge from its mean and peak damage probability"""
+    factors = 1.0 + penalty * np.asarray(means, dtype=np.float64)
+    factors[np.asarray(peaks) >= block_threshold] = math.inf
+    return factors
@@ -1,12 +1,54 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
 # Use environment variable or default to local PostGIS instance
-DATABASE_URL = "sqlite:///./disaster.db"
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./disaster.db")
 
-engine = create_engine(DATABASE_URL)
+# Applied to every new SQLite connection. WAL lets the dashboard keep
+# reading while a writer commits; busy_timeout waits on a locked database
+# instead of failing immediately with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # durable at checkpoints; safe with WAL
+    "busy_timeout": 10000,
+}
+
+def _configure_sqlite(engine):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        # Let SQLAlchemy emit BEGIN itself (below) so SAVEPOINTs work
+        dbapi_conn.isolation_level = None
+        cursor = dbapi_conn.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        # Writers use execution_options(sqlite_begin="IMMEDIATE") to take the
+        # write lock up front; upgrading a deferred read snapshot can fail
+        # with "database is locked" without ever waiting on busy_timeout
+        conn.exec_driver_sql("BEGIN " + conn.get_execution_options().get("sqlite_begin", "DEFERRED"))
+
+def make_engine(url: str = DATABASE_URL, tuned: bool = True):
+    """
+    Create the sync engine. With tuned=False this is a plain
+    create_engine(url), kept for benchmarking against the defaults.
+    """
+    if not tuned or not url.startswith("sqlite"):
+        return create_engine(url)
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        pool_size=10,
+        max_overflow=20,
+    )
+    _configure_sqlite(engine)
+    return engine
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,324 @@
+"""
+Bulk Exports - machine-readable damage data for partner agencies
+
+Three layers, each written as CSV, GeoJSON or Parquet:
+
+    incidents  every incident (Point), read from a server-side cursor
+    zones      per-zone damage metrics: incidents aggregated by SQL into a
+               square grid of zone_m cells (Polygon per zone)
+    polygons   damaged areas vectorized from a georeferenced damage mask
+               (the DamageRaster of /route/damage-map): one Polygon (with
+               holes) per connected region above a probability threshold
+
+Rows flow through in chunks of EXPORT_CHUNK_ROWS, and each chunk is
+encoded and handed on before the next is read, so memory stays bounded
+for millions of features. CSV and Parquet carry the geometry as WKT.
+Parquet writes one row group per chunk and needs pyarrow.
+
+Command line (from backend/, using DATABASE_URL):
+    python exports.py incidents -f parquet -o incidents.parquet
+    python exports.py zones -f csv --zone-m 500 -o zones.csv
+    python exports.py polygons --mask mask.png --bbox -118.3,34.0,-118.2,34.1 -o damage.geojson
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import math
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, case, cast, func, select
+
+import incidents as incident_store
+import outlines
+from assignment import SEVERITY_WEIGHTS
+from damage_costs import DamageRaster
+from models import Incident
+from reachability import METERS_PER_DEGREE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "geojson": "application/geo+json",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_CHUNK_ROWS = 5000
+# Mask pixels at or above this probability count as damaged
+POLYGON_THRESHOLD = 0.5
+
+# (name, type) of each layer's columns; types are pyarrow type names
+INCIDENT_FIELDS = [
+    ("id", "int64"), ("type", "string"), ("severity", "string"), ("confidence", "float64"),
+    ("lat", "float64"), ("lng", "float64"), ("description", "string"), ("timestamp", "string"),
+]
+ZONE_FIELDS = [
+    ("zone", "string"), ("min_lat", "float64"), ("min_lng", "float64"), ("max_lat", "float64"),
+    ("max_lng", "float64"), ("incidents", "int64"), ("critical", "int64"), ("severe", "int64"),
+    ("moderate", "int64"), ("low", "int64"), ("mean_confidence", "float64"), ("damage_score", "float64"),
+]
+POLYGON_FIELDS = [
+    ("id", "int64"), ("pixels", "int64"), ("area_m2", "float64"),
+    ("mean_probability", "float64"), ("max_probability", "float64"),
+]
+
+
+# --- Layers: (fields, iterator of (rows, geometries) chunks) ---
+
+def incident_chunks(engine,
+                    bbox: Optional[Tuple[float, float, float, float]] = None,
+                    since: Optional[datetime.datetime] = None,
+                    chunk_rows: int = EXPORT_CHUNK_ROWS):
+    for batch in incident_store.iter_incident_batches(engine, bbox, since, chunk_rows):
+        rows = [
+            (r.id, r.type, r.severity, r.confidence, r.lat, r.lng, r.description,
+             r.created_at.isoformat() if r.created_at else None)
+            for r in batch
+        ]
+        geometries = [
+            {"type": "Point", "coordinates": [r.lng, r.lat]} if r.lat is not None and r.lng is not None else None
+            for r in batch
+        ]
+        yield rows, geometries
+
+
+def zone_chunks(engine,
+                bbox: Optional[Tuple[float, float, float, float]] = None,
+                since: Optional[datetime.datetime] = None,
+                zone_m: float = 1000.0,
+                chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    Incidents grouped into zone_m x zone_m cells by the database. Cells are
+    anchored at (-90, -180) so the integer cast is a floor; their width in
+    degrees of longitude is taken at the mean latitude of the data.
+    """
+    matching = incident_store.incidents_query(bbox, since).where(Incident.lat.isnot(None)).subquery()
+    with engine.connect() as conn:
+        if bbox is not None:
+            ref_lat = (bbox[1] + bbox[3]) / 2
+        else:
+            ref_lat = conn.execute(select(func.avg(matching.c.lat))).scalar() or 0.0
+        d_lat = zone_m / METERS_PER_DEGREE
+        d_lng = d_lat / max(math.cos(math.radians(ref_lat)), 1e-6)
+
+        zone_row = cast((matching.c.lat + 90.0) / d_lat, Integer).label("zone_row")
+        zone_col = cast((matching.c.lng + 180.0) / d_lng, Integer).label("zone_col")
+        weight = case(SEVERITY_WEIGHTS, value=func.upper(matching.c.severity), else_=1.0)
+
+        def level(low, high=None):
+            condition = weight >= low if high is None else (weight >= low) & (weight < high)
+            return func.sum(case((condition, 1), else_=0))
+
+        stmt = (
+            select(zone_row, zone_col, func.count(), level(4), level(3, 4), level(2, 3), level(0, 2),
+                   func.avg(matching.c.confidence), func.sum(weight))
+            .group_by(zone_row, zone_col)
+            .order_by(zone_row, zone_col)
+        )
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(stmt)
+        for partition in result.partitions():
+            rows, geometries = [], []
+            for r, c, count, critical, severe, moderate, low, confidence, score in partition:
+                south, west = r * d_lat - 90.0, c * d_lng - 180.0
+                north, east = south + d_lat, west + d_lng
+                rows.append((f"{r}:{c}", south, west, north, east, count, critical, severe, moderate, low,
+                             confidence, score))
+                geometries.append({"type": "Polygon", "coordinates": [
+                    [[west, south], [east, south], [east, north], [west, north], [west, south]]]})
+            yield rows, geometries
+
+
+def polygon_chunks(raster: DamageRaster, threshold: float = POLYGON_THRESHOLD,
+                   chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """
+    Connected regions of the raster at or above threshold (8-connected),
+    each dissolved into one outline (see outlines.py): a Polygon with its
+    holes, or a MultiPolygon when parts of the region touch only at a
+    corner.
+    """
+    probability = raster.probability
+    height, width = probability.shape
+    damaged = probability >= threshold
+    regions, count = outlines.label(damaged, diagonal=True)
+    if count == 0:
+        return
+
+    # Polygons are traced per 4-connected part; group them by region
+    parts, num_parts = outlines.label(damaged)
+    region_of_part = np.zeros(num_parts + 1, dtype=np.int64)
+    region_of_part[parts[damaged]] = regions[damaged]
+    by_region = {}
+    for polygon in outlines.trace(damaged, parts):
+        by_region.setdefault(int(region_of_part[polygon[1]]), []).append(polygon)
+
+    # Per-region pixel statistics
+    flat_label = regions.ravel()
+    pixels = np.bincount(flat_label, minlength=count + 1)
+    sums = np.bincount(flat_label, weights=probability.ravel(), minlength=count + 1)
+    peaks = np.zeros(count + 1)
+    np.maximum.at(peaks, flat_label, probability.ravel())
+
+    min_lng, min_lat, max_lng, max_lat = raster.bounds
+    px_lat = (max_lat - min_lat) / height
+    px_lng = (max_lng - min_lng) / width
+    pixel_m2 = (px_lat * METERS_PER_DEGREE) * (px_lng * METERS_PER_DEGREE * math.cos(math.radians((min_lat + max_lat) / 2)))
+
+    for first in range(1, count + 1, chunk_rows):
+        rows, geometries = [], []
+        for region in range(first, min(first + chunk_rows, count + 1)):
+            rows.append((region, int(pixels[region]), float(pixels[region] * pixel_m2),
+                         float(sums[region] / pixels[region]), float(peaks[region])))
+            # Row 0 is the north edge
+            geometries.append(outlines.geojson(by_region[region], min_lng, px_lng, max_lat, -px_lat))
+        yield rows, geometries
+
+
+# --- Writers: chunks in, encoded byte chunks out ---
+
+def _wkt(geometry) -> Optional[str]:
+    if geometry is None:
+        return None
+
+    def ring(points):
+        return "(" + ", ".join(f"{x!r} {y!r}" for x, y in points) + ")"
+
+    kind, coords = geometry["type"], geometry["coordinates"]
+    if kind == "Point":
+        return f"POINT ({coords[0]!r} {coords[1]!r})"
+    if kind == "Polygon":
+        return "POLYGON (" + ", ".join(ring(r) for r in coords) + ")"
+    return "MULTIPOLYGON (" + ", ".join("(" + ", ".join(ring(r) for r in p) + ")" for p in coords) + ")"
+
+
+def write_csv(fields, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in fields] + ["wkt"])
+    for rows, geometries in chunks:
+        writer.writerows(row + (_wkt(g),) for row, g in zip(rows, geometries))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def write_geojson(fields, chunks):
+    names = [name for name, _ in fields]
+    yield b'{"type": "FeatureCollection", "features": ['
+    separator = ""
+    for rows, geometries in chunks:
+        features = ",\n".join(
+            json.dumps({"type": "Feature", "geometry": g, "properties": dict(zip(names, row))})
+            for row, g in zip(rows, geometries)
+        )
+        if features:
+            yield (separator + features).encode()
+            separator = ",\n"
+    yield b"]}\n"
+
+
+class _Sink:
+    """Write-only file object that collects what ParquetWriter writes until drained"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def write_parquet(fields, chunks):
+    if not HAS_PYARROW:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in fields] + [("geometry", pa.string())])
+    names = schema.names
+    sink = _Sink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    try:
+        for rows, geometries in chunks:
+            columns = list(zip(*rows)) if rows else [()] * len(fields)
+            arrays = dict(zip(names, columns))
+            arrays["geometry"] = [_wkt(g) for g in geometries]
+            writer.write_table(pa.table(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+WRITERS = {"csv": write_csv, "geojson": write_geojson, "parquet": write_parquet}
+
+
+def export(fields, chunks, fmt: str):
+    """Byte chunks of a layer in the given format"""
+    if fmt not in WRITERS:
+        raise ValueError(f"format must be one of {sorted(WRITERS)}")
+    if fmt == "parquet" and not HAS_PYARROW:
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow)")
+    return WRITERS[fmt](fields, chunks)
+
+
+def main():
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Export incidents, zone metrics or damage polygons")
+    parser.add_argument("layer", choices=["incidents", "zones", "polygons"])
+    parser.add_argument("-f", "--format", choices=sorted(WRITERS), default="geojson")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--bbox", help="min_lng,min_lat,max_lng,max_lat (for polygons: the mask's bounds)")
+    parser.add_argument("--since", type=datetime.datetime.fromisoformat)
+    parser.add_argument("--zone-m", type=float, default=1000.0)
+    parser.add_argument("--mask", help="damage mask (.npy or grayscale image) for polygons")
+    parser.add_argument("--threshold", type=float, default=POLYGON_THRESHOLD)
+    args = parser.parse_args()
+
+    bbox = incident_store.parse_bbox(args.bbox) if args.bbox else None
+    if args.layer == "incidents":
+        fields, chunks = INCIDENT_FIELDS, incident_chunks(engine, bbox, args.since)
+    elif args.layer == "zones":
+        fields, chunks = ZONE_FIELDS, zone_chunks(engine, bbox, args.since, args.zone_m)
+    else:
+        if not args.mask or bbox is None:
+            parser.error("polygons need --mask and --bbox")
+        with open(args.mask, "rb") as f:
+            raster = DamageRaster.from_bytes(f.read(), bbox, args.mask)
+        fields, chunks = POLYGON_FIELDS, polygon_chunks(raster, args.threshold)
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for data in export(fields, chunks, args.format):
+            out.write(data)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
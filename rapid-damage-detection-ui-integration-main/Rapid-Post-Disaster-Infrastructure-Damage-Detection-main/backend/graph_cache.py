@@ -0,0 +1,167 @@
+"""
+Graph Cache - compiled road network saved for fast startup
+
+Parsing a city-scale GeoJSON/OSM extract and building the CSR arrays
+takes tens of seconds per process. The compiled graph (CSR arrays,
+coordinates, edge attributes, node ids and the unit vectors of the
+node/edge spatial indexes) is written once to a single binary file and memory-mapped on
+later starts, so worker processes share the same read-only pages
+instead of each parsing the source. The file records the checksum of
+the source it was built from and is rebuilt when the source changes.
+It holds only plain arrays: the KD-trees are rebuilt from the mapped
+vectors on the first snap, never unpickled from the file.
+
+File layout: MAGIC, format version and header length (little-endian
+uint32 each), a JSON header with the source checksum and every array's
+dtype, shape and offset, then the arrays at 64-byte aligned offsets.
+
+Build ahead of a deployment (from backend/):
+    python graph_cache.py roads.osm              # writes roads.osm.graph
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+from typing import Optional
+
+import numpy as np
+
+from road_graph import PointIndex, RoadGraph, load_road_network
+
+MAGIC = b"RDGRAPH\0"
+# Bump when the layout or the meaning of an array changes
+GRAPH_CACHE_FORMAT = 2
+ALIGN = 64
+
+
+def source_checksum(path: str) -> str:
+    """blake2b of the network file's bytes"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _index_arrays(prefix, index: PointIndex):
+    return {f"{prefix}_xyz": index.xyz, f"{prefix}_ids": index.ids}
+
+
+def save_graph(graph: RoadGraph, path: str, checksum: str = ""):
+    """Write graph (and its spatial indexes) to path, atomically"""
+    arrays = {
+        "node_ids": np.array(graph.node_ids, dtype=str),
+        "lat": graph.lat, "lng": graph.lng,
+        "indptr": graph.indptr, "indices": graph.indices,
+        "length": graph.length, "weight": graph.base_weight,
+        "arc_edge": graph.arc_edge, "edge_road": graph.edge_road,
+        **_index_arrays("node_index", graph.node_index()),
+    }
+    if graph.num_edges:
+        arrays.update(_index_arrays("edge_index", graph.edge_index()))
+
+    entries, offset = {}, 0
+    for name, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        arrays[name] = a
+        entries[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+        offset += -(-a.nbytes // ALIGN) * ALIGN
+    header = json.dumps({"source_checksum": checksum, "arrays": entries}).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", GRAPH_CACHE_FORMAT, len(header)) + header)
+        for name, a in arrays.items():
+            f.seek(data_start + entries[name]["offset"])
+            f.write(a.data)
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        return None, 0
+    version, size = struct.unpack("<II", f.read(8))
+    if version != GRAPH_CACHE_FORMAT:
+        return None, 0
+    header = json.loads(f.read(size))
+    return header, -(-(len(MAGIC) + 8 + size) // ALIGN) * ALIGN
+
+
+def load_graph(path: str, checksum: Optional[str] = None) -> Optional[RoadGraph]:
+    """
+    Memory-map a graph written by save_graph. Returns None if the file is
+    missing, from another format version or, when checksum is given,
+    built from a different source.
+    """
+    try:
+        with open(path, "rb") as f:
+            header, data_start = _read_header(f)
+    except (OSError, ValueError, struct.error):
+        return None
+    if header is None or (checksum is not None and header["source_checksum"] != checksum):
+        return None
+
+    entries = header["arrays"]
+
+    def array(name):
+        entry = entries[name]
+        shape = tuple(entry["shape"])
+        if not np.prod(shape):
+            return np.zeros(shape, dtype=entry["dtype"])
+        return np.memmap(path, dtype=entry["dtype"], mode="r", offset=data_start + entry["offset"], shape=shape)
+
+    def point_index(prefix):
+        return PointIndex.from_vectors(array(f"{prefix}_xyz"), array(f"{prefix}_ids"))
+
+    graph = RoadGraph.from_arrays(
+        array("node_ids").tolist(), array("lat"), array("lng"), array("indptr"), array("indices"),
+        array("length"), array("weight"), array("arc_edge"), array("edge_road"),
+    )
+    graph._node_index = point_index("node_index")
+    if "edge_index_xyz" in entries:
+        graph._edge_index = point_index("edge_index")
+    return graph
+
+
+def load_cached_network(path: str, cache_path: str = None) -> RoadGraph:
+    """
+    load_road_network through the cache: memory-map cache_path (default
+    <path>.graph) if it was built from the current file, else parse the
+    file and write the cache for the next start
+    """
+    cache_path = cache_path or path + ".graph"
+    checksum = source_checksum(path)
+    graph = load_graph(cache_path, checksum)
+    if graph is not None:
+        return graph
+    graph = load_road_network(path)
+    try:
+        save_graph(graph, cache_path, checksum)
+    except OSError as e:
+        print(f"Could not write graph cache {cache_path}: {e}")
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a road network into a memory-mappable graph cache")
+    parser.add_argument("network", help="GeoJSON or .osm road network")
+    parser.add_argument("-o", "--output", help="output file (default: <network>.graph)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    graph = load_road_network(args.network)
+    print(f"{graph.num_nodes} nodes, {graph.num_arcs} arcs, parsed in {time.perf_counter() - t0:.1f}s")
+    output = args.output or args.network + ".graph"
+    save_graph(graph, output, source_checksum(args.network))
+    t0 = time.perf_counter()
+    load_graph(output)
+    print(f"saved {output} ({os.path.getsize(output) / 1e6:.1f} MB), maps in {1000 * (time.perf_counter() - t0):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
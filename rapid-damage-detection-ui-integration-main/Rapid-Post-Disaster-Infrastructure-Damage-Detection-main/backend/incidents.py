@@ -0,0 +1,469 @@
+"""
+Incident Storage - persistence and spatial queries for incidents
+
+Incidents keep numeric lat/lng columns next to the legacy JSON `location`.
+On SQLite those coordinates are mirrored into an R*Tree virtual table by
+triggers, so viewport (bbox) queries are index lookups instead of scanning
+and JSON-decoding every row. Further triggers count every insert, update
+and delete in incidents_revision, which keys the report cache.
+"""
+
+import json
+import base64
+import codecs
+import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select, table, column, tuple_
+from sqlalchemy.orm import Session
+
+from models import Incident
+
+# Lightweight handle on the virtual table (kept out of Base.metadata so
+# create_all never tries to create it as a regular table)
+incidents_rtree = table(
+    "incidents_rtree",
+    column("id"),
+    column("min_lat"),
+    column("max_lat"),
+    column("min_lng"),
+    column("max_lng"),
+)
+
+incidents_revision = table("incidents_revision", column("revision"))
+
+_RTREE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS incidents_rtree "
+    "USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    """CREATE TRIGGER IF NOT EXISTS incidents_rtree_insert AFTER INSERT ON incidents
+       WHEN new.lat IS NOT NULL AND new.lng IS NOT NULL
+       BEGIN
+           INSERT OR REPLACE INTO incidents_rtree VALUES (new.id, new.lat, new.lat, new.lng, new.lng);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS incidents_rtree_update AFTER UPDATE OF lat, lng ON incidents
+       BEGIN
+           DELETE FROM incidents_rtree WHERE id = old.id;
+           INSERT INTO incidents_rtree
+               SELECT new.id, new.lat, new.lat, new.lng, new.lng
+               WHERE new.lat IS NOT NULL AND new.lng IS NOT NULL;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS incidents_rtree_delete AFTER DELETE ON incidents
+       BEGIN
+           DELETE FROM incidents_rtree WHERE id = old.id;
+       END""",
+]
+
+# Modification counter of the incidents table, one row bumped by every
+# insert, update and delete (including in-place edits no query can see)
+_REVISION_DDL = [
+    "CREATE TABLE IF NOT EXISTS incidents_revision "
+    "(id INTEGER PRIMARY KEY CHECK (id = 1), revision INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO incidents_revision VALUES (1, 0)",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS incidents_revision_{event.lower()} AFTER {event} ON incidents
+       BEGIN
+           UPDATE incidents_revision SET revision = revision + 1 WHERE id = 1;
+       END"""
+    for event in ("INSERT", "UPDATE", "DELETE")
+]
+
+# Columns returned to the API (avoids hydrating full ORM objects)
+_COLUMNS = (
+    Incident.id,
+    Incident.type,
+    Incident.severity,
+    Incident.confidence,
+    Incident.lat,
+    Incident.lng,
+    Incident.description,
+    Incident.created_at,
+)
+
+
+def ensure_spatial_index(engine):
+    """
+    Add lat/lng columns to databases created before they existed, backfill
+    them from the JSON location, and create the R*Tree index, the
+    revision counter and their triggers. No-op on non-SQLite engines.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.begin() as conn:
+        existing = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(incidents)")}
+        for name in ("lat", "lng"):
+            if name not in existing:
+                conn.exec_driver_sql(f"ALTER TABLE incidents ADD COLUMN {name} FLOAT")
+        conn.exec_driver_sql(
+            "UPDATE incidents SET lat = json_extract(location, '$.lat'), "
+            "lng = json_extract(location, '$.lng') "
+            "WHERE lat IS NULL AND json_valid(location)"
+        )
+        conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_incidents_created_at ON incidents (created_at)"
+        )
+
+        for ddl in _RTREE_DDL + _REVISION_DDL:
+            conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql(
+            "INSERT INTO incidents_rtree "
+            "SELECT id, lat, lat, lng, lng FROM incidents "
+            "WHERE lat IS NOT NULL AND lng IS NOT NULL "
+            "AND id NOT IN (SELECT id FROM incidents_rtree)"
+        )
+
+
+def parse_bbox(bbox: str) -> Tuple[float, float, float, float]:
+    """
+    Parse "min_lng,min_lat,max_lng,max_lat" (GeoJSON order).
+    Raises ValueError on malformed input.
+    """
+    parts = bbox.split(",")
+    if len(parts) != 4:
+        raise ValueError("bbox must be 'min_lng,min_lat,max_lng,max_lat'")
+    min_lng, min_lat, max_lng, max_lat = (float(p) for p in parts)
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed maximums")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def _naive_utc(ts: Optional[datetime.datetime]) -> Optional[datetime.datetime]:
+    # created_at is stored as naive UTC
+    if ts is not None and ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _incident_values(data: dict) -> dict:
+    """Column values for an IncidentCreate-shaped dict"""
+    confidence = data.get("confidence")
+    return {
+        "type": data["type"],
+        "severity": data["severity"],
+        "confidence": confidence if confidence is not None else 1.0,
+        "lat": data["lat"],
+        "lng": data["lng"],
+        "location": json.dumps({"lat": data["lat"], "lng": data["lng"]}),
+        "description": data.get("description"),
+        "disaster_id": data.get("disaster_id"),
+    }
+
+
+_INSERT = Incident.__table__.insert()
+
+
+def insert_incident(conn, data: dict) -> int:
+    """Insert one incident on conn (e.g. via the write queue); returns its id"""
+    result = conn.execute(_INSERT, _incident_values(data))
+    return result.inserted_primary_key[0]
+
+
+def get_incident(db: Session, incident_id: int) -> Optional[dict]:
+    row = db.execute(select(*_COLUMNS).where(Incident.id == incident_id)).first()
+    return incident_to_dict(row) if row else None
+
+
+def incident_to_dict(row) -> dict:
+    """Serialize an Incident (or a row of _COLUMNS) for the frontend"""
+    return {
+        "id": row.id,
+        "type": row.type,
+        "severity": row.severity,
+        "confidence": row.confidence,
+        "coordinates": {"lat": row.lat, "lng": row.lng},
+        "description": row.description,
+        "timestamp": row.created_at.isoformat() if row.created_at else None,
+    }
+
+
+def incidents_query(bbox: Optional[Tuple[float, float, float, float]] = None,
+                    since: Optional[datetime.datetime] = None,
+                    ids: Optional[List[int]] = None):
+    """
+    Select statement for incidents inside bbox and/or created at or after
+    `since` (and/or with the given ids). The bbox filter is resolved
+    through the R*Tree; the exact lat/lng comparison only trims the
+    float32 rounding of the index.
+    """
+    stmt = select(*_COLUMNS)
+    if ids is not None:
+        stmt = stmt.where(Incident.id.in_(ids))
+    if bbox is not None:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        candidates = select(incidents_rtree.c.id).where(
+            incidents_rtree.c.max_lat >= min_lat,
+            incidents_rtree.c.min_lat <= max_lat,
+            incidents_rtree.c.max_lng >= min_lng,
+            incidents_rtree.c.min_lng <= max_lng,
+        )
+        stmt = stmt.where(
+            Incident.id.in_(candidates),
+            Incident.lat.between(min_lat, max_lat),
+            Incident.lng.between(min_lng, max_lng),
+        )
+    since = _naive_utc(since)
+    if since is not None:
+        stmt = stmt.where(Incident.created_at >= since)
+    return stmt
+
+
+def query_incidents(db: Session,
+                    bbox: Optional[Tuple[float, float, float, float]] = None,
+                    since: Optional[datetime.datetime] = None,
+                    limit: Optional[int] = None,
+                    ids: Optional[List[int]] = None) -> list:
+    stmt = incidents_query(bbox, since, ids).order_by(Incident.created_at, Incident.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [incident_to_dict(row) for row in db.execute(stmt)]
+
+
+def dataset_version(db,
+                    bbox: Optional[Tuple[float, float, float, float]] = None,
+                    since: Optional[datetime.datetime] = None) -> tuple:
+    """
+    (count, max id, max created_at, revision) of the incidents matching
+    bbox/since. revision counts every write to the incidents table, so an
+    incident edited in place changes the tuple too; it identifies the data
+    a report was rendered from.
+    """
+    matching = incidents_query(bbox, since).subquery()
+    count, max_id, max_created_at = db.execute(
+        select(func.count(), func.max(matching.c.id), func.max(matching.c.created_at))
+    ).one()
+    revision = db.execute(select(incidents_revision.c.revision)).scalar()
+    return count, max_id, max_created_at.isoformat() if max_created_at else None, revision
+
+
+# --- Keyset pagination & streaming export ---
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "geojsonseq": "application/geo+json-seq",
+}
+
+
+def encode_cursor(created_at: datetime.datetime, incident_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{incident_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    """Inverse of encode_cursor. Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, incident_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(created_at), int(incident_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def page_incidents(db: Session,
+                   cursor: Optional[str] = None,
+                   limit: int = 500,
+                   bbox: Optional[Tuple[float, float, float, float]] = None,
+                   since: Optional[datetime.datetime] = None) -> dict:
+    """
+    One page of incidents ordered by (created_at, id). The cursor holds the
+    last key of the previous page, so each page is an index range scan that
+    costs the same no matter how deep into the table it starts.
+    """
+    stmt = incidents_query(bbox, since)
+    if cursor:
+        after_created_at, after_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(Incident.created_at, Incident.id) > tuple_(after_created_at, after_id)
+        )
+    stmt = stmt.order_by(Incident.created_at, Incident.id).limit(limit + 1)
+
+    rows = db.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return {
+        "items": [incident_to_dict(row) for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+def incident_to_feature(row) -> dict:
+    """GeoJSON Point feature for an incident row"""
+    return {
+        "type": "Feature",
+        "id": row.id,
+        "geometry": {"type": "Point", "coordinates": [row.lng, row.lat]},
+        "properties": {
+            "type": row.type,
+            "severity": row.severity,
+            "confidence": row.confidence,
+            "description": row.description,
+            "timestamp": row.created_at.isoformat() if row.created_at else None,
+        },
+    }
+
+
+def iter_export(engine, fmt: str = "ndjson",
+                bbox: Optional[Tuple[float, float, float, float]] = None,
+                since: Optional[datetime.datetime] = None,
+                batch_size: int = 1000):
+    """
+    Stream incidents as NDJSON or GeoJSONSeq (RFC 8142) byte chunks, one
+    chunk per batch_size rows, read from a server-side cursor on a
+    connection owned by the generator. Memory stays at one batch.
+    """
+    if fmt == "geojsonseq":
+        def encode(row):
+            return "\x1e" + json.dumps(incident_to_feature(row)) + "\n"
+    else:
+        def encode(row):
+            return json.dumps(incident_to_dict(row)) + "\n"
+
+    for partition in iter_incident_batches(engine, bbox, since, batch_size):
+        yield "".join(encode(row) for row in partition).encode()
+
+
+def iter_incident_batches(engine,
+                          bbox: Optional[Tuple[float, float, float, float]] = None,
+                          since: Optional[datetime.datetime] = None,
+                          batch_size: int = 1000):
+    """
+    Rows of incidents_query ordered by (created_at, id), in lists of
+    batch_size read from a server-side cursor on a connection owned by
+    the generator
+    """
+    stmt = incidents_query(bbox, since).order_by(Incident.created_at, Incident.id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        yield from result.partitions()
+
+
+# --- Bulk ingest ---
+
+BULK_CHUNK_SIZE = 5000
+
+
+class BulkRowError(Exception):
+    """A payload row that could not be decoded"""
+
+
+async def iter_ndjson(chunks):
+    """
+    Yield one decoded object (or BulkRowError) per non-blank NDJSON line
+    while the body is still arriving.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _decode_line(line)
+    if buffer.strip():
+        yield _decode_line(buffer)
+
+
+def _decode_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return BulkRowError(f"Invalid JSON: {e}")
+
+
+async def iter_json_array(chunks):
+    """
+    Yield the elements of a top-level JSON array incrementally. A malformed
+    element ends the stream, since there is no way to resynchronise.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = chunks.__aiter__()
+    buffer, pos = "", 0
+    started = eof = False
+
+    while True:
+        if not eof:
+            try:
+                data = utf8.decode(await chunks.__anext__())
+            except StopAsyncIteration:
+                data = utf8.decode(b"", final=True)
+                eof = True
+            # Drop the consumed prefix before appending
+            buffer, pos = buffer[pos:] + data, 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                if buffer[pos] == "," and not started:
+                    break
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    yield BulkRowError("Expected a JSON array")
+                    return
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except ValueError as e:
+                if eof:
+                    yield BulkRowError(f"Invalid JSON: {e}")
+                    return
+                break
+            # A value running up to the end of the buffer may be truncated
+            # (e.g. a number split across chunks); wait for more input
+            if end == len(buffer) and not eof:
+                break
+            pos = end
+            yield value
+
+        if eof:
+            yield BulkRowError("Unterminated JSON array" if started else "Expected a JSON array")
+            return
+
+
+_BULK_COLUMNS = ("type", "severity", "confidence", "lat", "lng", "location", "description", "disaster_id")
+_BULK_INSERT_SQL = (
+    f"INSERT INTO incidents ({', '.join(_BULK_COLUMNS)}, created_at) "
+    f"VALUES ({', '.join('?' * (len(_BULK_COLUMNS) + 1))})"
+)
+
+
+def _bulk_row(data: dict, created_at: str) -> tuple:
+    values = _incident_values(data)
+    return tuple(values[name] for name in _BULK_COLUMNS) + (created_at,)
+
+
+def bulk_insert(conn, rows: list) -> Tuple[int, list]:
+    """
+    Insert a chunk of (row_index, IncidentCreate dict) pairs with one DBAPI
+    executemany. Meant to run as a single write-queue job; if the chunk
+    fails it is retried row by row under savepoints, so one bad record
+    only costs its own insert.
+    Returns (inserted_count, [{"row": index, "error": message}, ...]).
+    """
+    if not rows:
+        return 0, []
+    # Same text format SQLAlchemy's SQLite DateTime type writes
+    now = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+    params = [_bulk_row(data, now) for _, data in rows]
+    try:
+        with conn.begin_nested():
+            conn.exec_driver_sql(_BULK_INSERT_SQL, params)
+        return len(params), []
+    except Exception:
+        pass
+
+    inserted, errors = 0, []
+    for (index, _), row in zip(rows, params):
+        try:
+            with conn.begin_nested():
+                conn.exec_driver_sql(_BULK_INSERT_SQL, row)
+            inserted += 1
+        except Exception as e:
+            errors.append({"row": index, "error": str(e.__cause__ or e)})
+    return inserted, errors
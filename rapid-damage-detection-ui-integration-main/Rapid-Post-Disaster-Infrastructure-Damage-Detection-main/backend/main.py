@@ -1,24 +1,33 @@
-from fastapi import FastAPI, Depends, UploadFile, File, BackgroundTasks
-from fastapi.responses import StreamingResponse, RedirectResponse
+from fastapi import FastAPI, Depends, UploadFile, File, Form, BackgroundTasks, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, Field, ValidationError
 from pathlib import Path
+from contextlib import asynccontextmanager
 import os
 import glob
 from PIL import Image
 import numpy as np
 import io
 import base64
+import json
+import time
 
 # Internal imports
 from database import engine, Base, get_db
-from models import Incident as IncidentModel
+from models import Incident as IncidentModel, Road as RoadModel, EmergencyNode as EmergencyNodeModel
+import incidents as incident_store
+from write_queue import write_queue
 from ai import ai_engine
-from routing import router as routing_engine
-from pdf import generate_pdf_report
+from routing import router as routing_engine, STATUS_FACTORS, DEFAULT_SPEED_KMH
+from damage_costs import DamageRaster, DAMAGE_PENALTY, DAMAGE_BLOCK_THRESHOLD
+from assignment import assign, severity_weight
+from report_jobs import report_jobs, report_key
+import exports
 from change_detection import ai_model
 from damage_estimation import damage_estimator
 
@@ -34,11 +43,25 @@ if not os.path.isdir(FRONTEND_DIR):
 
 # Initialize DB Tables
 Base.metadata.create_all(bind=engine)
+incident_store.ensure_spatial_index(engine)
+
+# Start the router from the current road closures
+with engine.connect() as _conn:
+    routing_engine.apply_road_statuses(_conn.execute(RoadModel.__table__.select().with_only_columns(RoadModel.id, RoadModel.status)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Commit anything still queued before the process exits
+    write_queue.stop()
+    routing_engine.close()
+    report_jobs.shutdown()
 
 app = FastAPI(
     title="ResQ Sentinel API",
     description="Geospatial AI Backend for Disaster Response",
-    version="3.0.1"
+    version="3.0.1",
+    lifespan=lifespan
 )
 
 # CORS Config
@@ -57,12 +80,58 @@ class IncidentCreate(BaseModel):
     lat: float
     lng: float
     description: Optional[str] = None
+    confidence: Optional[float] = None
 
 class IncidentResponse(IncidentCreate):
     id: int
     confidence: float
     timestamp: str
 
+class RoadStatusUpdate(BaseModel):
+    status: str  # OPEN, BLOCKED, RESTRICTED
+
+class RouteOrigins(BaseModel):
+    nodes: List[str]
+
+class LatLng(BaseModel):
+    lat: float
+    lng: float
+
+class SnapRequest(BaseModel):
+    points: List[LatLng]
+
+class ReachabilityRequest(BaseModel):
+    nodes: List[str] = []
+    points: List[LatLng] = []
+    emergency_types: List[str] = []  # e.g. ["HOSPITAL"]: every EmergencyNode of these types
+    minutes: List[float] = Field(default=[5, 10, 15], min_length=1)
+    speed_kmh: float = Field(default=DEFAULT_SPEED_KMH, gt=0)
+    cell_m: float = Field(default=200.0, gt=0)
+    include_nodes: bool = False
+
+class Team(BaseModel):
+    id: str
+    node: Optional[str] = None  # or lat/lng, snapped to the nearest road node
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    capacity: int = Field(default=1, ge=1)
+
+class AssignmentRequest(BaseModel):
+    teams: List[Team] = Field(min_length=1)
+    incident_ids: Optional[List[int]] = None  # default: every incident matching bbox/since
+    bbox: Optional[str] = None
+    since: Optional[datetime] = None
+    severity_weighting: bool = True
+
+class RouteMatrixRequest(BaseModel):
+    sources: List[str]
+    targets: List[str]
+    paths: bool = False
+
+class ReportRequest(BaseModel):
+    bbox: Optional[str] = None
+    since: Optional[datetime] = None
+
 # --- Endpoints ---
 
 @app.get("/")
@@ -82,16 +151,154 @@ def health_check():
 # 1. Incident Management
 @app.post("/incidents/", response_model=dict)
 def create_incident(incident: IncidentCreate, db: Session = Depends(get_db)):
-    # Mock creation logic (PostGIS handling would go here)
-    return {"msg": "Incident reported", "data": incident}
+    incident_id = write_queue.submit(incident_store.insert_incident, incident.model_dump()).result()
+    response = {"msg": "Incident reported", "data": incident_store.get_incident(db, incident_id)}
+    if incident.type == "BLOCKED":
+        # Close the road at the incident and repair the cached routes
+        response["routing"] = routing_engine.block_near(incident.lat, incident.lng)
+    return response
 
 @app.get("/incidents/")
-def get_incidents(db: Session = Depends(get_db)):
-    # Return mock data if DB empty
-    return [
-        {"id": 1, "type": "DAMAGE", "severity": "CRITICAL", "coordinates": {"lat": 34.0622, "lng": -118.2537}},
-        {"id": 2, "type": "BLOCKED", "severity": "MODERATE", "coordinates": {"lat": 34.0422, "lng": -118.2337}}
-    ]
+def get_incidents(
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    since: Optional[datetime] = Query(None, description="Only incidents created at or after this time"),
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db)
+):
+    try:
+        bounds = incident_store.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return incident_store.query_incidents(db, bbox=bounds, since=since, limit=limit)
+
+@app.get("/incidents/page")
+def get_incidents_page(
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(500, ge=1, le=5000),
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    since: Optional[datetime] = Query(None),
+    db: Session = Depends(get_db)
+):
+    try:
+        bounds = incident_store.parse_bbox(bbox) if bbox else None
+        return incident_store.page_incidents(db, cursor=cursor, limit=limit, bbox=bounds, since=since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/incidents/export")
+def export_incidents(
+    format: str = Query("ndjson", description="ndjson, geojsonseq, csv, geojson or parquet"),
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    since: Optional[datetime] = Query(None)
+):
+    """GET /export/incidents with NDJSON as the default format"""
+    return _export_response("incidents", format, bbox, since)
+
+@app.get("/export/{layer}")
+def export_layer(
+    layer: str,
+    format: str = Query("geojson", description="csv, geojson or parquet (incidents also ndjson or geojsonseq)"),
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    since: Optional[datetime] = Query(None),
+    zone_m: float = Query(1000.0, gt=0, description="zone size in meters (zones layer)")
+):
+    """Bulk export of incidents or per-zone damage metrics, streamed in chunks"""
+    if layer not in ("incidents", "zones"):
+        raise HTTPException(status_code=404, detail="layer must be incidents or zones (POST /export/polygons for masks)")
+    return _export_response(layer, format, bbox, since, zone_m)
+
+def _export_response(layer: str, format: str, bbox: Optional[str], since: Optional[datetime], zone_m: float = 1000.0):
+    formats = sorted(exports.EXPORT_FORMATS) + (sorted(incident_store.EXPORT_FORMATS) if layer == "incidents" else [])
+    if format not in formats:
+        raise HTTPException(status_code=400, detail=f"format must be one of {formats}")
+    try:
+        bounds = incident_store.parse_bbox(bbox) if bbox else None
+        if layer == "incidents" and format in incident_store.EXPORT_FORMATS:
+            # Line-delimited formats stream one row per line straight from the cursor
+            body = incident_store.iter_export(engine, format, bbox=bounds, since=since)
+            media_type = incident_store.EXPORT_FORMATS[format]
+            extension = "geojsons" if format == "geojsonseq" else "ndjson"
+        else:
+            if layer == "incidents":
+                fields, chunks = exports.INCIDENT_FIELDS, exports.incident_chunks(engine, bounds, since)
+            else:
+                fields, chunks = exports.ZONE_FIELDS, exports.zone_chunks(engine, bounds, since, zone_m)
+            body = exports.export(fields, chunks, format)
+            media_type, extension = exports.EXPORT_FORMATS[format], format
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={layer}.{extension}"}
+    )
+
+@app.post("/export/polygons")
+async def export_polygons(
+    mask: UploadFile = File(..., description="Damage mask: .npy probability array or grayscale image"),
+    bbox: str = Form(..., description="min_lng,min_lat,max_lng,max_lat covered by the mask"),
+    threshold: float = Form(exports.POLYGON_THRESHOLD, gt=0, le=1),
+    format: str = Form("geojson", description="csv, geojson or parquet")
+):
+    """Damaged areas of a georeferenced mask as polygons with their size and probability"""
+    try:
+        bounds = incident_store.parse_bbox(bbox)
+        raster = DamageRaster.from_bytes(await mask.read(), bounds, mask.filename or "")
+        body = exports.export(exports.POLYGON_FIELDS, exports.polygon_chunks(raster, threshold), format)
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        body,
+        media_type=exports.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename=damage-polygons.{format}"}
+    )
+
+@app.post("/incidents/bulk")
+async def bulk_create_incidents(request: Request):
+    """
+    Bulk ingest of IncidentCreate records, sent either as NDJSON
+    (application/x-ndjson) or as a JSON array. Rows are validated as the
+    body streams in and inserted in chunks through the write queue; invalid rows are
+    reported by index without aborting the rest of the batch.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        records = incident_store.iter_ndjson(request.stream())
+    else:
+        records = incident_store.iter_json_array(request.stream())
+
+    inserted, errors, chunk = 0, [], []
+    row = -1
+    try:
+        async for row, record in _enumerate_async(records):
+            if isinstance(record, incident_store.BulkRowError):
+                errors.append({"row": row, "error": str(record)})
+                continue
+            try:
+                item = IncidentCreate.model_validate(record)
+            except ValidationError as e:
+                errors.append({"row": row, "error": e.errors(include_url=False, include_context=False)})
+                continue
+            chunk.append((row, item.model_dump()))
+            if len(chunk) >= incident_store.BULK_CHUNK_SIZE:
+                count, failed = await write_queue.run(incident_store.bulk_insert, chunk)
+                inserted += count
+                errors.extend(failed)
+                chunk = []
+    except UnicodeDecodeError:
+        errors.append({"row": row + 1, "error": "Body is not valid UTF-8"})
+
+    count, failed = await write_queue.run(incident_store.bulk_insert, chunk)
+    inserted += count
+    errors.extend(failed)
+
+    return {"inserted": inserted, "failed": len(errors), "errors": errors}
+
+async def _enumerate_async(items):
+    index = 0
+    async for item in items:
+        yield index, item
+        index += 1
 
 # 2. AI Pipeline
 @app.post("/analyze/change-detection")
@@ -330,28 +537,241 @@ def get_changeformer_heatmap(filename: str = Query(None)):
 
 # 3. Routing
 @app.get("/route/compute")
-def compute_safe_route(start_node: str, end_node: str):
+def compute_safe_route(
+    start_node: Optional[str] = None,
+    end_node: Optional[str] = None,
+    start_lat: Optional[float] = None,
+    start_lng: Optional[float] = None,
+    end_lat: Optional[float] = None,
+    end_lng: Optional[float] = None
+):
+    # Either end can be a node id or a coordinate snapped to the nearest road node
+    snapped = {}
+    if start_node is None:
+        if start_lat is None or start_lng is None:
+            raise HTTPException(status_code=400, detail="Give start_node or start_lat and start_lng")
+        snapped["start"] = routing_engine.snap(start_lat, start_lng)[0]
+        start_node = snapped["start"]["node"]
+    if end_node is None:
+        if end_lat is None or end_lng is None:
+            raise HTTPException(status_code=400, detail="Give end_node or end_lat and end_lng")
+        snapped["end"] = routing_engine.snap(end_lat, end_lng)[0]
+        end_node = snapped["end"]["node"]
+
     route = routing_engine.compute_route(start_node, end_node)
     if not route:
         return {"error": "No safe path found"}
+    if snapped:
+        route["snapped"] = snapped
     return route
 
-# 4. Reports
-@app.get("/reports/generate")
-def download_report(background_tasks: BackgroundTasks):
-    # Fetch data
+@app.post("/route/snap")
+def snap_to_roads(request: SnapRequest):
+    """Nearest routable road node, and position on the nearest road segment, for each point"""
+    if not request.points:
+        return []
+    return routing_engine.snap([p.lat for p in request.points], [p.lng for p in request.points], with_edges=True)
+
+@app.post("/route/damage-map")
+async def apply_damage_map(
+    damage_map: UploadFile = File(..., description="Probability raster: .npy array or grayscale image"),
+    bbox: str = Form(..., description="min_lng,min_lat,max_lng,max_lat covered by the raster"),
+    penalty: float = Form(DAMAGE_PENALTY, ge=0),
+    block_threshold: float = Form(DAMAGE_BLOCK_THRESHOLD, gt=0, le=1)
+):
+    """Penalize (or close) the road edges crossing damaged areas of a georeferenced map"""
+    try:
+        bounds = incident_store.parse_bbox(bbox)
+        raster = DamageRaster.from_bytes(await damage_map.read(), bounds, damage_map.filename or "")
+    except (ValueError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return routing_engine.apply_damage(raster, penalty=penalty, block_threshold=block_threshold)
+
+@app.delete("/route/damage-map")
+def clear_damage_map():
+    return routing_engine.clear_damage()
+
+@app.post("/route/reachability")
+def compute_reachability(request: ReachabilityRequest, db: Session = Depends(get_db)):
+    """Areas reachable from the origins within each time band (isochrones)"""
+    if any(m <= 0 for m in request.minutes):
+        raise HTTPException(status_code=400, detail="minutes must be positive")
+    origins = list(request.nodes)
+    points = [(p.lat, p.lng) for p in request.points]
+    if request.emergency_types:
+        rows = db.query(EmergencyNodeModel).filter(EmergencyNodeModel.type.in_(request.emergency_types)).all()
+        for row in rows:
+            location = json.loads(row.location) if row.location else None
+            if location:
+                points.append((location["lat"], location["lng"]))
+    if points:
+        lats, lngs = zip(*points)
+        origins += [snapped["node"] for snapped in routing_engine.snap(lats, lngs)]
+    if not origins:
+        raise HTTPException(status_code=400, detail="Give nodes, points or emergency_types with at least one match")
+    try:
+        return routing_engine.reachability(
+            origins, minutes=request.minutes, speed_kmh=request.speed_kmh,
+            cell_m=request.cell_m, include_nodes=request.include_nodes,
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown node {e}")
+
+@app.post("/route/matrix")
+def compute_route_matrix(request: RouteMatrixRequest):
+    """Cost (and optionally path) from every source to every target"""
+    try:
+        return routing_engine.route_matrix(request.sources, request.targets, with_paths=request.paths)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown node {e}")
+
+@app.post("/route/origins")
+def activate_route_origins(origins: RouteOrigins):
+    """Keep shortest-path trees for these origins (e.g. responder bases) so
+    road closures repair their routes incrementally"""
+    try:
+        return {"active": routing_engine.activate_origins(origins.nodes)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown node {e}")
+
+@app.delete("/route/origins")
+def deactivate_route_origins(origins: RouteOrigins):
+    try:
+        return {"active": routing_engine.deactivate_origins(origins.nodes)}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown node {e}")
+
+def _update_road_status(conn, road_id, status):
+    table = RoadModel.__table__
+    conn.execute(table.update().where(table.c.id == road_id).values(status=status))
+
+@app.put("/roads/{road_id}/status")
+def update_road_status(road_id: int, update: RoadStatusUpdate):
+    if update.status not in STATUS_FACTORS:
+        raise HTTPException(status_code=400, detail=f"status must be one of {sorted(STATUS_FACTORS)}")
+    write_queue.submit(_update_road_status, road_id, update.status).result()
+    return routing_engine.set_road_status(road_id, update.status)
+
+@app.post("/dispatch/assign")
+def assign_teams(request: AssignmentRequest, db: Session = Depends(get_db)):
+    """Pair rescue teams with incidents at the lowest total (severity-weighted) travel cost"""
+    try:
+        bounds = incident_store.parse_bbox(request.bbox) if request.bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if any(t.node is None and (t.lat is None or t.lng is None) for t in request.teams):
+        raise HTTPException(status_code=400, detail="Every team needs a node or lat and lng")
+
+    started = time.perf_counter()
+    team_nodes = [t.node for t in request.teams]
+    to_snap = [i for i, t in enumerate(request.teams) if t.node is None]
+    if to_snap:
+        snapped = routing_engine.snap([request.teams[i].lat for i in to_snap], [request.teams[i].lng for i in to_snap])
+        for i, s in zip(to_snap, snapped):
+            team_nodes[i] = s["node"]
+
     incidents = [
-        {"id": 1, "type": "DAMAGE", "severity": "CRITICAL", "coordinates": {"lat": 34.0622, "lng": -118.2537}},
-        {"id": 2, "type": "BLOCKED", "severity": "MODERATE", "coordinates": {"lat": 34.0422, "lng": -118.2337}}
+        i for i in incident_store.query_incidents(db, bbox=bounds, since=request.since, ids=request.incident_ids)
+        if i["coordinates"]["lat"] is not None
     ]
-    
-    pdf_buffer = generate_pdf_report(incidents)
-    
-    return StreamingResponse(
-        pdf_buffer, 
-        media_type="application/pdf", 
-        headers={"Content-Disposition": "attachment; filename=damage_report.pdf"}
-    )
+    incident_nodes = [s["node"] for s in routing_engine.snap(
+        [i["coordinates"]["lat"] for i in incidents], [i["coordinates"]["lng"] for i in incidents])] if incidents else []
+
+    snapshot = routing_engine.snapshot
+    try:
+        costs = routing_engine.cost_matrix(team_nodes, incident_nodes, snapshot=snapshot)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown node {e}")
+    matrix_done = time.perf_counter()
+    weights = [severity_weight(i["severity"]) for i in incidents] if request.severity_weighting else None
+    pairs, solver = assign(costs, [t.capacity for t in request.teams], weights)
+    solved = time.perf_counter()
+
+    assigned_teams = {team for team, _ in pairs}
+    return {
+        "assignments": [
+            {"team": request.teams[team].id, "team_node": team_nodes[team],
+             "incident_id": incidents[incident]["id"], "severity": incidents[incident]["severity"],
+             "incident_node": incident_nodes[incident], "cost": float(costs[team, incident])}
+            for team, incident in pairs
+        ],
+        "unassigned_teams": [t.id for i, t in enumerate(request.teams) if i not in assigned_teams],
+        "unassigned_incidents": len(incidents) - len(pairs),
+        "total_cost": float(sum(costs[team, incident] for team, incident in pairs)),
+        "solver": solver,
+        "weights_version": snapshot.version,
+        "matrix_ms": round((matrix_done - started) * 1000, 3),
+        "solve_ms": round((solved - matrix_done) * 1000, 3),
+    }
+
+# 4. Reports
+def _report_etag(key):
+    # Weak: a report re-rendered for the same data differs in its timestamp only
+    return f'W/"{key}"'
+
+def _not_modified(request, key):
+    tags = request.headers.get("if-none-match", "")
+    return any(tag.strip().removeprefix("W/") == f'"{key}"' for tag in tags.split(",")) or tags.strip() == "*"
+
+def _report_file(job):
+    return FileResponse(job.path, media_type="application/pdf", filename="damage_report.pdf",
+                        headers={"ETag": _report_etag(job.id), "Cache-Control": "no-cache"})
+
+def _report_params(bbox):
+    try:
+        return incident_store.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/reports", status_code=202)
+def start_report(request: ReportRequest, db: Session = Depends(get_db)):
+    """Render a PDF report of the incidents in the background; poll the returned job"""
+    bounds = _report_params(request.bbox)
+    version = incident_store.dataset_version(db, bounds, request.since)
+    job = report_jobs.submit(version, bounds, request.since)
+    return {**job.to_dict(), "status_url": f"/reports/{job.id}", "download_url": f"/reports/{job.id}/download"}
+
+@app.get("/reports/generate")
+def download_report(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    since: Optional[datetime] = Query(None),
+    db: Session = Depends(get_db)
+):
+    # Same job as POST /reports, waited for here. Served from the report
+    # cache while no incident has changed; 304 if the client has it already
+    bounds = _report_params(bbox)
+    version = incident_store.dataset_version(db, bounds, since)
+    key = report_key(version, bounds, since)
+    if _not_modified(request, key):
+        return Response(status_code=304, headers={"ETag": _report_etag(key), "Cache-Control": "no-cache"})
+    job = report_jobs.submit(version, bounds, since)
+    try:
+        job.future.result()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Report failed: {e}")
+    return _report_file(job)
+
+@app.get("/reports/{job_id}")
+def report_status(job_id: str):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired report")
+    return job.to_dict()
+
+@app.get("/reports/{job_id}/download")
+def download_report_file(job_id: str, request: Request):
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired report")
+    status = job.status
+    if status == "failed":
+        raise HTTPException(status_code=500, detail=job.to_dict()["error"])
+    if status != "done":
+        raise HTTPException(status_code=409, detail=f"Report is {status}")
+    if _not_modified(request, job.id):
+        return Response(status_code=304, headers={"ETag": _report_etag(job.id), "Cache-Control": "no-cache"})
+    return _report_file(job)
 
 # Serve frontend UI at /app/ when FRONTEND_DIR is set
 if FRONTEND_DIR:
@@ -0,0 +1,102 @@
+"""
+Matrix Workers - the csgraph side of matrix routing, kept in a module
+with no import-time side effects
+
+RoutingEngine runs large cost matrices in worker processes started by a
+forkserver (or spawn) context, never by forking the threaded API
+process. Those workers import this module to unpickle their tasks, so
+it must not build a router, open the database or start threads.
+
+The pool outlives road updates: workers receive the topology once, and
+each snapshot's weights are published in a shared memory block that a
+task names along with the weights version. A worker rebuilds its matrix
+only when a task carries a version it has not loaded yet.
+"""
+
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+import numpy as np
+
+
+def worker_context():
+    """Start method for matrix pools: a fresh process, not a fork of this one"""
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    # Workers fork from a server that already imported numpy and scipy, so
+    # the pool a road update starts is ready in milliseconds
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def csgraph(indptr, indices, weight):
+    """scipy CSR matrix of the graph; blocked (infinite) arcs are dropped"""
+    n = len(indptr) - 1
+    keep = np.isfinite(weight)
+    if not keep.all():
+        indptr = np.concatenate(([0], np.cumsum(keep)))[indptr]
+        indices, weight = indices[keep], weight[keep]
+    return csr_matrix((weight, indices, indptr), shape=(n, n))
+
+
+def matrix_block(matrix, sources, targets, with_paths):
+    """Costs (len(sources) x len(targets)) and optionally index paths"""
+    if not with_paths:
+        return csgraph_dijkstra(matrix, indices=sources)[:, targets], None
+    dist, pred = csgraph_dijkstra(matrix, indices=sources, return_predecessors=True)
+    costs = dist[:, targets]
+    paths = []
+    for row, source in enumerate(sources):
+        row_paths = []
+        for col, target in enumerate(targets):
+            if costs[row, col] == math.inf:
+                row_paths.append(None)
+                continue
+            path = [int(target)]
+            while path[-1] != source:
+                path.append(int(pred[row, path[-1]]))
+            path.reverse()
+            row_paths.append(path)
+        paths.append(row_paths)
+    return costs, paths
+
+
+def share_weights(weight):
+    """Copy arc weights into a new shared memory block (the caller unlinks it)"""
+    weight = np.asarray(weight, dtype=np.float64)
+    block = shared_memory.SharedMemory(create=True, size=max(weight.nbytes, 1))
+    np.ndarray(weight.shape, dtype=np.float64, buffer=block.buf)[:] = weight
+    return block
+
+
+_worker_topology = None
+# (weights version, csgraph) last loaded by this worker
+_worker_matrix = (None, None)
+
+
+def init_worker(indptr, indices):
+    global _worker_topology
+    _worker_topology = (indptr, indices)
+
+
+def matrix_worker(weights, sources, targets, with_paths):
+    """weights is (version, shared memory name, number of arcs)"""
+    global _worker_matrix
+    version, name, size = weights
+    if _worker_matrix[0] != version:
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            weight = np.ndarray(size, dtype=np.float64, buffer=block.buf).copy()
+        finally:
+            block.close()
+        _worker_matrix = (version, csgraph(*_worker_topology, weight))
+    return matrix_block(_worker_matrix[1], sources, targets, with_paths)
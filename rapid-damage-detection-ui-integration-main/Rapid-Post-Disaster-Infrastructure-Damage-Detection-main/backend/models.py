@@ -26,8 +26,12 @@ class Incident(Base):
     # Spatial Point (stored as JSON string)
     location = Column(String)  # JSON: {"lat": 0.0, "lng": 0.0}
     
+    # Numeric copy of location, mirrored into the incidents_rtree index
+    lat = Column(Float)
+    lng = Column(Float)
+    
     description = Column(String)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     
     disaster = relationship("Disaster", back_populates="incidents")
 
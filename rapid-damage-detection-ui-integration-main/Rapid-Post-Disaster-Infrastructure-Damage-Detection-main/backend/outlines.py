@@ -0,0 +1,195 @@
+"""
+Outlines - dissolve regions of a pixel grid into valid polygons
+
+Damage masks and reachability grids are sets of square pixels. Writing
+each pixel run as its own rectangle gives MultiPolygons whose parts share
+edges, which is invalid Simple Features geometry. Instead the boundary
+between set and unset pixels is traced into rings:
+
+  - every boundary edge is directed with the set pixel on its left (when
+    y points up), and edges are linked corner to corner;
+  - where two set pixels touch only diagonally the trace turns so they
+    stay apart, so such parts become separate polygons meeting at a point;
+  - a ring that comes back to such a corner (a region closing on itself
+    diagonally) is split there into a shell and a hole that touch at one
+    point, as the OGC rules allow.
+
+Only corners where the boundary turns become vertices.
+"""
+
+import numpy as np
+
+try:
+    from scipy import ndimage
+    HAS_NDIMAGE = True
+except ImportError:
+    HAS_NDIMAGE = False
+
+# Edge directions in pixel space (x = column, y = row): east, +y, west, -y.
+# At a diagonal-only corner the trace takes direction (d + 1) % 4
+_DX = np.array([1, 0, -1, 0])
+_DY = np.array([0, 1, 0, -1])
+
+
+def label(mask, diagonal: bool = False):
+    """Connected components of mask, 4- or (diagonal) 8-connected: (labels, count)"""
+    mask = np.asarray(mask, dtype=bool)
+    if HAS_NDIMAGE:
+        return ndimage.label(mask, structure=np.ones((3, 3), dtype=bool) if diagonal else None)
+
+    # Without scipy: spread the smallest pixel index over each component
+    h, w = mask.shape
+    none = h * w
+    labels = np.where(mask, np.arange(none).reshape(h, w), none)
+    shifts = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    if diagonal:
+        shifts += [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+    while True:
+        padded = np.pad(labels, 1, constant_values=none)
+        spread = labels.copy()
+        for dy, dx in shifts:
+            np.minimum(spread, padded[1 + dy:1 + dy + h, 1 + dx:1 + dx + w], out=spread)
+        spread = np.where(mask, spread, none)
+        # A label is a pixel of the same component, so adopt that pixel's label
+        flat = spread.ravel()
+        inside = flat < none
+        flat[inside] = np.minimum(flat[inside], flat[flat[inside]])
+        if np.array_equal(spread, labels):
+            break
+        labels = spread
+    ids = np.unique(labels[mask])
+    out = np.zeros((h, w), dtype=np.int32)
+    out[mask] = np.searchsorted(ids, labels[mask]) + 1
+    return out, len(ids)
+
+
+def trace(mask, labels=None):
+    """
+    Polygons outlining the set pixels of mask, as (rings, part) pairs:
+    rings[0] is the shell and the rest are its holes, each a closed list of
+    (x, y) pixel-corner coordinates (x = column, y = row). Shells are
+    counterclockwise and holes clockwise when y points up. part is the
+    polygon's 4-connected component in labels (default label(mask)).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    h, w = mask.shape
+    if labels is None:
+        labels = label(mask)[0]
+    padded = np.zeros((h + 2, w + 2), dtype=bool)
+    padded[1:-1, 1:-1] = mask
+
+    # Boundary edges: (unset neighbour, direction, start corner offset)
+    sides = [
+        (~padded[:-2, 1:-1], 0, 0, 0),  # y - 1 side, along y = row
+        (~padded[1:-1, 2:], 1, 1, 0),   # x + 1 side, along x = column + 1
+        (~padded[2:, 1:-1], 2, 1, 1),   # y + 1 side, along y = row + 1
+        (~padded[1:-1, :-2], 3, 0, 1),  # x - 1 side, along x = column
+    ]
+    found = [(np.nonzero(mask & unset), d, ox, oy) for unset, d, ox, oy in sides]
+    row = np.concatenate([r for (r, _), _, _, _ in found])
+    col = np.concatenate([c for (_, c), _, _, _ in found])
+    if len(row) == 0:
+        return []
+    d = np.concatenate([np.full(len(r), k) for (r, _), k, _, _ in found])
+    x = np.concatenate([c + ox for (_, c), _, ox, _ in found])
+    y = np.concatenate([r + oy for (r, _), _, _, oy in found])
+
+    # Link each edge to the one leaving its end corner; a corner with two
+    # outgoing edges (diagonal-only contact) takes the right turn
+    start = y * (w + 1) + x
+    end = (y + _DY[d]) * (w + 1) + (x + _DX[d])
+    order = np.argsort(start, kind="stable")
+    sorted_start = start[order]
+    first = np.searchsorted(sorted_start, end)
+    two = np.searchsorted(sorted_start, end, side="right") - first == 2
+    nxt = order[first]
+    other = order[np.minimum(first + 1, len(order) - 1)]
+    nxt = np.where(two & (d[nxt] != (d + 1) % 4), other, nxt)
+    prev = np.empty_like(nxt)
+    prev[nxt] = np.arange(len(nxt))
+    corner = d != d[prev]
+    vertex, counts = np.unique(start, return_counts=True)
+    pinch = set(vertex[counts == 2].tolist())
+
+    # Walk each cycle, keeping its corners; a corner met twice closes a loop
+    loops = []
+    nxt_l, corner_l, start_l = nxt.tolist(), corner.tolist(), start.tolist()
+    seen = [False] * len(nxt_l)
+    for e in np.flatnonzero(corner).tolist():
+        if seen[e]:
+            continue
+        stack, at = [], {}
+        while not seen[e]:
+            seen[e] = True
+            if corner_l[e]:
+                v = start_l[e]
+                if v in pinch:
+                    i = at.get(v)
+                    if i is not None:
+                        loops.append(stack[i:])
+                        for u, _ in stack[i + 1:]:
+                            at.pop(u, None)
+                        del stack[i:]
+                    at[v] = len(stack)
+                stack.append((v, e))
+            e = nxt_l[e]
+        loops.append(stack)
+
+    shells, holes = {}, []
+    for loop in loops:
+        v = np.array([u for u, _ in loop])
+        ring = np.column_stack([v % (w + 1), v // (w + 1)])
+        area = _signed_area(ring)
+        e = loop[0][1]
+        part = int(labels[row[e], col[e]])
+        if area > 0:
+            shells.setdefault(part, []).append((ring, area))
+        else:
+            holes.append((ring, part))
+
+    polygons = {id(ring): [ring] for candidates in shells.values() for ring, _ in candidates}
+    for ring, part in holes:
+        candidates = shells[part]
+        if len(candidates) > 1:
+            # Not expected for one 4-connected part; fall back to containment
+            px, py = (ring[0] + ring[1]) / 2
+            candidates = sorted((c for c in candidates if _contains(c[0], px, py)), key=lambda c: c[1])
+        polygons[id(candidates[0][0])].append(ring)
+
+    return [
+        ([np.vstack([r, r[:1]]).tolist() for r in polygons[id(ring)]], part)
+        for part, candidates in sorted(shells.items())
+        for ring, _ in candidates
+    ]
+
+
+def geojson(polygons, x0: float, dx: float, y0: float, dy: float, multi: bool = False):
+    """
+    GeoJSON geometry of traced polygons at lng = x0 + x * dx and
+    lat = y0 + y * dy: a Polygon, or a MultiPolygon for several (or none,
+    or always with multi). Rings keep the right-hand rule (shells
+    counterclockwise).
+    """
+    flip = dx * dy < 0
+    coordinates = [
+        [[[x0 + x * dx, y0 + y * dy] for x, y in (ring[::-1] if flip else ring)] for ring in rings]
+        for rings, _ in polygons
+    ]
+    if len(coordinates) == 1 and not multi:
+        return {"type": "Polygon", "coordinates": coordinates[0]}
+    return {"type": "MultiPolygon", "coordinates": coordinates}
+
+
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def _contains(ring, px, py):
+    """Even-odd test of (px, py) against a ring of vertices"""
+    x, y = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(x, -1), np.roll(y, -1)
+    crosses = (y > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        at = x + (py - y) * (x2 - x) / (y2 - y)
+    return bool(np.count_nonzero(crosses & (px < at)) % 2)
@@ -1,57 +1,130 @@
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.lib.units import inch
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Frame, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus.doctemplate import LayoutError
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 import io
 from datetime import datetime
+from itertools import islice
 
-def generate_pdf_report(incidents_data: list):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
+# Incident rows per table. Small tables keep layout linear in the number
+# of incidents (reportlab re-splits one big table page by page, which is
+# quadratic) and let rows be rendered as they stream in
+TABLE_CHUNK_ROWS = 40
+COL_WIDTHS = (60, 110, 90, 160)
+ROW_HEIGHT = 15
+
+TABLE_HEADER = ['ID', 'Type', 'Severity', 'Coordinates']
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+
+def _row(inc):
+    coordinates = inc.get('coordinates') or {}
+    lat, lng = coordinates.get('lat'), coordinates.get('lng')
+    return [
+        inc.get('id', 'N/A'),
+        inc.get('type', 'Unknown'),
+        inc.get('severity', 'LOW'),
+        f"{lat:.4f}, {lng:.4f}" if lat is not None and lng is not None else 'N/A'
+    ]
+
+
+def _story(incidents, counter):
+    """Flowables of the report, yielded a page-sized batch at a time"""
     styles = getSampleStyleSheet()
-    
-    story = []
-    
-    # Title
-    title_style = styles['Title']
-    story.append(Paragraph("ResQ Sentinel - Damage Assessment Report", title_style))
-    story.append(Spacer(1, 12))
-    
-    # Meta Info
-    normal_style = styles['Normal']
-    story.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style))
-    story.append(Paragraph(f"Sector: Downtown Los Angeles (Zone 7)", normal_style))
-    story.append(Spacer(1, 24))
-    
-    # Table Data
-    data = [['ID', 'Type', 'Severity', 'Coordinates']]
-    for inc in incidents_data:
-        data.append([
-            inc.get('id', 'N/A'),
-            inc.get('type', 'Unknown'),
-            inc.get('severity', 'LOW'),
-            f"{inc.get('coordinates', {}).get('lat', 0):.4f}, {inc.get('coordinates', {}).get('lng', 0):.4f}"
-        ])
-        
-    # Table Style
-    t = Table(data)
-    t.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(t)
-    story.append(Spacer(1, 24))
-    
+
+    # Title and meta info
+    yield [
+        Paragraph("ResQ Sentinel - Damage Assessment Report", styles['Title']),
+        Spacer(1, 12),
+        Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']),
+        Paragraph(f"Sector: Downtown Los Angeles (Zone 7)", styles['Normal']),
+        Spacer(1, 24),
+    ]
+
+    # Incident table, in chunks split across pages as they fill
+    rows = iter(incidents)
+    while True:
+        chunk = [_row(inc) for inc in islice(rows, TABLE_CHUNK_ROWS)]
+        if not chunk:
+            break
+        counter[0] += len(chunk)
+        yield [Table([TABLE_HEADER] + chunk, colWidths=COL_WIDTHS,
+                     rowHeights=ROW_HEIGHT, repeatRows=1, style=TABLE_STYLE)]
+
     # Disclaimer
     footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, textColor=colors.grey)
-    story.append(Paragraph("CONFIDENTIAL - FOR AUTHORIZED PERSONNEL ONLY", footer_style))
-    
-    doc.build(story)
+    yield [Spacer(1, 24), Paragraph("CONFIDENTIAL - FOR AUTHORIZED PERSONNEL ONLY", footer_style)]
+
+
+def _frame():
+    # The frame SimpleDocTemplate gives a letter page: 1 inch margins
+    width, height = letter
+    return Frame(inch, inch, width - 2 * inch, height - 2 * inch)
+
+
+def _fill(frame, canvas, pending):
+    """
+    Place flowables from the front of pending in frame until it is full,
+    splitting one that only partly fits (a table breaks between rows and
+    repeats its header). Returns whether anything was placed.
+    """
+    placed = False
+    while pending:
+        if not frame.add(pending[0], canvas):
+            # Split off the part that fits, if any; the frame is full either way
+            parts = frame.split(pending[0], canvas)
+            if parts and frame.add(parts[0], canvas):
+                pending[:1] = parts[1:]
+                placed = True
+            break
+        del pending[0]
+        placed = True
+    return placed
+
+
+def render_pdf_report(incidents, output) -> int:
+    """
+    Write the report for an iterable of incident dicts (e.g. streamed from
+    a DB cursor) to output, a file path or binary file object.
+    Returns the number of incidents written.
+
+    Pages are laid out directly with platypus Frames on a canvas. The next
+    batch of flowables is only built once the current one is placed, so
+    about a page of them exists at a time.
+    """
+    counter = [0]
+    canvas = Canvas(output, pagesize=letter, pageCompression=1)
+    frame, fresh = _frame(), True
+    pending = []
+    for batch in _story(incidents, counter):
+        pending.extend(batch)
+        while pending:
+            if _fill(frame, canvas, pending):
+                fresh = False
+            if not pending:
+                break
+            if fresh:
+                raise LayoutError(f"{pending[0].identity()} is too large for a page")
+            # Frame full: the rest goes on the next page
+            canvas.showPage()
+            frame, fresh = _frame(), True
+    canvas.showPage()
+    canvas.save()
+    return counter[0]
+
+
+def generate_pdf_report(incidents_data: list):
+    buffer = io.BytesIO()
+    render_pdf_report(incidents_data, buffer)
     buffer.seek(0)
     return buffer
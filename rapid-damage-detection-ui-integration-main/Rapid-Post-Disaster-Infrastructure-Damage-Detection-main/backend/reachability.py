@@ -0,0 +1,87 @@
+"""
+Reachability - which parts of the network responders can reach in time
+
+A single Dijkstra search is seeded with every origin at distance 0 and
+cut off at the largest time band, so many origins cost one search. Each
+reached node records its travel cost and the origin that reaches it
+first. Reached nodes are binned into a square grid for display: each
+band becomes a GeoJSON MultiPolygon of the cells containing a reachable
+node, with adjacent cells dissolved into outlines (see outlines.py).
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+import outlines
+
+try:
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+METERS_PER_DEGREE = 111_320.0
+
+
+def multi_source_bounded(graph, sources, limit: float, matrix=None):
+    """
+    Cost from the nearest source to every node, up to limit.
+    Returns (dist, origin): dist is inf and origin -1 for nodes beyond it.
+    matrix: scipy CSR of the current weights, to run the search in C
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    if matrix is not None and HAS_SCIPY:
+        dist, _, origin = csgraph_dijkstra(matrix, indices=sources, limit=limit,
+                                           min_only=True, return_predecessors=True)
+        origin = np.where(np.isfinite(dist), origin, -1)
+        return dist, origin
+
+    indptr, indices, weights = graph.lists()[:3]
+    dist = [math.inf] * graph.num_nodes
+    origin = [-1] * graph.num_nodes
+    heap = []
+    for s in sources.tolist():
+        dist[s] = 0.0
+        origin[s] = s
+        heap.append((0.0, s))
+    heapq.heapify(heap)
+    push, pop = heapq.heappush, heapq.heappop
+    while heap:
+        d, u = pop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            nd = d + weights[k]
+            if nd <= limit and nd < dist[v]:
+                dist[v] = nd
+                origin[v] = origin[u]
+                push(heap, (nd, v))
+    return np.array(dist), np.array(origin, dtype=np.int64)
+
+
+def coverage_grid(lat, lng, cell_m: float):
+    """
+    GeoJSON MultiPolygon outlining the cell_m x cell_m grid cells that
+    contain any of the points (one polygon per 4-connected group of cells,
+    with its holes), plus the covered area in km^2 from the cell count
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    if len(lat) == 0:
+        return {"type": "MultiPolygon", "coordinates": []}, 0.0
+
+    # Local equirectangular grid anchored at the south-west point
+    lat0, lng0 = float(lat.min()), float(lng.min())
+    d_lat = cell_m / METERS_PER_DEGREE
+    d_lng = d_lat / math.cos(math.radians(float(lat.mean())))
+    row = np.floor((lat - lat0) / d_lat).astype(np.int64)
+    col = np.floor((lng - lng0) / d_lng).astype(np.int64)
+    covered = np.zeros((row.max() + 1, col.max() + 1), dtype=bool)
+    covered[row, col] = True
+
+    # Row 0 is the south edge
+    coverage = outlines.geojson(outlines.trace(covered), lng0, d_lng, lat0, d_lat, multi=True)
+    return coverage, int(covered.sum()) * cell_m * cell_m / 1e6
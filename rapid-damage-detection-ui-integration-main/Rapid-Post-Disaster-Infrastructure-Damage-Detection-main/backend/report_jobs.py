@@ -0,0 +1,244 @@
+"""
+Report Jobs - PDF reports rendered off the request path, and cached
+
+Rendering a report for tens of thousands of incidents takes seconds of
+CPU. Jobs run in a worker process (reportlab is pure Python and would
+hold the GIL against the request handlers), stream incidents from the
+database in batches, and write the PDF to a file that the API then
+streams to the client.
+
+Reports are cached on disk by key: the dataset version of the incidents
+they cover (incidents.dataset_version) plus the report parameters. The
+key doubles as the job id and the HTTP ETag. While no incident changes,
+a dashboard polling the same report gets the rendered file (or a 304).
+Any insert, update or delete changes the version and so the key, and
+the superseded file for those parameters is removed. Files are evicted
+least-recently-used beyond REPORT_CACHE_MB.
+"""
+
+import datetime
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", 1))
+REPORT_DIR = os.environ.get("REPORT_DIR") or os.path.join(tempfile.gettempdir(), "resq-reports")
+# Disk budget for rendered reports
+REPORT_CACHE_MB = float(os.environ.get("REPORT_CACHE_MB", 256))
+# Seconds a finished job stays listed (its file stays while the budget allows)
+REPORT_TTL_S = 3600
+# Incidents read from the database per batch while rendering
+REPORT_BATCH_SIZE = 2000
+# Bump when the report layout changes so older cached PDFs are not served
+REPORT_FORMAT = 1
+
+
+# Engine of the worker process, opened by _init_worker
+_worker_engine = None
+
+
+def _mp_context():
+    # Workers start as fresh processes: a fork of the API process would
+    # inherit its threads, locks and pooled database connections
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _init_worker(database_url: str):
+    global _worker_engine
+    from database import make_engine
+    _worker_engine = make_engine(database_url)
+
+
+def render_incident_report(path: str,
+                           bbox: Optional[Tuple[float, float, float, float]] = None,
+                           since: Optional[datetime.datetime] = None) -> dict:
+    """Render the report for incidents matching bbox/since to path (runs in the worker)"""
+    import incidents as incident_store
+    from pdf import render_pdf_report
+
+    engine = _worker_engine
+    if engine is None:
+        # Called in-process (benchmarks, tests)
+        from database import engine
+
+    started = time.perf_counter()
+    rows = (
+        incident_store.incident_to_dict(row)
+        for batch in incident_store.iter_incident_batches(engine, bbox, since, REPORT_BATCH_SIZE)
+        for row in batch
+    )
+    partial = path + ".part"
+    try:
+        count = render_pdf_report(rows, partial)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return {"incidents": count, "bytes": os.path.getsize(path),
+            "render_s": round(time.perf_counter() - started, 3)}
+
+
+def report_key(version, bbox=None, since=None) -> str:
+    """Cache key (and ETag) of a report over a dataset version"""
+    params = repr((REPORT_FORMAT, bbox, since.isoformat() if since else None))
+    return hashlib.blake2b(f"{params}|{version!r}".encode(), digest_size=16).hexdigest()
+
+
+class ReportJob:
+    def __init__(self, job_id: str, path: str, future, params: str):
+        self.id = job_id
+        self.path = path
+        self.future = future
+        self.params = params
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def status(self) -> str:
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        return "failed" if self.future.exception() is not None else "done"
+
+    def to_dict(self) -> dict:
+        info = {"job_id": self.id, "status": self.status}
+        if info["status"] == "done":
+            info.update(self.future.result())
+        elif info["status"] == "failed":
+            info["error"] = str(self.future.exception())
+        return info
+
+
+class ReportJobs:
+    def __init__(self, directory: str = REPORT_DIR, workers: int = REPORT_WORKERS,
+                 ttl: float = REPORT_TTL_S, budget_mb: float = REPORT_CACHE_MB):
+        self.directory = directory
+        self.workers = workers
+        self.ttl = ttl
+        self.budget = int(budget_mb * 1e6)
+        self._jobs = {}
+        self._latest = {}  # report parameters -> key of the newest report
+        self._pool = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"report-{key}.pdf")
+
+    def submit(self, version, bbox=None, since=None) -> ReportJob:
+        """
+        The report of incidents matching bbox/since at the given dataset
+        version: the cached file if there is one, the job already
+        rendering it, or a new job. Returns at once.
+        """
+        self._expire()
+        os.makedirs(self.directory, exist_ok=True)
+        key = report_key(version, bbox, since)
+        params = report_key(None, bbox, since)
+        path = self.path(key)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and (job.status in ("queued", "running") or
+                                    (job.status == "done" and os.path.exists(path))):
+                self._hit(job)
+                return job
+            if os.path.exists(path):
+                # Rendered by an earlier job (or process) for the same data
+                future = Future()
+                future.set_result({"incidents": version[0] if isinstance(version, tuple) else None,
+                                   "bytes": os.path.getsize(path), "cached": True})
+                job = self._jobs[key] = ReportJob(key, path, future, params)
+                job.finished = time.time()
+                self._hit(job)
+                return job
+
+            if self._pool is None:
+                from database import DATABASE_URL
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=_mp_context(),
+                                                 initializer=_init_worker, initargs=(DATABASE_URL,))
+            self.misses += 1
+            job = ReportJob(key, path, self._pool.submit(render_incident_report, path, bbox, since), params)
+            self._jobs[key] = job
+        job.future.add_done_callback(lambda _: self._finished(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is not None and job.status == "done" and not os.path.exists(job.path):
+            return None  # evicted
+        return job
+
+    def _hit(self, job):
+        self.hits += 1
+        if job.status == "done":
+            try:
+                os.utime(job.path)  # most recently used
+            except OSError:
+                pass
+
+    def _finished(self, job):
+        if job.status == "done":
+            with self._lock:
+                superseded = self._latest.get(job.params)
+                self._latest[job.params] = job.id
+            if superseded is not None and superseded != job.id:
+                # The data changed since that report; nobody asks for its key any more
+                self._remove(superseded)
+            self._enforce_budget(keep=job.path)
+        # Set last: once finished, the cache is settled for this job
+        job.finished = time.time()
+
+    def _remove(self, key):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status in ("queued", "running"):
+                return
+            self._jobs.pop(key, None)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def _enforce_budget(self, keep=None):
+        # Evict least recently used reports until the cache fits the budget
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("report-") and entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.budget:
+                break
+            if path == keep:
+                continue
+            self._remove(os.path.basename(path)[len("report-"):-len(".pdf")])
+            total -= size
+
+    def _expire(self):
+        # Forget finished jobs older than the TTL; their files stay cached
+        now = time.time()
+        with self._lock:
+            for job in [j for j in self._jobs.values() if j.finished is not None and now - j.finished > self.ttl]:
+                del self._jobs[job.id]
+
+    def stats(self) -> dict:
+        files = [e.stat().st_size for e in os.scandir(self.directory)
+                 if e.name.startswith("report-") and e.name.endswith(".pdf")] if os.path.isdir(self.directory) else []
+        return {"hits": self.hits, "misses": self.misses, "files": len(files),
+                "bytes": sum(files), "budget_bytes": self.budget}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+report_jobs = ReportJobs()
@@ -1,56 +1,822 @@
-import networkx as nx
+import heapq
 import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from contraction import ContractionHierarchy, graph_checksum
+from damage_costs import DAMAGE_BLOCK_THRESHOLD, DAMAGE_PENALTY, sample_edges, damage_factors
+from reachability import coverage_grid, multi_source_bounded
+from graph_cache import load_cached_network
+from matrix_workers import (
+    HAS_SCIPY, csgraph, init_worker, matrix_block, matrix_worker, share_weights, worker_context,
+)
+from road_graph import RoadGraph, EARTH_RADIUS_M
+
+# Optional real network, e.g. a GeoJSON or .osm extract of the city
+ROAD_NETWORK_PATH = os.environ.get("ROAD_NETWORK_PATH")
+# Compiled, memory-mappable copy of it (default: next to the network)
+GRAPH_CACHE_PATH = os.environ.get("GRAPH_CACHE_PATH")
+# Contraction hierarchy built offline by contraction.py (default: next to the network)
+CH_PATH = os.environ.get("CH_PATH")
+
+# Cost multiplier applied to a road's arcs for each Road.status
+STATUS_FACTORS = {"OPEN": 1.0, "RESTRICTED": 3.0, "BLOCKED": math.inf}
+
+# A BLOCKED incident closes the nearest road edge within this distance
+INCIDENT_SNAP_M = 100.0
+
+# Worker processes for matrix routing (csgraph holds the GIL, so threads
+# would not help); 1 runs everything in the request thread
+ROUTING_WORKERS = int(os.environ.get("ROUTING_WORKERS", os.cpu_count() or 1))
+# Distance cells (sources x nodes) computed per task, bounding peak memory
+MATRIX_BLOCK_CELLS = 1 << 24
+# Below this many cells a matrix runs in the request thread: handing it to
+# the pool (pickling, a round trip per task) costs more than it saves
+MATRIX_INLINE_CELLS = 1 << 21
+
+# Travel speed assumed for reachability time bands over a damaged network
+DEFAULT_SPEED_KMH = 30.0
+REACHABILITY_CACHE_SIZE = 64
+
+# Most recent routes served from active-origin trees that road updates
+# check for invalidation (LRU)
+ACTIVE_ROUTES_SIZE = 10000
+
+
+def scaled(base, factor):
+    """base x factor per arc, inf wherever the factor is (0 x inf is not NaN)"""
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isinf(factor), math.inf, base * factor)
+
+
+def astar(graph: RoadGraph, source: int, target: int):
+    """
+    A* over the CSR graph with a haversine heuristic (scaled so it never
+    overestimates). Returns (node index path, cost), or (None, inf) when
+    the target is unreachable. Path and cost come from the same search.
+    """
+    indptr, indices, weights, lat, lng, cos_lat = graph.lists()
+    # Slightly under 1 so float rounding can't make the heuristic inadmissible
+    scale = graph.heuristic_scale() * 0.999999 * 2 * EARTH_RADIUS_M
+    t_lat, t_lng, t_cos = lat[target], lng[target], cos_lat[target]
+    sin, asin, sqrt = math.sin, math.asin, math.sqrt
+
+    def h(v):
+        a = sin((t_lat - lat[v]) / 2) ** 2 + cos_lat[v] * t_cos * sin((t_lng - lng[v]) / 2) ** 2
+        return scale * asin(sqrt(min(a, 1.0)))
+
+    n = graph.num_nodes
+    dist = [math.inf] * n
+    parent = [-1] * n
+    closed = bytearray(n)
+    dist[source] = 0.0
+    heap = [(h(source), 0.0, source)]
+    push, pop = heapq.heappush, heapq.heappop
+
+    while heap:
+        _, d, u = pop(heap)
+        if closed[u]:
+            continue
+        if u == target:
+            path = [u]
+            while path[-1] != source:
+                path.append(parent[path[-1]])
+            path.reverse()
+            return path, d
+        closed[u] = 1
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent[v] = u
+                push(heap, (nd + h(v), nd, v))
+    return None, math.inf
+
+
+def shortest_path_tree(graph: RoadGraph, source: int):
+    """Full Dijkstra from source. Returns (dist, parent_arc) lists."""
+    indptr, indices, weights = graph.lists()[:3]
+    n = graph.num_nodes
+    dist = [math.inf] * n
+    parent_arc = [-1] * n
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    push, pop = heapq.heappush, heapq.heappop
+    while heap:
+        d, u = pop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent_arc[v] = k
+                push(heap, (nd, v))
+    return dist, parent_arc
+
+
+class ShortestPathTree:
+    """
+    Cached shortest-path tree of an active origin. When arc weights change
+    it is repaired in place (dynamic SSSP) instead of being recomputed.
+    """
+
+    def __init__(self, graph: RoadGraph, origin: int):
+        self.origin = origin
+        self.dist, self.parent_arc = shortest_path_tree(graph, origin)
+
+    def copy(self):
+        """Independent copy, to be repaired for a newer snapshot"""
+        tree = ShortestPathTree.__new__(ShortestPathTree)
+        tree.origin, tree.dist, tree.parent_arc = self.origin, list(self.dist), list(self.parent_arc)
+        return tree
+
+    def path_to(self, graph: RoadGraph, target: int):
+        if self.dist[target] == math.inf:
+            return None
+        arc_src = graph.reverse()[2]
+        path = [target]
+        while path[-1] != self.origin:
+            path.append(arc_src[self.parent_arc[path[-1]]])
+        path.reverse()
+        return path
+
+    def repair(self, graph: RoadGraph, increased, decreased) -> set:
+        """
+        Bring the tree up to date after the weights of the given arcs went
+        up or down (graph already holds the new weights). Returns the nodes
+        whose distance or parent changed.
+        """
+        indptr, indices, weights = graph.lists()[:3]
+        rev_indptr, rev_arcs, arc_src = graph.reverse()
+        dist, parent_arc = self.dist, self.parent_arc
+        push, pop = heapq.heappush, heapq.heappop
+        changed = set()
+
+        def settle(heap):
+            while heap:
+                d, x = pop(heap)
+                if d > dist[x]:
+                    continue
+                for k in range(indptr[x], indptr[x + 1]):
+                    w = indices[k]
+                    nd = d + weights[k]
+                    if nd < dist[w]:
+                        dist[w] = nd
+                        parent_arc[w] = k
+                        changed.add(w)
+                        push(heap, (nd, w))
+
+        # Heavier tree arcs orphan the subtree below them; nothing outside
+        # it can get shorter, so only the subtree is re-settled, seeded from
+        # its unaffected in-neighbours
+        roots = [indices[k] for k in increased if parent_arc[indices[k]] == k]
+        if roots:
+            affected = set(roots)
+            stack = list(roots)
+            while stack:
+                x = stack.pop()
+                for k in range(indptr[x], indptr[x + 1]):
+                    w = indices[k]
+                    if parent_arc[w] == k and w not in affected:
+                        affected.add(w)
+                        stack.append(w)
+            before = {x: (dist[x], parent_arc[x]) for x in affected}
+            for x in affected:
+                dist[x] = math.inf
+                parent_arc[x] = -1
+            heap = []
+            for x in affected:
+                for j in range(rev_indptr[x], rev_indptr[x + 1]):
+                    k = rev_arcs[j]
+                    nd = dist[arc_src[k]] + weights[k]
+                    if nd < dist[x]:
+                        dist[x] = nd
+                        parent_arc[x] = k
+                if dist[x] < math.inf:
+                    heap.append((dist[x], x))
+            heapq.heapify(heap)
+            settle(heap)
+            changed.update(x for x, old in before.items() if old != (dist[x], parent_arc[x]))
+
+        # Lighter arcs can only shorten paths: propagate from their heads
+        heap = []
+        for k in decreased:
+            v = indices[k]
+            nd = dist[arc_src[k]] + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent_arc[v] = k
+                changed.add(v)
+                push(heap, (nd, v))
+        settle(heap)
+        return changed
+
+
+class GraphSnapshot:
+    """
+    One immutable version of the live network: the graph with its current
+    weights, the status/damage factors behind them and the trees of the
+    active origins. Road updates publish a new snapshot that shares the
+    unchanged arrays instead of modifying this one, so a query holding a
+    snapshot finishes on consistent data without taking a lock.
+    """
+
+    def __init__(self, version: int, graph: RoadGraph, edge_factor, edge_damage, trees):
+        self.version = version
+        self.graph = graph
+        self.edge_factor = edge_factor
+        self.edge_damage = edge_damage
+        self.trees = trees
+        for a in (graph.weight, edge_factor, edge_damage):
+            a.flags.writeable = False
+        self._csgraph = None
+        self._travel = None
+
+    def csgraph(self):
+        """scipy CSR matrix of this snapshot's weights (built once)"""
+        if self._csgraph is None:
+            graph = self.graph
+            self._csgraph = csgraph(graph.indptr, graph.indices, graph.weight)
+        return self._csgraph
+
+    def travel(self):
+        """
+        (graph, scipy CSR or None) whose arc weights are meters of road
+        times the status/damage factors, for time-based queries. Networks
+        that route on length share this snapshot's graph; ones with other
+        base weights (the mock graph, weighted grids) get a copy.
+        """
+        if self._travel is None:
+            graph = self.graph
+            if np.array_equal(graph.base_weight, graph.length):
+                self._travel = (graph, self.csgraph() if HAS_SCIPY else None)
+            else:
+                factor = self.edge_factor[graph.arc_edge] * self.edge_damage[graph.arc_edge]
+                meters = scaled(graph.length, factor)
+                travel = graph.with_weights(np.arange(graph.num_arcs), meters)
+                self._travel = (travel, csgraph(graph.indptr, graph.indices, meters) if HAS_SCIPY else None)
+        return self._travel
+
+    def replace(self, **changes):
+        """Same snapshot with some fields swapped (trees, ...)"""
+        fields = {"version": self.version, "graph": self.graph, "edge_factor": self.edge_factor,
+                  "edge_damage": self.edge_damage, "trees": self.trees, **changes}
+        snapshot = GraphSnapshot(**fields)
+        if fields["graph"] is self.graph:
+            snapshot._csgraph = self._csgraph
+            if fields["edge_factor"] is self.edge_factor and fields["edge_damage"] is self.edge_damage:
+                snapshot._travel = self._travel
+        return snapshot
+
 
 class RoutingEngine:
-    def __init__(self):
-        self.graph = nx.Graph()
-        self._build_mock_graph()
+    def __init__(self, network_path: str = None, graph: RoadGraph = None):
+        path = network_path or ROAD_NETWORK_PATH
+        self.node_types = {}
+        if graph is not None:
+            path = network_path
+        elif path and os.path.exists(path):
+            graph = load_cached_network(path, GRAPH_CACHE_PATH)
+        else:
+            graph = self._build_mock_graph()
+
+        # Snapping index, built up front so the first coordinate query is fast
+        graph.node_index()
+
+        # Live road state (weights, status and damage cost multipliers per
+        # undirected edge, active-origin trees) as an immutable snapshot;
+        # writers serialize on _lock and swap in a new one
+        self.snapshot = GraphSnapshot(0, graph, np.ones(graph.num_edges), np.ones(graph.num_edges), {})
+        # Routes served from active-origin trees, as an LRU of
+        # (source, target) -> None. Queries record them under their own
+        # short lock so they never wait for a road update holding _lock
+        self.active_routes = OrderedDict()
+        self._routes_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Matrix routing worker pool, started once and kept across road
+        # updates. Weights reach it as shared memory blocks, one per
+        # weights_version: version -> [block, matrices using it]
+        self._pool = None
+        self._shared_weights = {}
+        # Reachability results for the current weights_version (LRU)
+        self._reach_cache = OrderedDict()
+        self._reach_version = None
+        # Contraction hierarchy as (weights_version it was built for, hierarchy)
+        self._ch = (None, None)
+        self._ch_thread = None
+        ch_path = CH_PATH or (path + ".ch.npz" if path else None)
+        if ch_path and os.path.exists(ch_path):
+            self.load_ch(ch_path)
+
+    # Views of the current snapshot
+    @property
+    def graph(self) -> RoadGraph:
+        return self.snapshot.graph
+
+    @property
+    def weights_version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def trees(self):
+        return self.snapshot.trees
+
+    @property
+    def ch(self):
+        return self._ch[1]
 
     def _build_mock_graph(self):
         # Create a simple grid graph representing LA Downtown streets
-        # Nodes are (lat, lng) tuples (simplified)
-        
-        # Base Node (Medical Alpha)
-        self.graph.add_node("base-alpha", pos=(34.0552, -118.2457), type="SAFE")
-        
-        # Incident Nodes
-        self.graph.add_node("incident-1", pos=(34.0622, -118.2537), type="DANGER")
-        self.graph.add_node("incident-2", pos=(34.0422, -118.2337), type="DANGER")
-        
-        # Intermediates
-        self.graph.add_node("node-a", pos=(34.0580, -118.2500))
-        self.graph.add_node("node-b", pos=(34.0500, -118.2400))
-        
-        # Edges with weights (distance/risk)
-        self.graph.add_edge("base-alpha", "node-a", weight=5)
-        self.graph.add_edge("node-a", "incident-1", weight=8)
-        self.graph.add_edge("base-alpha", "node-b", weight=4)
-        self.graph.add_edge("node-b", "incident-2", weight=10)
-        
-        # Cross connection
-        self.graph.add_edge("node-a", "node-b", weight=6)
+        nodes = [
+            # Base Node (Medical Alpha)
+            ("base-alpha", 34.0552, -118.2457, "SAFE"),
+            # Incident Nodes
+            ("incident-1", 34.0622, -118.2537, "DANGER"),
+            ("incident-2", 34.0422, -118.2337, "DANGER"),
+            # Intermediates
+            ("node-a", 34.0580, -118.2500, None),
+            ("node-b", 34.0500, -118.2400, None),
+        ]
+        # Edges with weights in abstract distance/risk units, not meters
+        # (route costs come out in these units; reachability uses length)
+        edges = [
+            ("base-alpha", "node-a", 5),
+            ("node-a", "incident-1", 8),
+            ("base-alpha", "node-b", 4),
+            ("node-b", "incident-2", 10),
+            # Cross connection
+            ("node-a", "node-b", 6),
+        ]
+        ids = [n[0] for n in nodes]
+        index = {node_id: i for i, node_id in enumerate(ids)}
+        self.node_types = {n[0]: n[3] for n in nodes if n[3]}
+        return RoadGraph.from_segments(
+            ids,
+            [n[1] for n in nodes],
+            [n[2] for n in nodes],
+            [index[u] for u, _, _ in edges],
+            [index[v] for _, v, _ in edges],
+            weight=[w for _, _, w in edges],
+            edge_road=list(range(1, len(edges) + 1)),  # Road ids 1..5
+        )
 
     def compute_route(self, start_id: str, end_id: str):
         try:
-            path = nx.dijkstra_path(self.graph, start_id, end_id, weight='weight')
-            length = nx.dijkstra_path_length(self.graph, start_id, end_id, weight='weight')
-            
+            # Everything below reads one snapshot, whatever writers publish meanwhile
+            snapshot = self.snapshot
+            graph = snapshot.graph
+            source, target = graph.index_of(start_id), graph.index_of(end_id)
+            tree = snapshot.trees.get(source)
+            ch_version, ch = self._ch
+            if tree is not None:
+                # Active origin: answer from the cached tree
+                path, length = tree.path_to(graph, target), tree.dist[target]
+                self._record_route(source, target)
+            elif ch is not None and ch_version == snapshot.version:
+                path, length = ch.query(source, target)
+            else:
+                # No hierarchy, or it is being re-customized for new weights
+                path, length = astar(graph, source, target)
+            if path is None:
+                return None
+
             # Convert path to coordinates for the frontend
-            coords = []
-            for node in path:
-                if 'pos' in self.graph.nodes[node]:
-                    lat, lng = self.graph.nodes[node]['pos']
-                    coords.append({"lat": lat, "lng": lng})
-            
+            coords = [{"lat": float(graph.lat[i]), "lng": float(graph.lng[i])} for i in path]
+
             return {
                 "path": coords,
                 "total_cost": length,
-                "nodes": path
+                "nodes": [graph.node_ids[i] for i in path],
+                "weights_version": snapshot.version,
             }
-        except nx.NetworkXNoPath:
+        except KeyError:
             return None
         except Exception as e:
             print(f"Routing Error: {e}")
             return None
 
+    # --- Contraction hierarchy ---
+
+    def load_ch(self, path):
+        """Use a hierarchy saved by contraction.py; re-customized if the weights differ"""
+        ch = ContractionHierarchy.load(path)
+        snapshot = self.snapshot
+        if ch.topology != graph_checksum(snapshot.graph):
+            print(f"Ignoring contraction hierarchy {path}: built for a different network")
+            return False
+        with self._lock:
+            current = ch.weights == graph_checksum(snapshot.graph, snapshot.graph.weight)
+            self._ch = (snapshot.version if current else None, ch)
+        self._recustomize_ch()
+        return True
+
+    def _recustomize_ch(self):
+        # Re-contract in the stored order on a background thread; queries
+        # fall back to A* until it catches up with weights_version
+        with self._lock:
+            if self._ch[1] is None or self._ch_thread is not None or self._ch[0] == self.snapshot.version:
+                return
+            self._ch_thread = threading.Thread(target=self._ch_worker, name="ch-customize", daemon=True)
+            self._ch_thread.start()
+
+    def _ch_worker(self):
+        # recontract is a full pass, so updates that land while it runs are
+        # not queued: the next pass simply takes the latest snapshot
+        while True:
+            with self._lock:
+                snapshot = self.snapshot
+                version, ch = self._ch
+                if version == snapshot.version:
+                    self._ch_thread = None
+                    return
+            # Snapshot weights never change, so no copy is needed
+            ch = ch.recontract(snapshot.graph)
+            with self._lock:
+                self._ch = (snapshot.version, ch)
+
+    # --- Matrix routing ---
+
+    def route_matrix(self, source_ids, target_ids, with_paths: bool = False):
+        """
+        Cost from every source to every target, one shortest-path tree per
+        source. Large source sets are split across worker processes.
+        Unreachable pairs have cost None (and path None).
+        """
+        snapshot = self.snapshot
+        graph = snapshot.graph
+        blocks = self._matrix_blocks(snapshot, source_ids, target_ids, with_paths)
+        costs = [[c if c != math.inf else None for c in row.tolist()] for block in blocks for row in block[0]]
+        result = {"sources": list(source_ids), "targets": list(target_ids), "costs": costs}
+        if with_paths:
+            result["paths"] = [
+                [[graph.node_ids[i] for i in path] if path is not None else None for path in row]
+                for block in blocks for row in block[1]
+            ]
+        result["weights_version"] = snapshot.version
+        return result
+
+    def cost_matrix(self, source_ids, target_ids, snapshot: GraphSnapshot = None):
+        """route_matrix costs as a NumPy array, inf where unreachable"""
+        blocks = self._matrix_blocks(snapshot or self.snapshot, source_ids, target_ids, False)
+        if not blocks:
+            return np.zeros((len(source_ids), len(target_ids)))
+        return np.vstack([block[0] for block in blocks])
+
+    def _matrix_blocks(self, snapshot, source_ids, target_ids, with_paths):
+        graph = snapshot.graph
+        sources = np.array([graph.index_of(s) for s in source_ids], dtype=np.int64)
+        targets = np.array([graph.index_of(t) for t in target_ids], dtype=np.int64)
+        if len(sources) == 0 or len(targets) == 0:
+            return []
+        if HAS_SCIPY:
+            return self._csgraph_blocks(snapshot, sources, targets, with_paths)
+        return [self._tree_block(snapshot, sources, targets, with_paths)]
+
+    def _csgraph_blocks(self, snapshot, sources, targets, with_paths):
+        nodes = max(snapshot.graph.num_nodes, 1)
+        size = max(1, MATRIX_BLOCK_CELLS // nodes)
+        workers = max(1, min(ROUTING_WORKERS, len(sources)))
+        if workers == 1 or len(sources) * nodes < MATRIX_INLINE_CELLS:
+            matrix = snapshot.csgraph()
+            return [matrix_block(matrix, sources[i:i + size], targets, with_paths)
+                    for i in range(0, len(sources), size)]
+        size = min(size, -(-len(sources) // workers))
+        chunks = [sources[i:i + size] for i in range(0, len(sources), size)]
+        pool, weights = self._acquire_weights(snapshot)
+        try:
+            return list(pool.map(matrix_worker, repeat(weights), chunks, repeat(targets), repeat(with_paths)))
+        finally:
+            self._release_weights(snapshot.version)
+
+    def _acquire_weights(self, snapshot):
+        # The pool, and the snapshot's weights published for it as
+        # (version, block name, arcs). The caller must hand the weights
+        # back with _release_weights
+        with self._lock:
+            graph = snapshot.graph
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    ROUTING_WORKERS,
+                    mp_context=worker_context(),
+                    initializer=init_worker,
+                    initargs=(graph.indptr, graph.indices),
+                )
+            block = self._publish_weights(snapshot, users=1)
+            return self._pool, (snapshot.version, block.name, graph.num_arcs)
+
+    def _publish_weights(self, snapshot, users=0):
+        # Caller holds the lock. Shares the snapshot's weights with the pool
+        # (once per version), counts users of them and frees the blocks
+        # nobody needs any more
+        entry = self._shared_weights.get(snapshot.version)
+        if entry is None:
+            entry = self._shared_weights[snapshot.version] = [share_weights(snapshot.graph.weight), 0]
+        entry[1] += users
+        self._free_weights()
+        return entry[0]
+
+    def _release_weights(self, version):
+        with self._lock:
+            self._shared_weights[version][1] -= 1
+            self._free_weights()
+
+    def _free_weights(self, keep_current=True):
+        # Caller holds the lock. Unlinks the blocks of superseded versions
+        # that no matrix is still using
+        for version, (block, users) in list(self._shared_weights.items()):
+            if users == 0 and not (keep_current and version == self.snapshot.version):
+                del self._shared_weights[version]
+                block.close()
+                block.unlink()
+
+    def _tree_block(self, snapshot, sources, targets, with_paths):
+        # Pure Python fallback when scipy is not installed
+        costs, paths = [], []
+        for source in sources.tolist():
+            tree = snapshot.trees.get(source)
+            if tree is None:
+                tree = ShortestPathTree(snapshot.graph, source)
+            costs.append([tree.dist[t] for t in targets.tolist()])
+            if with_paths:
+                paths.append([tree.path_to(snapshot.graph, t) for t in targets.tolist()])
+        return np.array(costs, dtype=np.float64).reshape(len(sources), len(targets)), paths
+
+    # --- Reachability ---
+
+    def reachability(self, origin_ids, minutes=(5, 10, 15), speed_kmh: float = DEFAULT_SPEED_KMH,
+                     cell_m: float = 200.0, include_nodes: bool = False):
+        """
+        Nodes reachable from any origin within each time band, with a grid
+        coverage polygon per band. One bounded multi-source search serves
+        all origins and bands; results are cached until weights change.
+        Travel time is road length (meters, from the coordinates) times the
+        status/damage factors at speed_kmh, whatever unit weight carries.
+        """
+        snapshot = self.snapshot
+        graph, version = snapshot.graph, snapshot.version
+        sources = sorted({graph.index_of(node_id) for node_id in origin_ids})
+        minutes = sorted({float(m) for m in minutes})
+        key = (tuple(sources), tuple(minutes), float(speed_kmh), float(cell_m), include_nodes)
+        with self._lock:
+            if self._reach_version != self.snapshot.version:
+                self._reach_cache.clear()
+                self._reach_version = self.snapshot.version
+            cached = self._reach_cache.get(key) if self._reach_version == version else None
+            if cached is not None:
+                self._reach_cache.move_to_end(key)
+                return {**cached, "cached": True}
+
+        meters_per_minute = speed_kmh * 1000 / 60
+        travel, matrix = snapshot.travel()
+        dist, origin = multi_source_bounded(travel, sources, minutes[-1] * meters_per_minute, matrix)
+
+        bands = []
+        for m in minutes:
+            reached = np.flatnonzero(dist <= m * meters_per_minute)
+            coverage, area = coverage_grid(graph.lat[reached], graph.lng[reached], cell_m)
+            band = {"minutes": m, "reachable_nodes": int(len(reached)),
+                    "area_km2": round(area, 3), "coverage": coverage}
+            if include_nodes:
+                band["nodes"] = [graph.node_ids[i] for i in reached.tolist()]
+            bands.append(band)
+
+        reached_by = np.bincount(origin[origin >= 0], minlength=graph.num_nodes)
+        result = {
+            "origins": [{"node": graph.node_ids[s], "nodes_served": int(reached_by[s])} for s in sources],
+            "speed_kmh": speed_kmh,
+            "cell_m": cell_m,
+            "bands": bands,
+            "weights_version": version,
+        }
+        with self._lock:
+            if self._reach_version == version:
+                self._reach_cache[key] = result
+                while len(self._reach_cache) > REACHABILITY_CACHE_SIZE:
+                    self._reach_cache.popitem(last=False)
+        return {**result, "cached": False}
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+        with self._lock:
+            self._free_weights(keep_current=False)
+
+    # --- Active origins ---
+
+    def activate_origins(self, node_ids):
+        """Build cached shortest-path trees for the given origin nodes"""
+        sources = [self.graph.index_of(node_id) for node_id in node_ids]
+        with self._lock:
+            snapshot = self.snapshot
+            trees = dict(snapshot.trees)
+            for source in sources:
+                if source not in trees:
+                    trees[source] = ShortestPathTree(snapshot.graph, source)
+            self.snapshot = snapshot.replace(trees=trees)
+        return self.active_origins()
+
+    def deactivate_origins(self, node_ids):
+        sources = {self.graph.index_of(node_id) for node_id in node_ids}
+        with self._lock:
+            snapshot = self.snapshot
+            trees = {source: tree for source, tree in snapshot.trees.items() if source not in sources}
+            self.snapshot = snapshot.replace(trees=trees)
+            with self._routes_lock:
+                for route in [r for r in self.active_routes if r[0] in sources]:
+                    del self.active_routes[route]
+        return self.active_origins()
+
+    def _record_route(self, source: int, target: int):
+        with self._routes_lock:
+            routes = self.active_routes
+            if (source, target) in routes:
+                routes.move_to_end((source, target))
+            else:
+                routes[(source, target)] = None
+                if len(routes) > ACTIVE_ROUTES_SIZE:
+                    routes.popitem(last=False)
+
+    def active_origins(self):
+        graph, trees = self.graph, self.trees
+        return [graph.node_ids[i] for i in trees]
+
+    # --- Live edge status ---
+
+    def set_edge_status(self, edge_ids, status: str):
+        """
+        Apply a Road.status (OPEN / RESTRICTED / BLOCKED) to undirected
+        edges, repair every cached tree incrementally and report which
+        active routes the update invalidated.
+        """
+        factor = STATUS_FACTORS[status]
+        edge_ids = np.unique(np.asarray(edge_ids, dtype=np.int64))
+        started = time.perf_counter()
+        with self._lock:
+            edge_factor = self.snapshot.edge_factor.copy()
+            edge_factor[edge_ids] = factor
+            report = self._reweight(edge_ids, edge_factor=edge_factor)
+        self._recustomize_ch()
+        return {"status": status, **report, "repair_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    def apply_damage(self, raster, penalty: float = DAMAGE_PENALTY,
+                     block_threshold: float = DAMAGE_BLOCK_THRESHOLD):
+        """
+        Set the damage factor of every edge covered by a DamageRaster
+        (edges outside it keep their current factor) and update the
+        weights in one pass.
+        """
+        started = time.perf_counter()
+        edges, means, peaks = sample_edges(self.graph, raster)
+        factors = damage_factors(means, peaks, penalty, block_threshold)
+        sampled = time.perf_counter()
+        with self._lock:
+            edge_damage = self.snapshot.edge_damage.copy()
+            edge_damage[edges] = factors
+            report = self._reweight(edges, edge_damage=edge_damage)
+        self._recustomize_ch()
+        return {
+            "edges_sampled": int(len(edges)),
+            "edges_damaged": int((means > 0).sum()),
+            "edges_blocked": int(np.isinf(factors).sum()),
+            **report,
+            "sample_ms": round((sampled - started) * 1000, 3),
+            "repair_ms": round((time.perf_counter() - sampled) * 1000, 3),
+        }
+
+    def clear_damage(self):
+        """Drop all damage penalties"""
+        started = time.perf_counter()
+        with self._lock:
+            edges = np.flatnonzero(self.snapshot.edge_damage != 1.0)
+            report = self._reweight(edges, edge_damage=np.ones(self.graph.num_edges))
+        self._recustomize_ch()
+        return {**report, "repair_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    def _reweight(self, edge_ids, edge_factor=None, edge_damage=None):
+        # Caller holds the lock. Publishes a snapshot with the new factors:
+        # weight = base x status factor x damage factor, written to a copy
+        # of the weights, and copies of the trees repaired for the arcs
+        # that changed. The previous snapshot stays valid for its readers
+        old = self.snapshot
+        edge_factor = old.edge_factor if edge_factor is None else edge_factor
+        edge_damage = old.edge_damage if edge_damage is None else edge_damage
+        arcs = np.flatnonzero(np.isin(old.graph.arc_edge, edge_ids))
+        edge = old.graph.arc_edge[arcs]
+        # A zero-length arc that gets blocked must become inf, not 0 x inf = NaN
+        new = scaled(old.graph.base_weight[arcs], edge_factor[edge] * edge_damage[edge])
+        current = old.graph.weight[arcs]
+        changed_arcs = new != current
+        increased = arcs[new > current].tolist()
+        decreased = arcs[new < current].tolist()
+
+        invalidated = []
+        nodes_repaired = 0
+        if increased or decreased:
+            graph = old.graph.with_weights(arcs[changed_arcs], new[changed_arcs])
+            trees, changed = {}, {}
+            for source, tree in old.trees.items():
+                tree = trees[source] = tree.copy()
+                changed[source] = tree.repair(graph, increased, decreased)
+                nodes_repaired += len(changed[source])
+            with self._routes_lock:
+                active_routes = list(self.active_routes)
+            invalidated = [
+                (source, target) for source, target in active_routes
+                if target in changed.get(source, ())
+            ]
+            self.snapshot = GraphSnapshot(old.version + 1, graph, edge_factor, edge_damage, trees)
+            if self._pool is not None:
+                # Workers keep running; they load these weights on their next task
+                self._publish_weights(self.snapshot)
+        else:
+            self.snapshot = old.replace(edge_factor=edge_factor, edge_damage=edge_damage)
+
+        graph = self.snapshot.graph
+        return {
+            "edges_updated": int(len(edge_ids)),
+            "arcs_changed": len(increased) + len(decreased),
+            "trees_repaired": len(old.trees) if (increased or decreased) else 0,
+            "nodes_repaired": nodes_repaired,
+            "routes_invalidated": len(invalidated),
+            "invalidated": [
+                {"start_node": graph.node_ids[s], "end_node": graph.node_ids[t]}
+                for s, t in invalidated[:100]
+            ],
+            "weights_version": self.snapshot.version,
+        }
+
+    def set_road_status(self, road_id: int, status: str):
+        """Apply a status to every edge belonging to a Road row"""
+        return self.set_edge_status(np.flatnonzero(self.graph.edge_road == road_id), status)
+
+    def apply_road_statuses(self, roads):
+        """Apply (road_id, status) pairs, e.g. the roads table at startup"""
+        by_status = {}
+        for road_id, status in roads:
+            if status in STATUS_FACTORS:
+                by_status.setdefault(status, []).append(road_id)
+        return [
+            self.set_edge_status(np.flatnonzero(np.isin(self.graph.edge_road, ids)), status)
+            for status, ids in by_status.items()
+        ]
+
+    def nearest_edge(self, lat: float, lng: float, max_distance_m: float = INCIDENT_SNAP_M):
+        """Edge whose midpoint is closest to (lat, lng), or None if too far"""
+        graph = self.graph
+        if graph.num_edges == 0:
+            return None
+        edge, distance = graph.edge_index().query(lat, lng)
+        return int(edge[0]) if distance[0] <= max_distance_m else None
+
+    def snap(self, lats, lngs, with_edges: bool = False):
+        """
+        Nearest routable node for each coordinate; routes start and end at
+        that node. with_edges adds "edge": the coordinate projected onto
+        the nearest road segment (see RoadGraph.nearest_arcs), with the
+        edge and road ids, the segment's end nodes, offset_m along it from
+        from_node, the projected lat/lng and distance_m.
+        """
+        graph = self.graph
+        nodes, distances = graph.nearest_nodes(lats, lngs)
+        snapped = [
+            {"node": graph.node_ids[i], "lat": float(graph.lat[i]), "lng": float(graph.lng[i]),
+             "distance_m": round(float(d), 2)}
+            for i, d in zip(nodes.tolist(), distances.tolist())
+        ]
+        if with_edges:
+            arcs, fractions, distances = graph.nearest_arcs(lats, lngs)
+            src, dst = graph.arc_src[arcs], graph.indices[arcs]
+            lat = graph.lat[src] + fractions * (graph.lat[dst] - graph.lat[src])
+            lng = graph.lng[src] + fractions * (graph.lng[dst] - graph.lng[src])
+            for result, k, u, v, f, d, y, x in zip(snapped, arcs.tolist(), src.tolist(), dst.tolist(),
+                                                   fractions.tolist(), distances.tolist(),
+                                                   lat.tolist(), lng.tolist()):
+                edge = int(graph.arc_edge[k])
+                result["edge"] = {
+                    "id": edge, "road_id": int(graph.edge_road[edge]),
+                    "from_node": graph.node_ids[u], "to_node": graph.node_ids[v],
+                    "offset_m": round(f * float(graph.length[k]), 2),
+                    "lat": round(y, 7), "lng": round(x, 7), "distance_m": round(d, 2),
+                }
+        return snapped
+
+    def block_near(self, lat: float, lng: float, status: str = "BLOCKED"):
+        """Mark the road edge at a reported incident; None if no road is near"""
+        edge = self.nearest_edge(lat, lng)
+        if edge is None:
+            return None
+        return self.set_edge_status([edge], status)
+
+
 router = RoutingEngine()
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Backend modules import each other as top-level modules, as under uvicorn
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Never open the committed database from tests
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "backend_tests_unused.db"))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Tuned engine on a fresh database with the schema and spatial index"""
+    from database import Base, make_engine
+    import incidents
+    import models  # noqa: F401  (registers the tables)
+
+    engine = make_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    incidents.ensure_spatial_index(engine)
+    yield engine
+    engine.dispose()
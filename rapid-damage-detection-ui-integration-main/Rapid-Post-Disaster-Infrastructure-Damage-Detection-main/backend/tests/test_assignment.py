@@ -0,0 +1,87 @@
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+import assignment
+from assignment import assign, severity_weight
+
+
+def objective(pairs, effective):
+    """(-pairs assigned, total weighted cost): lower is better"""
+    return -len(pairs), sum(effective[t, i] for t, i in pairs)
+
+
+def brute_force(effective, capacities):
+    """Best objective over every incident -> team-or-nobody choice"""
+    n_teams, n_incidents = effective.shape
+    best = (0, 0.0)
+    for choice in itertools.product(range(-1, n_teams), repeat=n_incidents):
+        pairs = [(t, i) for i, t in enumerate(choice) if t >= 0]
+        if any(math.isinf(effective[t, i]) for t, i in pairs):
+            continue
+        if any(sum(1 for t_, _ in pairs if t_ == t) > capacities[t] for t in range(n_teams)):
+            continue
+        best = min(best, objective(pairs, effective))
+    return best
+
+
+def check_valid(pairs, costs, capacities):
+    incidents = [i for _, i in pairs]
+    assert len(incidents) == len(set(incidents))
+    for t in range(costs.shape[0]):
+        assert sum(1 for t_, _ in pairs if t_ == t) <= capacities[t]
+    assert all(np.isfinite(costs[t, i]) for t, i in pairs)
+
+
+def random_case(rng):
+    n_teams, n_incidents = rng.integers(1, 4), rng.integers(1, 6)
+    costs = rng.uniform(1, 100, (n_teams, n_incidents)).round(1)
+    costs[rng.random(costs.shape) < 0.3] = math.inf
+    capacities = rng.integers(0, 3, n_teams)
+    severities = rng.choice(list(assignment.SEVERITY_WEIGHTS) + [None], n_incidents)
+    weights = np.array([severity_weight(s) for s in severities])
+    return costs, capacities, weights
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_matches_brute_force(seed):
+    costs, capacities, weights = random_case(np.random.default_rng(seed))
+    for w in (None, weights):
+        effective = costs if w is None else costs / w[None, :]
+        pairs, solver = assign(costs, capacities, w)
+        check_valid(pairs, costs, capacities)
+        expected = brute_force(effective, capacities)
+        got = objective(pairs, effective)
+        assert solver in ("hungarian", "none")
+        assert got[0] == expected[0] and got[1] == pytest.approx(expected[1])
+
+
+def test_severity_weighting_prefers_critical_incidents():
+    # One team, a close minor incident and a farther critical one
+    costs = np.array([[10.0, 30.0]])
+    assert assign(costs)[0] == [(0, 0)]
+    weights = [severity_weight("LOW"), severity_weight("CRITICAL")]
+    assert assign(costs, weights=weights)[0] == [(0, 1)]
+
+
+def test_unreachable_only():
+    assert assign(np.full((2, 3), math.inf)) == ([], "none")
+    assert assign(np.zeros((0, 3))) == ([], "none")
+    assert assign(np.ones((2, 2)), capacities=[0, 0]) == ([], "none")
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_greedy_fallback(monkeypatch, seed):
+    monkeypatch.setattr(assignment, "HAS_SCIPY", False)
+    costs, capacities, weights = random_case(np.random.default_rng(seed))
+    pairs, solver = assign(costs, capacities, weights)
+    check_valid(pairs, costs, capacities)
+    if pairs:
+        assert solver == "greedy"
+    # Greedy takes the cheapest weighted pair first
+    effective = np.repeat(costs / weights[None, :], capacities, axis=0)
+    if np.isfinite(effective).any():
+        cheapest = np.unravel_index(np.argmin(effective), effective.shape)
+        assert (np.repeat(np.arange(len(capacities)), capacities)[cheapest[0]], cheapest[1]) in pairs
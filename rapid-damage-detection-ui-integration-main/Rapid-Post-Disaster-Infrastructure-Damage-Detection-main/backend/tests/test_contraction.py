@@ -0,0 +1,73 @@
+import math
+import threading
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from contraction import ContractionHierarchy
+from matrix_workers import csgraph
+from road_graph import grid_graph
+from routing import RoutingEngine
+
+
+def check_queries(ch, graph, weights, pairs):
+    dist = dijkstra(csgraph(graph.indptr, graph.indices, weights), indices=sorted({s for s, _ in pairs}))
+    row = {s: i for i, s in enumerate(sorted({s for s, _ in pairs}))}
+    for source, target in pairs:
+        path, cost = ch.query(source, target)
+        expected = dist[row[source], target]
+        if expected == math.inf:
+            assert path is None and cost == math.inf
+            continue
+        assert math.isclose(cost, expected, rel_tol=1e-9)
+        # The path is a real road path of that cost
+        assert path[0] == source and path[-1] == target
+        total = 0.0
+        for u, v in zip(path, path[1:]):
+            arcs = np.arange(graph.indptr[u], graph.indptr[u + 1])
+            total += weights[arcs[graph.indices[arcs] == v]].min()
+        assert math.isclose(total, expected, rel_tol=1e-9)
+
+
+def test_recontract_matches_dijkstra_after_weight_changes():
+    graph = grid_graph(12, 12, seed=7)
+    ch = ContractionHierarchy.build(graph)
+    rng = np.random.default_rng(3)
+    pairs = [tuple(p) for p in rng.integers(0, graph.num_nodes, size=(60, 2)).tolist()]
+    weights = graph.weight.copy()
+    for _ in range(5):
+        arcs = rng.choice(graph.num_arcs, size=40, replace=False)
+        weights[arcs] = rng.choice([0.5, 3.0, math.inf], size=40) * graph.weight[arcs]
+        ch = ch.recontract(graph, weights)
+        check_queries(ch, graph, weights, pairs)
+
+
+def test_engine_coalesces_updates_into_one_recontraction(monkeypatch):
+    graph = grid_graph(10, 10, seed=2)
+    engine = RoutingEngine(graph=graph)
+    engine._ch = (0, ContractionHierarchy.build(graph))
+
+    calls = []
+    started, release = threading.Event(), threading.Event()
+    recontract = ContractionHierarchy.recontract
+
+    def slow_recontract(ch, g, weights=None):
+        calls.append(g)
+        started.set()
+        release.wait(5)
+        return recontract(ch, g, weights)
+
+    monkeypatch.setattr(ContractionHierarchy, "recontract", slow_recontract)
+    engine.set_edge_status([1], "BLOCKED")
+    assert started.wait(5)
+    for edge in range(2, 12):
+        engine.set_edge_status([edge], "RESTRICTED")
+    thread = engine._ch_thread
+    release.set()
+    thread.join(5)
+
+    # One pass for the first update, one for the ten that queued behind it
+    assert len(calls) == 2
+    assert engine._ch[0] == engine.weights_version
+    snapshot = engine.snapshot
+    check_queries(engine.ch, snapshot.graph, snapshot.graph.weight, [(0, 99), (5, 90), (42, 7)])
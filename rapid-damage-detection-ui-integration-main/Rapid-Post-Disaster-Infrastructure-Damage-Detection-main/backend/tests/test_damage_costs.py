@@ -0,0 +1,39 @@
+import io
+import math
+
+import numpy as np
+import pytest
+
+from damage_costs import DamageRaster, damage_factors, sample_edges
+from road_graph import grid_graph
+
+BOUNDS = (-118.3, 34.0, -118.2, 34.1)
+
+
+def npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def test_nan_and_out_of_range_values_are_sanitized():
+    probability = np.array([[np.nan, 0.5], [np.inf, -np.inf], [1.5, -0.2]])
+    raster = DamageRaster.from_bytes(npy(probability), BOUNDS, "map.npy")
+    assert raster.probability.tolist() == [[0.0, 0.5], [1.0, 0.0], [1.0, 0.0]]
+
+
+def test_nan_pixels_leave_edge_costs_finite():
+    graph = grid_graph(8, 8, seed=0)
+    bounds = (graph.lng.min() - 1e-4, graph.lat.min() - 1e-4, graph.lng.max() + 1e-4, graph.lat.max() + 1e-4)
+    probability = np.random.default_rng(0).random((64, 64)) * 0.5
+    probability[::3, ::2] = np.nan
+    raster = DamageRaster.from_bytes(npy(probability), bounds, "map.npy")
+    edges, mean, peak = sample_edges(graph, raster)
+    assert len(edges) and not np.isnan(mean).any() and not np.isnan(peak).any()
+    factors = damage_factors(mean, peak)
+    assert all(math.isfinite(f) for f in factors)
+
+
+def test_non_numeric_arrays_are_rejected():
+    with pytest.raises(ValueError):
+        DamageRaster.from_bytes(npy(np.array([["a", "b"]])), BOUNDS, "map.npy")
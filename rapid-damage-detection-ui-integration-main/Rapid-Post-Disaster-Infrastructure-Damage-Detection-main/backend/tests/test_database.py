@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from database import SQLITE_PRAGMAS
+
+
+def test_every_connection_gets_the_pragmas(engine):
+    connections = [engine.connect() for _ in range(3)]
+    try:
+        for conn in connections:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == SQLITE_PRAGMAS["busy_timeout"]
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+@pytest.mark.parametrize("mode,locks", [("DEFERRED", False), ("IMMEDIATE", True)])
+def test_begin_mode_follows_the_execution_option(engine, mode, locks):
+    writer = engine.execution_options(sqlite_begin=mode)
+    other = sqlite3.connect(engine.url.database, timeout=0, isolation_level=None)
+    try:
+        with writer.begin() as conn:
+            conn.exec_driver_sql("SELECT 1")
+            # IMMEDIATE holds the write lock from BEGIN, before any write
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                other.execute("ROLLBACK")
+                locked = False
+            except sqlite3.OperationalError as e:
+                assert "locked" in str(e)
+                locked = True
+            assert locked is locks
+    finally:
+        other.close()
+
+
+def test_savepoints_roll_back_on_their_own(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+        conn.exec_driver_sql("INSERT INTO t VALUES (1)")
+        savepoint = conn.begin_nested()
+        conn.exec_driver_sql("INSERT INTO t VALUES (2)")
+        savepoint.rollback()
+        conn.exec_driver_sql("INSERT INTO t VALUES (3)")
+    with engine.connect() as conn:
+        assert [x for x, in conn.execute(text("SELECT x FROM t ORDER BY x"))] == [1, 3]
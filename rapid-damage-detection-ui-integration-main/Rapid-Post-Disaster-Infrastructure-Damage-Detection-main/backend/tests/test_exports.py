@@ -0,0 +1,76 @@
+import io
+import random
+
+import numpy as np
+import pytest
+
+import database
+import exports
+import incidents
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.make_engine(f"sqlite:///{tmp_path / 'export.db'}")
+    database.Base.metadata.create_all(bind=engine)
+    incidents.ensure_spatial_index(engine)
+    rng = random.Random(0)
+    rows = [(i, {"type": "DAMAGE", "severity": rng.choice(["CRITICAL", "LOW"]), "confidence": rng.random(),
+                 "lat": 34.0 + rng.random() * 0.1, "lng": -118.3 + rng.random() * 0.1, "description": "test"})
+            for i in range(exports.EXPORT_CHUNK_ROWS + 123)]
+    with engine.begin() as conn:
+        incidents.bulk_insert(conn, rows)
+    yield engine
+    engine.dispose()
+
+
+def test_incidents_parquet_has_every_row_one_group_per_chunk(engine):
+    data = b"".join(exports.export(exports.INCIDENT_FIELDS, exports.incident_chunks(engine), "parquet"))
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    table = parquet.read()
+    assert table.num_rows == exports.EXPORT_CHUNK_ROWS + 123
+    assert parquet.num_row_groups == 2
+    assert table.column_names == [name for name, _ in exports.INCIDENT_FIELDS] + ["geometry"]
+    assert table.column("geometry")[0].as_py().startswith("POINT (")
+
+
+def test_zones_parquet_matches_csv(engine):
+    parquet = pq.read_table(io.BytesIO(b"".join(
+        exports.export(exports.ZONE_FIELDS, exports.zone_chunks(engine, zone_m=2000), "parquet"))))
+    csv = b"".join(exports.export(exports.ZONE_FIELDS, exports.zone_chunks(engine, zone_m=2000), "csv"))
+    assert parquet.num_rows == len(csv.decode().splitlines()) - 1
+    assert sum(parquet.column("incidents").to_pylist()) == exports.EXPORT_CHUNK_ROWS + 123
+
+
+def test_damage_polygons_are_valid_dissolved_regions():
+    shapely = pytest.importorskip("shapely")
+    from shapely.geometry import shape
+    from damage_costs import DamageRaster
+
+    rng = np.random.default_rng(0)
+    probability = rng.random((120, 90))
+    # A ring of damage with an undamaged hole, and two blocks touching at a corner
+    probability[10:30, 10:30] = 0.95
+    probability[15:25, 15:25] = 0.1
+    probability[40:45, 40:45] = 0.95
+    probability[45:50, 45:50] = 0.95
+    raster = DamageRaster(probability, (-118.3, 34.0, -118.2, 34.1))
+    rows, geometries = [], []
+    for chunk_rows, chunk_geometries in exports.polygon_chunks(raster, threshold=0.9, chunk_rows=50):
+        rows += chunk_rows
+        geometries += chunk_geometries
+
+    damaged = probability >= 0.9
+    assert sum(row[1] for row in rows) == damaged.sum()
+    pixel_deg2 = (0.1 / 120) * (0.1 / 90)
+    for row, geometry in zip(rows, geometries):
+        polygon = shape(geometry)
+        assert shapely.is_valid(polygon), shapely.is_valid_reason(polygon)
+        assert polygon.area == pytest.approx(row[1] * pixel_deg2)
+        for part in getattr(polygon, "geoms", [polygon]):
+            assert part.exterior.is_ccw and not any(ring.is_ccw for ring in part.interiors)
+    types = {geometry["type"] for geometry in geometries}
+    assert "MultiPolygon" in types and "Polygon" in types
+    assert any(len(g["coordinates"]) > 1 for g in geometries if g["type"] == "Polygon")  # the hole
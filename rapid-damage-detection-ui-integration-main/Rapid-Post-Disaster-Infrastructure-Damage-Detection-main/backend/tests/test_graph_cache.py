@@ -0,0 +1,24 @@
+import numpy as np
+
+from graph_cache import load_graph, save_graph
+from road_graph import grid_graph
+
+
+def test_cache_round_trip_holds_only_plain_arrays(tmp_path):
+    graph = grid_graph(20, 30, seed=1)
+    path = str(tmp_path / "grid.graph")
+    save_graph(graph, path, "abc")
+    cached = load_graph(path, "abc")
+
+    assert load_graph(path, "other") is None
+    for name in ("indptr", "indices", "length", "weight", "arc_edge", "edge_road", "lat", "lng"):
+        assert np.array_equal(getattr(graph, name), getattr(cached, name)), name
+    for index in (cached.node_index(), cached.edge_index()):
+        assert index.xyz.dtype == np.float64 and index._tree is None
+
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(graph.lat.min(), graph.lat.max(), 200)
+    lng = rng.uniform(graph.lng.min(), graph.lng.max(), 200)
+    for expected, got in zip(graph.nearest_nodes(lat, lng), cached.nearest_nodes(lat, lng)):
+        assert np.array_equal(expected, got)
+    assert np.array_equal(graph.edge_index().query(lat, lng)[0], cached.edge_index().query(lat, lng)[0])
@@ -0,0 +1,142 @@
+import datetime
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+import incidents as incident_store
+import report_jobs
+from models import Incident
+
+
+def add_incidents(engine, points):
+    with engine.begin() as conn:
+        return [
+            incident_store.insert_incident(conn, {"type": "DAMAGE", "severity": "LOW", "lat": lat, "lng": lng})
+            for lat, lng in points
+        ]
+
+
+def test_in_place_update_changes_dataset_version(engine):
+    ids = add_incidents(engine, [(34.05, -118.25), (34.06, -118.24)])
+    with Session(engine) as db:
+        before = incident_store.dataset_version(db)
+        db.execute(update(Incident).where(Incident.id == ids[0]).values(severity="CRITICAL"))
+        db.commit()
+        after = incident_store.dataset_version(db)
+    # Same rows, same count and maxima: only the revision tells them apart
+    assert before[:3] == after[:3] and before != after
+
+
+def test_update_invalidates_cached_report(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(report_jobs, "_worker_engine", engine)
+    jobs = report_jobs.ReportJobs(directory=str(tmp_path / "reports"))
+    jobs._pool = ThreadPoolExecutor(1)  # render in-process against the test database
+    ids = add_incidents(engine, [(34.05, -118.25), (34.06, -118.24), (34.07, -118.23)])
+    try:
+        with Session(engine) as db:
+            version = incident_store.dataset_version(db)
+        first = jobs.submit(version)
+        first.future.result()
+        assert jobs.submit(version) is first and (jobs.hits, jobs.misses) == (1, 1)
+
+        with Session(engine) as db:
+            db.execute(update(Incident).where(Incident.id == ids[1]).values(description="collapsed"))
+            db.commit()
+            version = incident_store.dataset_version(db)
+        second = jobs.submit(version)
+        assert second is not first and jobs.misses == 2
+        assert second.future.result()["incidents"] == 3
+        # The superseded report is removed once the new one is done
+        deadline = time.monotonic() + 5
+        while jobs.get(first.id) is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert jobs.get(first.id) is None
+    finally:
+        jobs.shutdown()
+
+
+def plain_bbox(db, bbox):
+    """ids inside bbox by comparing lat/lng on every row, without the R*Tree"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return set(db.execute(select(Incident.id).where(
+        Incident.lat.between(min_lat, max_lat), Incident.lng.between(min_lng, max_lng))).scalars())
+
+
+def test_rtree_bbox_matches_plain_filter(engine):
+    rng = random.Random(4)
+    # Grid-aligned points so many sit exactly on box edges
+    points = [(34.0 + rng.randrange(100) * 1e-3, -118.3 + rng.randrange(100) * 1e-3) for _ in range(2000)]
+    ids = add_incidents(engine, points)
+    with Session(engine) as db:
+        # Moves, nulled coordinates and deletes go through the triggers
+        for i in ids[:100]:
+            db.execute(update(Incident).where(Incident.id == i).values(lat=34.05, lng=-118.25))
+        db.execute(update(Incident).where(Incident.id.in_(ids[100:150])).values(lat=None, lng=None))
+        db.execute(delete(Incident).where(Incident.id.in_(ids[150:200])))
+        db.commit()
+
+        boxes = [(-118.3 + a * 1e-3, 34.0 + b * 1e-3, -118.3 + (a + w) * 1e-3, 34.0 + (b + h) * 1e-3)
+                 for a, b, w, h in ((rng.randrange(100), rng.randrange(100), rng.randrange(30), rng.randrange(30))
+                                    for _ in range(50))]
+        boxes += [(-118.25, 34.05, -118.25, 34.05), (-119, 33, -117, 35), (-117, 35, -116, 36)]
+        for bbox in boxes:
+            found = {row["id"] for row in incident_store.query_incidents(db, bbox=bbox)}
+            assert found == plain_bbox(db, bbox), bbox
+        assert len(plain_bbox(db, boxes[-3])) >= 100
+        assert len(incident_store.query_incidents(db, bbox=boxes[-2])) == 1900
+
+
+def add_tied_incidents(engine, n, rng):
+    """n incidents over only a few created_at values, inserted in random order"""
+    base = datetime.datetime(2026, 3, 1, 12, 0, 0)
+    stamps = [base + datetime.timedelta(seconds=s) for s in (0, 0.5, 1, 60)]
+    rows = [{"type": "DAMAGE", "severity": "LOW", "lat": 34.0 + rng.random() * 0.1,
+             "lng": -118.3 + rng.random() * 0.1, "created_at": rng.choice(stamps)} for _ in range(n)]
+    with engine.begin() as conn:
+        conn.execute(Incident.__table__.insert(), rows)
+
+
+def all_pages(db, limit, cursor=None, **filters):
+    ids = []
+    while True:
+        page = incident_store.page_incidents(db, cursor=cursor, limit=limit, **filters)
+        ids += [item["id"] for item in page["items"]]
+        assert len(page["items"]) <= limit
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("limit", [1, 7, 100, 1000])
+def test_keyset_pages_cover_every_row_once_with_tied_timestamps(engine, limit):
+    rng = random.Random(limit)
+    add_tied_incidents(engine, 300, rng)
+    with Session(engine) as db:
+        expected = list(db.execute(select(Incident.id).order_by(Incident.created_at, Incident.id)).scalars())
+        assert all_pages(db, limit) == expected
+
+        bbox = (-118.3, 34.0, -118.25, 34.05)
+        since = datetime.datetime(2026, 3, 1, 12, 0, 0, 500000)
+        assert all_pages(db, limit, bbox=bbox, since=since) == [
+            row["id"] for row in incident_store.query_incidents(db, bbox=bbox, since=since)]
+
+
+def test_rows_added_behind_the_cursor_are_not_repeated(engine):
+    add_tied_incidents(engine, 50, random.Random(1))
+    with Session(engine) as db:
+        first = incident_store.page_incidents(db, limit=20)
+        db.commit()  # each page is its own request
+        # A newer incident lands while the client pages
+        add_incidents(engine, [(34.05, -118.25)])
+        rest = all_pages(db, 20, cursor=first["next_cursor"])
+        ids = [item["id"] for item in first["items"]] + rest
+        assert sorted(ids) == list(range(1, 52)) and len(set(ids)) == 51
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        incident_store.decode_cursor("not-a-cursor")
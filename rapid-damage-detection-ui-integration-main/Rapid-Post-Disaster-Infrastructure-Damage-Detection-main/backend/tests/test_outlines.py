@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import outlines
+
+shapely = pytest.importorskip("shapely")
+from shapely.geometry import box, shape  # noqa: E402
+from shapely.ops import unary_union  # noqa: E402
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_trace_is_valid_and_covers_exactly_the_pixels(seed):
+    rng = np.random.default_rng(seed)
+    mask = rng.random(tuple(rng.integers(1, 14, 2))) < rng.uniform(0.2, 0.8)
+    polygons = outlines.trace(mask)
+    if not mask.any():
+        assert polygons == []
+        return
+    geometry = shape(outlines.geojson(polygons, 0.0, 1.0, 0.0, 1.0))
+    assert shapely.is_valid(geometry), shapely.is_valid_reason(geometry)
+    pixels = unary_union([box(c, r, c + 1, r + 1) for r, c in zip(*np.nonzero(mask))])
+    assert geometry.symmetric_difference(pixels).area == pytest.approx(0.0, abs=1e-9)
+    # One polygon per 4-connected part
+    assert len(polygons) == outlines.label(mask)[1]
+
+
+def test_diagonal_self_contact_becomes_a_touching_hole():
+    mask = np.array([
+        [1, 1, 1, 0],
+        [1, 0, 1, 0],
+        [1, 1, 0, 1],
+        [0, 0, 1, 1],
+    ], dtype=bool)
+    polygons = outlines.trace(mask)
+    geometry = shape(outlines.geojson(polygons, 0.0, 1.0, 0.0, 1.0))
+    assert shapely.is_valid(geometry)
+    assert geometry.area == mask.sum()
+
+
+@pytest.mark.parametrize("diagonal", [False, True])
+def test_label_fallback_matches_scipy(monkeypatch, diagonal):
+    mask = np.random.default_rng(1).random((40, 50)) < 0.45
+    expected, count = outlines.label(mask, diagonal)
+    monkeypatch.setattr(outlines, "HAS_NDIMAGE", False)
+    labels, fallback_count = outlines.label(mask, diagonal)
+    assert fallback_count == count
+    assert len(set(zip(labels[mask].tolist(), expected[mask].tolist()))) == count
@@ -0,0 +1,67 @@
+import base64
+import io
+import re
+import zlib
+
+import pytest
+
+from pdf import ROW_HEIGHT, TABLE_CHUNK_ROWS, render_pdf_report
+
+
+def incidents(n):
+    for i in range(n):
+        yield {"id": i + 1, "type": "DAMAGE", "severity": "HIGH", "coordinates": {"lat": 34.05, "lng": -118.25}}
+
+
+def page_texts(pdf_bytes):
+    """Decoded content stream of each page, in page order"""
+    pages = []
+    for data in re.findall(rb"/Filter \[ /ASCII85Decode /FlateDecode \] /Length \d+\s*>>\s*stream\r?\n(.*?)endstream",
+                           pdf_bytes, re.S):
+        data = data.strip()
+        pages.append(zlib.decompress(base64.a85decode(data[:-2] if data.endswith(b"~>") else data)))
+    assert len(pages) == len(re.findall(rb"/Type /Page\b(?!s)", pdf_bytes))
+    return pages
+
+
+def page_rows(pdf_bytes):
+    """Incident ids drawn on each page"""
+    return [[int(i) for i in re.findall(rb"\((\d+)\) Tj", text)] for text in page_texts(pdf_bytes)]
+
+
+# Rows of one full page: the frame is 636pt high and each table row,
+# including a header repeated after a split, is ROW_HEIGHT
+PAGE_ROWS = 636 // ROW_HEIGHT
+
+
+@pytest.mark.parametrize("n", [0, 1, TABLE_CHUNK_ROWS, 200, 1000])
+def test_streamed_report_keeps_every_row_on_dense_pages(n):
+    output = io.BytesIO()
+    assert render_pdf_report(incidents(n), output) == n
+    pages = page_rows(output.getvalue())
+    texts = page_texts(output.getvalue())
+    assert [i for rows in pages for i in rows] == list(range(1, n + 1))
+    assert b"Damage Assessment Report" in texts[0] and b"CONFIDENTIAL" in texts[-1]
+
+    # The table starts under the title, and every page but the last is
+    # full: its rows plus at most two headers (a chunk split across the
+    # page and the next chunk) fill the frame
+    assert len(pages[0]) >= min(n, PAGE_ROWS // 2)
+    headers = [text.count(b"(Coordinates) Tj") for text in texts]
+    for rows, header_rows in zip(pages[1:-1], headers[1:-1]):
+        assert len(rows) + header_rows >= PAGE_ROWS - 1 and header_rows <= 2
+    full_pages = max(0, n - len(pages[0])) // (PAGE_ROWS - 2)
+    assert len(pages) <= 2 + full_pages
+
+
+def test_report_from_generator_is_consumed_lazily():
+    pulled = []
+
+    def rows():
+        for inc in incidents(500):
+            pulled.append(inc["id"])
+            yield inc
+
+    output = io.BytesIO()
+    assert render_pdf_report(rows(), output) == 500
+    assert pulled == list(range(1, 501))
@@ -0,0 +1,38 @@
+import math
+
+import numpy as np
+import pytest
+
+from reachability import METERS_PER_DEGREE, coverage_grid
+
+shapely = pytest.importorskip("shapely")
+from shapely.geometry import box, shape  # noqa: E402
+from shapely.ops import unary_union  # noqa: E402
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_coverage_is_valid_and_matches_the_cells(seed):
+    rng = np.random.default_rng(seed)
+    lat = 34.0 + rng.random(300) * 0.05
+    lng = -118.3 + rng.random(300) * 0.05
+    cell_m = 400.0
+    coverage, area = coverage_grid(lat, lng, cell_m)
+    assert coverage["type"] == "MultiPolygon"
+    geometry = shape(coverage)
+    assert shapely.is_valid(geometry), shapely.is_valid_reason(geometry)
+
+    # Same cells as the grid binning, one box each
+    d_lat = cell_m / METERS_PER_DEGREE
+    d_lng = d_lat / math.cos(math.radians(lat.mean()))
+    cells = set(zip(np.floor((lat - lat.min()) / d_lat).astype(int).tolist(),
+                    np.floor((lng - lng.min()) / d_lng).astype(int).tolist()))
+    boxes = unary_union([box(lng.min() + c * d_lng, lat.min() + r * d_lat,
+                             lng.min() + (c + 1) * d_lng, lat.min() + (r + 1) * d_lat) for r, c in cells])
+    assert geometry.symmetric_difference(boxes).area == pytest.approx(0.0, abs=1e-12)
+    assert area == pytest.approx(len(cells) * cell_m * cell_m / 1e6)
+    # Dissolved: far fewer polygons than cells
+    assert len(coverage["coordinates"]) < len(cells)
+
+
+def test_empty_coverage():
+    assert coverage_grid([], [], 200.0) == ({"type": "MultiPolygon", "coordinates": []}, 0.0)
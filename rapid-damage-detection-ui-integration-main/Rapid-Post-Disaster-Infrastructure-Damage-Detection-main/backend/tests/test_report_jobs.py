@@ -0,0 +1,86 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.orm import Session
+
+import incidents as incident_store
+import report_jobs
+from report_jobs import ReportJobs
+
+
+@pytest.fixture
+def jobs(engine, tmp_path, monkeypatch):
+    """ReportJobs rendering in a thread against the test database"""
+    monkeypatch.setattr(report_jobs, "_worker_engine", engine)
+    with engine.begin() as conn:
+        for i in range(30):
+            incident_store.insert_incident(conn, {"type": "DAMAGE", "severity": "LOW",
+                                                  "lat": 34.0 + i * 1e-3, "lng": -118.0 + i * 1e-3})
+    made = []
+
+    def make(**options):
+        jobs = ReportJobs(directory=str(tmp_path / "reports"), **options)
+        jobs._pool = ThreadPoolExecutor(1)
+        made.append(jobs)
+        return jobs
+    yield make
+    for jobs in made:
+        jobs.shutdown()
+
+
+def version(engine, bbox=None):
+    with Session(engine) as db:
+        return incident_store.dataset_version(db, bbox)
+
+
+def wait_finished(job):
+    job.future.result()
+    deadline = time.monotonic() + 5
+    while job.finished is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_same_version_and_parameters_reuse_the_report(engine, jobs):
+    cache = jobs()
+    v = version(engine)
+    job = cache.submit(v)
+    wait_finished(job)
+    assert job.to_dict()["incidents"] == 30 and os.path.exists(job.path)
+    assert cache.submit(v) is job and (cache.hits, cache.misses) == (1, 1)
+
+    # Other parameters are another report
+    bbox = (-118.0, 34.0, -117.99, 34.01)
+    other = cache.submit(version(engine, bbox), bbox)
+    wait_finished(other)
+    assert other.id != job.id and other.to_dict()["incidents"] == 11 and cache.misses == 2
+
+    # A new process (fresh job table) serves the file already on disk
+    restarted = jobs()
+    cached = restarted.submit(v)
+    assert cached.id == job.id and cached.to_dict()["cached"] and restarted.misses == 0
+
+
+def test_finished_jobs_expire_but_their_files_stay_cached(engine, jobs):
+    cache = jobs(ttl=0)
+    v = version(engine)
+    job = cache.submit(v)
+    wait_finished(job)
+    time.sleep(0.01)
+    assert cache.get(job.id) is None
+    again = cache.submit(v)
+    assert again is not job and again.to_dict()["cached"] and cache.misses == 1
+
+
+def test_least_recently_used_reports_are_evicted_over_budget(engine, jobs):
+    cache = jobs(budget_mb=0)
+    boxes = [(-118.0, 34.0, -118.0 + d, 34.0 + d) for d in (0.005, 0.01, 0.02)]
+    done = []
+    for bbox in boxes:
+        job = cache.submit(version(engine, bbox), bbox)
+        wait_finished(job)
+        done.append(job)
+    # Only the newest report is kept when nothing fits the budget
+    assert [os.path.exists(job.path) for job in done] == [False, False, True]
+    assert cache.stats()["files"] == 1
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import road_graph
+from road_graph import EARTH_RADIUS_M, PointIndex, grid_graph
+
+
+def brute_force_segments(graph, lat, lng):
+    src, dst = graph.arc_src, graph.indices
+    scale = np.radians(1.0) * EARTH_RADIUS_M
+    best = []
+    for y, x in zip(lat, lng):
+        c = np.cos(np.radians(y))
+        ax, ay = (graph.lng[src] - x) * c * scale, (graph.lat[src] - y) * scale
+        dx, dy = (graph.lng[dst] - graph.lng[src]) * c * scale, (graph.lat[dst] - graph.lat[src]) * scale
+        t = np.clip(-(ax * dx + ay * dy) / (dx * dx + dy * dy), 0, 1)
+        best.append(np.hypot(ax + t * dx, ay + t * dy).min())
+    return np.array(best)
+
+
+@pytest.mark.parametrize("kdtree", [True, False])
+def test_nearest_arcs_matches_brute_force(monkeypatch, kdtree):
+    monkeypatch.setattr(road_graph, "HAS_KDTREE", kdtree and road_graph.HAS_KDTREE)
+    graph = grid_graph(25, 25, seed=4)
+    rng = np.random.default_rng(1)
+    lat = rng.uniform(graph.lat.min(), graph.lat.max(), 300)
+    lng = rng.uniform(graph.lng.min(), graph.lng.max(), 300)
+    arcs, fractions, distances = graph.nearest_arcs(lat, lng)
+    assert np.allclose(distances, brute_force_segments(graph, lat, lng), atol=1e-6)
+    assert ((fractions >= 0) & (fractions <= 1)).all()
+    # The projected point lies distances away from the query
+    src, dst = graph.arc_src[arcs], graph.indices[arcs]
+    y = graph.lat[src] + fractions * (graph.lat[dst] - graph.lat[src])
+    x = graph.lng[src] + fractions * (graph.lng[dst] - graph.lng[src])
+    assert np.allclose(road_graph.haversine_m(lat, lng, y, x), distances, rtol=1e-3, atol=1e-3)
+
+
+def test_k_nearest_query_matches_brute_force(monkeypatch):
+    rng = np.random.default_rng(2)
+    lat, lng = rng.uniform(34.0, 34.1, 200), rng.uniform(-118.3, -118.2, 200)
+    qlat, qlng = rng.uniform(34.0, 34.1, 50), rng.uniform(-118.3, -118.2, 50)
+    ids, meters = PointIndex(lat, lng).query(qlat, qlng, k=6)
+    monkeypatch.setattr(road_graph, "HAS_KDTREE", False)
+    brute_ids, brute_meters = PointIndex(lat, lng).query(qlat, qlng, k=6)
+    assert ids.shape == (50, 6) and np.array_equal(ids, brute_ids)
+    assert np.allclose(meters, brute_meters)
+    assert np.allclose(meters, road_graph.haversine_m(qlat[:, None], qlng[:, None], lat[ids], lng[ids]))
+    assert PointIndex(lat[:3], lng[:3]).query(qlat, qlng, k=6)[0].shape == (50, 3)
@@ -0,0 +1,160 @@
+import math
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+
+from matrix_workers import csgraph
+from road_graph import RoadGraph, grid_graph
+import routing
+from routing import RoutingEngine, ShortestPathTree
+
+
+def length_dist(graph, source, factor=None):
+    length = graph.length if factor is None else graph.length * factor[graph.arc_edge]
+    return dijkstra(csgraph(graph.indptr, graph.indices, length), indices=source)
+
+
+def test_reachability_uses_road_length_not_abstract_weights():
+    engine = RoutingEngine()  # mock graph: weights 4..10 units, edges hundreds of meters
+    graph = engine.graph
+    dist = length_dist(graph, graph.index_of("base-alpha"))
+    speed_kmh = 30.0
+    for minutes in (0.5, 1.0, 2.0, 3.0):
+        band = engine.reachability(["base-alpha"], minutes=(minutes,), speed_kmh=speed_kmh,
+                                   include_nodes=True)["bands"][0]
+        expected = {graph.node_ids[i] for i in np.flatnonzero(dist <= minutes * speed_kmh * 1000 / 60)}
+        assert set(band["nodes"]) == expected
+    assert 1 < len(expected) < graph.num_nodes
+
+
+def test_reachability_follows_status_factors():
+    graph = grid_graph(15, 15, seed=3)
+    engine = RoutingEngine(graph=graph)
+    origin = graph.node_ids[0]
+    edges = np.arange(0, graph.num_edges, 7)
+    engine.set_edge_status(edges, "RESTRICTED")
+    engine.set_edge_status(edges[::2], "BLOCKED")
+
+    factor = np.ones(graph.num_edges)
+    factor[edges] = 3.0
+    factor[edges[::2]] = math.inf
+    dist = length_dist(graph, 0, factor)
+    minutes = 0.8 * np.max(dist[np.isfinite(dist)]) / (30.0 * 1000 / 60)
+    band = engine.reachability([origin], minutes=(minutes,), include_nodes=True)["bands"][0]
+    assert set(band["nodes"]) == {graph.node_ids[i] for i in np.flatnonzero(dist <= minutes * 500)}
+
+
+def test_blocking_a_zero_length_arc_closes_it():
+    # b duplicates a's coordinates, so a-b has length (and weight) 0
+    graph = RoadGraph.from_segments(["a", "b", "c"], [34.0, 34.0, 34.01], [-118.0, -118.0, -118.0],
+                                    [0, 1, 0], [1, 2, 2], edge_road=[1, 2, 3])
+    engine = RoutingEngine(graph=graph)
+    engine.set_road_status(1, "BLOCKED")
+    weight = engine.graph.weight
+    assert not np.isnan(weight).any()
+    assert np.isinf(weight[engine.graph.arc_edge == 0]).all()
+    assert engine.compute_route("a", "b")["nodes"] == ["a", "c", "b"]
+
+
+def check_tree(graph, tree):
+    fresh = ShortestPathTree(graph, tree.origin)
+    assert np.allclose(tree.dist, fresh.dist, rtol=1e-12, atol=0)
+    arc_src = graph.arc_src
+    for v, k in enumerate(tree.parent_arc):
+        if v == tree.origin or tree.dist[v] == math.inf:
+            continue
+        # Ties may pick another parent; any tree arc must be tight
+        assert graph.indices[k] == v
+        assert math.isclose(tree.dist[arc_src[k]] + graph.weight[k], tree.dist[v], rel_tol=1e-12)
+
+
+def test_repaired_trees_match_fresh_trees_under_random_status_changes():
+    graph = grid_graph(12, 12, seed=5)
+    engine = RoutingEngine(graph=graph)
+    origins = [graph.node_ids[i] for i in (0, 77, 143)]
+    engine.activate_origins(origins)
+    rng = np.random.default_rng(11)
+    for _ in range(40):
+        edges = rng.choice(graph.num_edges, size=rng.integers(1, 12), replace=False)
+        engine.set_edge_status(edges, rng.choice(["OPEN", "RESTRICTED", "BLOCKED"]))
+        snapshot = engine.snapshot
+        for tree in snapshot.trees.values():
+            check_tree(snapshot.graph, tree)
+
+
+def test_active_routes_are_bounded_and_invalidated(monkeypatch):
+    monkeypatch.setattr(routing, "ACTIVE_ROUTES_SIZE", 5)
+    graph = grid_graph(6, 6, seed=2)
+    engine = RoutingEngine(graph=graph)
+    origin = graph.node_ids[0]
+    engine.activate_origins([origin])
+    for target in graph.node_ids[1:]:
+        assert engine.compute_route(origin, target) is not None
+    assert list(engine.active_routes) == [(0, t) for t in range(graph.num_nodes - 5, graph.num_nodes)]
+
+    # Closing every edge cuts the origin off, invalidating each remembered route
+    report = engine.set_edge_status(np.arange(graph.num_edges), "BLOCKED")
+    assert report["routes_invalidated"] == 5
+    engine.deactivate_origins([origin])
+    assert not engine.active_routes
+
+
+def test_small_matrices_run_inline(monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_WORKERS", 2)
+    graph = grid_graph(10, 10, seed=1)
+    engine = RoutingEngine(graph=graph)
+    engine.route_matrix(graph.node_ids[:5], graph.node_ids[-5:])
+    assert engine._pool is None and not engine._shared_weights
+
+
+def test_matrix_pool_survives_road_updates(monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_WORKERS", 2)
+    monkeypatch.setattr(routing, "MATRIX_INLINE_CELLS", 0)
+    graph = grid_graph(12, 12, seed=4)
+    engine = RoutingEngine(graph=graph)
+    sources, targets = graph.node_ids[::9], graph.node_ids[::5]
+    source_index = [graph.index_of(s) for s in sources]
+    target_index = [graph.index_of(t) for t in targets]
+    rng = np.random.default_rng(8)
+    try:
+        pool = None
+        for _ in range(4):
+            costs = engine.cost_matrix(sources, targets)
+            snapshot = engine.snapshot
+            expected = dijkstra(snapshot.csgraph(), indices=source_index)[:, target_index]
+            assert np.array_equal(costs, expected)
+            assert pool is None or engine._pool is pool
+            pool = engine._pool
+            # Only the current version's weights stay published
+            assert list(engine._shared_weights) == [snapshot.version]
+            engine.set_edge_status(rng.choice(graph.num_edges, size=10, replace=False), "BLOCKED")
+    finally:
+        engine.close()
+    assert engine._pool is None and not engine._shared_weights
+
+
+def test_road_updates_push_weights_to_the_live_pool(monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_WORKERS", 2)
+    monkeypatch.setattr(routing, "MATRIX_INLINE_CELLS", 0)
+    graph = grid_graph(10, 10, seed=6)
+    engine = RoutingEngine(graph=graph)
+    sources, targets = graph.node_ids[::7], graph.node_ids[::3]
+    try:
+        engine.cost_matrix(sources, targets)
+        old = engine.snapshot
+        pool = engine._pool
+        engine.set_edge_status(np.arange(0, graph.num_edges, 4), "BLOCKED")
+        new = engine.snapshot
+        # Published with the snapshot, before any matrix asks for it
+        assert list(engine._shared_weights) == [new.version]
+        assert engine._pool is pool
+
+        # Both versions run on the same workers, each with its own weights
+        for snapshot in (old, new, old):
+            expected = dijkstra(snapshot.csgraph(), indices=[graph.index_of(s) for s in sources])
+            costs = engine.cost_matrix(sources, targets, snapshot=snapshot)
+            assert np.array_equal(costs, expected[:, [graph.index_of(t) for t in targets]])
+        assert engine._pool is pool
+        assert list(engine._shared_weights) == [new.version]
+    finally:
+        engine.close()
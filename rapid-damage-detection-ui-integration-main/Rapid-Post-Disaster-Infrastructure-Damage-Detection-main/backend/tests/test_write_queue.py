@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+import incidents as incident_store
+from models import Incident
+from write_queue import WriteBehindQueue
+
+
+def incident(i):
+    return {"type": "DAMAGE", "severity": "LOW", "lat": 34.0 + i * 1e-3, "lng": -118.0}
+
+
+def count(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(Incident)).scalar()
+
+
+def hold(queue):
+    """Occupy the writer until the returned event is set, so later writes queue up as one batch"""
+    release = threading.Event()
+    queue.submit(lambda conn: release.wait(5))
+    return release
+
+
+def test_flush_commits_queued_writes_in_batches(engine):
+    queue = WriteBehindQueue(engine)
+    try:
+        release = hold(queue)
+        futures = [queue.submit(incident_store.insert_incident, incident(i)) for i in range(50)]
+        release.set()
+        queue.flush()
+        assert all(f.done() for f in futures)
+        assert sorted(f.result() for f in futures) == list(range(1, 51))
+        assert count(engine) == 50
+        # The blocker, then the 50 queued inserts together, then the flush marker
+        assert queue.writes == 52 and queue.batches <= 3
+    finally:
+        queue.stop()
+
+
+def test_failing_write_falls_back_to_savepoints(engine):
+    queue = WriteBehindQueue(engine)
+
+    def broken(conn):
+        incident_store.insert_incident(conn, incident(99))
+        raise ValueError("bad row")
+
+    try:
+        release = hold(queue)
+        good = [queue.submit(incident_store.insert_incident, incident(i)) for i in range(3)]
+        bad = queue.submit(broken)
+        good += [queue.submit(incident_store.insert_incident, incident(i)) for i in range(3, 6)]
+        release.set()
+        queue.flush()
+        with pytest.raises(ValueError, match="bad row"):
+            bad.result()
+        assert all(f.exception() is None for f in good)
+        # The failing write's own insert was rolled back with its savepoint
+        assert count(engine) == 6
+        with engine.connect() as conn:
+            assert 34.099 not in set(conn.execute(select(Incident.lat)).scalars())
+    finally:
+        queue.stop()
+
+
+def test_stop_drains_the_queue(engine):
+    queue = WriteBehindQueue(engine)
+    futures = [queue.submit(incident_store.insert_incident, incident(i)) for i in range(10)]
+    queue.stop()
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert count(engine) == 10
@@ -0,0 +1,137 @@
+"""
+Write-Behind Queue - single writer for the SQLite database
+
+SQLite allows one writer at a time; many threads committing small
+transactions mostly wait on each other (or fail with "database is
+locked"). Instead, writes are submitted here as functions of a
+Connection and run by one worker thread, which drains everything queued
+and commits it as a single transaction.
+
+Batches are first run without savepoints; if any write raises, the batch
+is rolled back and re-run with one SAVEPOINT per write, so a failing write
+is reported on its own future without affecting the rest. Write functions
+must therefore be safe to run twice.
+"""
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+
+from database import engine as default_engine
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    def __init__(self, engine, max_batch: int = 1000, linger: float = 0.0):
+        """
+        max_batch: most writes committed in one transaction
+        linger: seconds to wait for more writes before committing a batch
+                that is not full (0 = commit whatever is queued right away)
+        """
+        self.engine = engine.execution_options(sqlite_begin="IMMEDIATE")
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue fn(conn, *args, **kwargs); the future resolves after commit"""
+        self.start()
+        future = Future()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """Awaitable form of submit() for async handlers"""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def flush(self):
+        """Block until every write submitted so far has been committed"""
+        self.submit(lambda conn: None).result()
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                if self.linger:
+                    batch.append(self._queue.get(timeout=self.linger))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+            if batch:
+                self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # Fast path: the whole batch in one transaction, no savepoints
+        try:
+            with self.engine.begin() as conn:
+                results = [fn(conn, *args, **kwargs) for fn, args, kwargs, _ in batch]
+        except Exception:
+            self._commit_isolated(batch)
+            return
+        self._settle(zip((item[3] for item in batch), results, [None] * len(batch)))
+
+    def _commit_isolated(self, batch):
+        # Something in the batch failed: re-run it with one SAVEPOINT per
+        # write so only the failing writes are rolled back
+        outcomes = []
+        try:
+            with self.engine.begin() as conn:
+                for fn, args, kwargs, future in batch:
+                    savepoint = conn.begin_nested()
+                    try:
+                        result = fn(conn, *args, **kwargs)
+                        savepoint.commit()
+                        outcomes.append((future, result, None))
+                    except Exception as e:
+                        savepoint.rollback()
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # The transaction itself failed: nothing in the batch was written
+            for _, _, _, future in batch:
+                future.set_exception(e)
+            return
+        self._settle(outcomes)
+
+    def _settle(self, outcomes):
+        self.batches += 1
+        for future, result, error in outcomes:
+            self.writes += 1
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+write_queue = WriteBehindQueue(default_engine)